@@ -0,0 +1,131 @@
+import csv
+import datetime
+import io
+from typing import Iterable, Iterator, Optional
+
+import orjson
+from sqlalchemy import DateTime, Select, String, TypeDecorator, literal, select
+
+from models import Base, GPSData, GPSRollup, Heartbeat, TomorrowIO
+
+# Tables that can be exported, and the column their time range filters on
+export_tables: dict[str, tuple[type[Base], str]] = {
+    'gps': (GPSData, 'utc_time'),
+    'tio': (TomorrowIO, 'utc_time'),
+    'heartbeat': (Heartbeat, 'time_utc'),
+}
+# The vehicle can also export the downsampled history compaction leaves behind, which is never uploaded
+local_export_tables: dict[str, tuple[type[Base], str]] = {
+    **export_tables,
+    'gps_rollup': (GPSRollup, 'utc_time'),
+}
+
+# Format -> media type. columnar is one {"headers": [...], "columns": [[...], ...]} json object per chunk,
+# the same shape the van uploads with, so each line loads straight into a dataframe
+export_formats = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'columnar': 'application/vnd.vls.columnar+ndjson',
+}
+
+# Rows fetched from the database cursor (and encoded) at a time, memory use is bounded by this, not the export
+chunk_rows = 2000
+
+
+class ExportRequestError(ValueError):
+    pass
+
+
+class StoredTime(TypeDecorator):
+    """
+    A time range bound written the way the column is stored. SQLite compares datetimes as text and
+    CURRENT_TIMESTAMP stores them without the .000000 SQLAlchemy would bind, so a row exactly at
+    the bound would sort before it. Other databases compare real datetimes and get it as is.
+    """
+    impl = DateTime
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'sqlite':
+            return dialect.type_descriptor(String())
+        return dialect.type_descriptor(DateTime())
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and dialect.name == 'sqlite':
+            return value.isoformat(sep=' ', timespec='microseconds' if value.microsecond else 'seconds')
+        return value
+
+
+def parse_time(value: Optional[str]) -> Optional[datetime.datetime]:
+    """Parses an iso format time range bound, times are naive utc like the database"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError as e:
+        raise ExportRequestError(f'Invalid time "{value}", expected iso format') from e
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def export_statement(table_name: str, fmt: str,
+                     start: Optional[str] = None,
+                     end: Optional[str] = None,
+                     vehicle_id: Optional[int] = None,
+                     tables: dict[str, tuple[type[Base], str]] = export_tables) -> tuple[list[str], Select]:
+    """
+    Builds the export query for a table, rows with start <= time < end in time order
+    (so it walks the time index), optionally only one vehicle's rows. Returns the column names and the query.
+    """
+    if table_name not in tables:
+        raise ExportRequestError(f'Can not export "{table_name}", expected one of {list(tables)}')
+    if fmt not in export_formats:
+        raise ExportRequestError(f'Unknown export format "{fmt}", expected one of {list(export_formats)}')
+
+    model, time_field = tables[table_name]
+    table = model.__table__
+    time_column = table.columns[time_field]
+
+    statement = select(table).order_by(time_column, table.columns['id'])
+    if start:
+        statement = statement.where(time_column >= literal(parse_time(start), StoredTime()))
+    if end:
+        statement = statement.where(time_column < literal(parse_time(end), StoredTime()))
+    if vehicle_id is not None:
+        statement = statement.where(table.columns['vehicle_id'] == vehicle_id)
+
+    # Ask the driver for a server side cursor and hand rows over in chunks instead of buffering the result
+    statement = statement.execution_options(stream_results=True, yield_per=chunk_rows)
+    return table.columns.keys(), statement
+
+
+def encode_export(fmt: str, columns: list[str], chunks: Iterable[list]) -> Iterator[bytes]:
+    """Encodes chunks of rows into the export format, one piece of the response body per chunk"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield buffer.getvalue().encode()
+        for chunk in chunks:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(chunk)
+            yield buffer.getvalue().encode()
+
+    elif fmt == 'ndjson':
+        for chunk in chunks:
+            yield b''.join(orjson.dumps(dict(zip(columns, row))) + b'\n' for row in chunk)
+
+    elif fmt == 'columnar':
+        for chunk in chunks:
+            yield orjson.dumps({'headers': columns, 'columns': [list(column) for column in zip(*chunk)]}) + b'\n'
+
+    else:
+        raise ExportRequestError(f'Unknown export format "{fmt}", expected one of {list(export_formats)}')
+
+
+def export_filename(table_name: str, fmt: str, start: Optional[str] = None, end: Optional[str] = None) -> str:
+    extension = {'csv': 'csv', 'ndjson': 'ndjson', 'columnar': 'columnar.ndjson'}[fmt]
+    span = '_'.join(bound[:10] for bound in (start, end) if bound)
+    return f'{table_name}{"_" + span if span else ""}.{extension}'
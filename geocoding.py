@@ -0,0 +1,238 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+geohash_alphabet = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash(latitude: float, longitude: float, precision: int = 7) -> str:
+    """Standard geohash of a point, nearby points share a prefix (precision 5 is ~5km, 7 is ~150m)"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    code, bits, bit_count, even = [], 0, 0, True
+    while len(code) < precision:
+        # Bits alternate between splitting longitude and latitude in half
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            bounds[0] = middle
+        else:
+            bits = bits * 2
+            bounds[1] = middle
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            code.append(geohash_alphabet[bits])
+            bits, bit_count = 0, 0
+    return ''.join(code)
+
+
+def geohash_precision(zoom: int) -> int:
+    """How fine a cache cell should be for a Nominatim zoom level, city names don't need 150m cells"""
+    if zoom <= 10:
+        return 5
+    if zoom <= 14:
+        return 6
+    return 7
+
+
+class NominatimGeocoder:
+    """
+    Reverse geocodes through OpenStreetMap's Nominatim, which asks for no more than one request a second,
+    so requests from every thread are spaced at least min_interval seconds apart.
+    """
+
+    def __init__(self, user_agent: str = 'VanLifeSmart', timeout: float = 3, min_interval: float = 1.0):
+        from geopy.geocoders import Nominatim
+        self.client = Nominatim(user_agent=user_agent, timeout=timeout)
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._last_request = 0.0
+
+    def reverse(self, latitude: float, longitude: float, zoom: int) -> Optional[str]:
+        with self._lock:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                location = self.client.reverse((latitude, longitude), zoom=zoom)
+            finally:
+                self._last_request = time.monotonic()
+        return location.address if location else None
+
+
+class StubGeocoder:
+    """Offline stand-in for tests and development, names a point after its rounded coordinates"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def reverse(self, latitude: float, longitude: float, zoom: int) -> Optional[str]:
+        self.calls += 1
+        return f'Near {latitude:.3f}, {longitude:.3f}'
+
+
+class LocationNamer:
+    """
+    Cached reverse geocoding shared by the van and the website. Names are cached per geohash cell
+    (sized by zoom) in an in-memory LRU in front of a small sqlite file, so a location is only ever
+    looked up once. Lookups that miss can be handed to a background thread instead of blocking a page.
+    """
+
+    def __init__(self, geocoder, path: Optional[str] = None, memory_size: int = 1024, queue_size: int = 256):
+        self.geocoder = geocoder
+        self.memory_size = memory_size
+        self._memory: OrderedDict[tuple[str, int], str] = OrderedDict()
+        self._lock = threading.Lock()
+
+        # The disk cache is optional, without a path names only live as long as the process
+        self._database: Optional[sqlite3.Connection] = None
+        if path:
+            self._database = sqlite3.connect(path, check_same_thread=False)
+            self._database.execute('CREATE TABLE IF NOT EXISTS geocode ('
+                                   'geohash TEXT NOT NULL, zoom INTEGER NOT NULL, name TEXT NOT NULL, '
+                                   'fetched REAL NOT NULL, PRIMARY KEY (geohash, zoom))')
+            self._database.commit()
+
+        # Background lookups, anything past queue_size is dropped and asked for again on the next miss
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._queued: set[tuple[str, int]] = set()
+        self._worker: Optional[threading.Thread] = None
+
+    def _cached(self, key: tuple[str, int]) -> Optional[str]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+            if self._database is None:
+                return None
+            row = self._database.execute('SELECT name FROM geocode WHERE geohash = ? AND zoom = ?', key).fetchone()
+        if row is not None:
+            self._remember(key, row[0], persist=False)
+            return row[0]
+        return None
+
+    def _remember(self, key: tuple[str, int], name: str, persist: bool = True):
+        with self._lock:
+            self._memory[key] = name
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+            if persist and self._database is not None:
+                self._database.execute('INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?)',
+                                       (*key, name, time.time()))
+                self._database.commit()
+
+    def _fetch(self, latitude: float, longitude: float, zoom: int, key: tuple[str, int]) -> Optional[str]:
+        from geopy.exc import GeopyError
+        try:
+            # Places without a name (open water) are cached as '' so we don't keep asking
+            name = self.geocoder.reverse(latitude, longitude, zoom) or ''
+        except GeopyError as e:
+            logger.warning(f'Reverse geocoding {latitude}, {longitude} failed: {e!r}')
+            return None
+        self._remember(key, name)
+        return name
+
+    def name(self, latitude: float, longitude: float, zoom: int = 18, wait: bool = True) -> str:
+        """
+        Returns the name of a location, falling back to its coordinates if it has no name or can't be looked up.
+        With wait=False a cache miss returns the coordinates right away and is looked up in the background.
+        """
+        fallback = f'{latitude}, {longitude}'
+        key = (geohash(latitude, longitude, geohash_precision(zoom)), zoom)
+
+        name = self._cached(key)
+        if name is None:
+            if not wait:
+                self.prefetch([(latitude, longitude)], zoom)
+                return fallback
+            name = self._fetch(latitude, longitude, zoom, key)
+
+        return name or fallback
+
+    def prefetch(self, points: Iterable[tuple[float, float]], zoom: int = 18):
+        """Queues uncached points to be looked up in the background, one per cache cell"""
+        for latitude, longitude in points:
+            key = (geohash(latitude, longitude, geohash_precision(zoom)), zoom)
+            if self._cached(key) is not None:
+                continue
+
+            with self._lock:
+                if key in self._queued:
+                    continue
+                self._queued.add(key)
+            try:
+                self._queue.put_nowait((latitude, longitude, zoom, key))
+            except queue.Full:
+                with self._lock:
+                    self._queued.discard(key)
+                break
+
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._prefetch_worker, name='geocode-prefetch', daemon=True)
+                self._worker.start()
+
+    def _prefetch_worker(self):
+        # The geocoder does its own rate limiting, so this just works through the queue
+        while True:
+            try:
+                latitude, longitude, zoom, key = self._queue.get(timeout=30)
+            except queue.Empty:
+                # Idle for a while, let the thread go (prefetch starts a new one when there's more work)
+                with self._lock:
+                    if self._queue.empty():
+                        self._worker = None
+                        return
+                continue
+            try:
+                if self._cached(key) is None:
+                    self._fetch(latitude, longitude, zoom, key)
+            except Exception:
+                logger.exception(f'Background geocoding of {latitude}, {longitude} failed')
+            finally:
+                with self._lock:
+                    self._queued.discard(key)
+                self._queue.task_done()
+
+    def join(self):
+        """Waits for queued background lookups to finish"""
+        self._queue.join()
+
+
+_namer: Optional[LocationNamer] = None
+_namer_lock = threading.Lock()
+
+
+def get_location_namer() -> LocationNamer:
+    """
+    The process wide LocationNamer. VLS_GEOCODER picks the backend ('nominatim' or 'stub'),
+    the cache lives at VLS_GEOCODE_CACHE, else $VLS_DATA_PATH/geocode.db, else only in memory.
+    """
+    global _namer
+    with _namer_lock:
+        if _namer is None:
+            backend = os.getenv('VLS_GEOCODER', 'nominatim')
+            if backend == 'stub':
+                geocoder = StubGeocoder()
+            elif backend == 'nominatim':
+                geocoder = NominatimGeocoder()
+            else:
+                raise ValueError(f'Unknown geocoder "{backend}", expected "nominatim" or "stub"')
+
+            path = os.getenv('VLS_GEOCODE_CACHE')
+            if not path and os.getenv('VLS_DATA_PATH'):
+                path = f'{os.getenv("VLS_DATA_PATH")}/geocode.db'
+            _namer = LocationNamer(geocoder, path)
+        return _namer
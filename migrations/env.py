@@ -0,0 +1,61 @@
+import os
+from logging.config import fileConfig
+
+from alembic import context
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, pool
+
+from models import Base
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+# Load environment variables for the database location
+load_dotenv()
+
+
+def database_url() -> str:
+    """-x url=... wins, then the website's database, then the van's local database"""
+    url = context.get_x_argument(as_dictionary=True).get('url')
+    if url:
+        return url
+    if os.getenv('VLS_DATABASE_URI'):
+        return os.getenv('VLS_DATABASE_URI')
+    return f'sqlite:///{os.getenv("VLS_DATA_PATH")}/database.db'
+
+
+def run_migrations_offline():
+    context.configure(
+        url=database_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=True,
+        dialect_opts={'paramstyle': 'named'},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    connectable = create_engine(database_url(), poolclass=pool.NullPool)
+
+    with connectable.connect() as connection:
+        # SQLite can't ALTER constraints, batch mode rebuilds the table for it
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            render_as_batch=True,
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,57 @@
+"""Origin keys for idempotent heartbeat uploads
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-03-20 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'sync_watermark',
+        sa.Column('table_name', sa.String(40), primary_key=True),
+        sa.Column('last_id', sa.Integer(), nullable=False),
+        sa.Column('updated_utc', sa.DateTime(), nullable=True),
+    )
+
+    with op.batch_alter_table('gps') as batch_op:
+        batch_op.add_column(sa.Column('origin_id', sa.Integer(), nullable=True))
+        batch_op.create_unique_constraint('uq_gps_vehicle_id_origin_id', ['vehicle_id', 'origin_id'])
+
+    with op.batch_alter_table('heartbeat') as batch_op:
+        batch_op.add_column(sa.Column('origin_id', sa.Integer(), nullable=True))
+        batch_op.create_unique_constraint('uq_heartbeat_vehicle_id_origin_id', ['vehicle_id', 'origin_id'])
+
+    with op.batch_alter_table('tomorrow_io') as batch_op:
+        batch_op.add_column(sa.Column('vehicle_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('origin_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_tomorrow_io_vehicle_id', 'vehicle', ['vehicle_id'], ['id'])
+        batch_op.create_unique_constraint('uq_tomorrow_io_vehicle_id_origin_id', ['vehicle_id', 'origin_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('tomorrow_io') as batch_op:
+        batch_op.drop_constraint('uq_tomorrow_io_vehicle_id_origin_id', type_='unique')
+        batch_op.drop_constraint('fk_tomorrow_io_vehicle_id', type_='foreignkey')
+        batch_op.drop_column('origin_id')
+        batch_op.drop_column('vehicle_id')
+
+    with op.batch_alter_table('heartbeat') as batch_op:
+        batch_op.drop_constraint('uq_heartbeat_vehicle_id_origin_id', type_='unique')
+        batch_op.drop_column('origin_id')
+
+    with op.batch_alter_table('gps') as batch_op:
+        batch_op.drop_constraint('uq_gps_vehicle_id_origin_id', type_='unique')
+        batch_op.drop_column('origin_id')
+
+    op.drop_table('sync_watermark')
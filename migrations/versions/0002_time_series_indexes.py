@@ -0,0 +1,43 @@
+"""Time-series and foreign key indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-03-21 12:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+# (index name, table, columns), matching the declarations in models.py
+indexes = (
+    ('ix_gps_utc_time', 'gps', ['utc_time']),
+    ('ix_gps_vehicle_id_utc_time', 'gps', ['vehicle_id', 'utc_time']),
+    ('ix_tomorrow_io_utc_time', 'tomorrow_io', ['utc_time']),
+    ('ix_tomorrow_io_owner_id_utc_time', 'tomorrow_io', ['owner_id', 'utc_time']),
+    ('ix_tomorrow_io_gps_id', 'tomorrow_io', ['gps_id']),
+    ('ix_heartbeat_time_utc', 'heartbeat', ['time_utc']),
+    ('ix_heartbeat_vehicle_id_time_utc', 'heartbeat', ['vehicle_id', 'time_utc']),
+    ('ix_vehicle_owner_id', 'vehicle', ['owner_id']),
+    ('ix_role_vehicle_id', 'role', ['vehicle_id']),
+    ('ix_follow_user_id', 'follow', ['user_id']),
+    ('ix_follow_vehicle_id', 'follow', ['vehicle_id']),
+    ('ix_pitstop_vehicle_id', 'pitstop', ['vehicle_id']),
+    ('ix_vehicle_permission_owner_id', 'vehicle_permission', ['owner_id']),
+    ('ix_vehicle_permission_vehicle_id', 'vehicle_permission', ['vehicle_id']),
+)
+
+
+def upgrade():
+    for name, table, columns in indexes:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(indexes):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,35 @@
+"""Downsampled gps history on the vehicle
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-03-22 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'gps_rollup',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('utc_time', sa.DateTime(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.Column('altitude', sa.Float(), nullable=True),
+        sa.Column('ground_speed', sa.Float(), nullable=True),
+        sa.Column('samples', sa.Integer(), nullable=False),
+    )
+    op.create_index('ix_gps_rollup_utc_time', 'gps_rollup', ['utc_time'])
+
+
+def downgrade():
+    op.drop_index('ix_gps_rollup_utc_time', table_name='gps_rollup')
+    op.drop_table('gps_rollup')
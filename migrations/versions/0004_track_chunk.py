@@ -0,0 +1,49 @@
+"""Simplified vehicle tracks for the website's location page
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-03-28 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'track_chunk',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('vehicle_id', sa.Integer(), sa.ForeignKey('vehicle.id'), nullable=False),
+        sa.Column('level', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('stale', sa.Boolean(), nullable=False),
+        sa.Column('start_utc', sa.DateTime(), nullable=True),
+        sa.Column('end_utc', sa.DateTime(), nullable=True),
+        sa.Column('min_latitude', sa.Float(), nullable=True),
+        sa.Column('max_latitude', sa.Float(), nullable=True),
+        sa.Column('min_longitude', sa.Float(), nullable=True),
+        sa.Column('max_longitude', sa.Float(), nullable=True),
+        sa.Column('source_points', sa.Integer(), nullable=False),
+        sa.Column('points', sa.Integer(), nullable=False),
+        sa.Column('polyline', sa.Text(), nullable=False),
+        sa.UniqueConstraint('vehicle_id', 'level', 'day', name='uq_track_chunk_vehicle_id_level_day'),
+    )
+    op.create_table(
+        'track_build',
+        sa.Column('vehicle_id', sa.Integer(), sa.ForeignKey('vehicle.id'), primary_key=True),
+        sa.Column('updated_utc', sa.DateTime(), nullable=False),
+        sa.Column('built_until', sa.DateTime(), nullable=True),
+        sa.Column('finished_utc', sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table('track_build')
+    op.drop_table('track_chunk')
@@ -0,0 +1,38 @@
+"""Maintained row counts and daily ingest of the van's local tables
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-03-28 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Left empty, the hub counts each table once at startup (van/stats.py build_stats)
+    op.create_table(
+        'table_stats',
+        sa.Column('table_name', sa.String(40), primary_key=True),
+        sa.Column('row_count', sa.Integer(), nullable=False),
+        sa.Column('first_utc', sa.DateTime(), nullable=True),
+        sa.Column('last_utc', sa.DateTime(), nullable=True),
+    )
+    op.create_table(
+        'table_ingest',
+        sa.Column('table_name', sa.String(40), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('rows', sa.Integer(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('table_ingest')
+    op.drop_table('table_stats')
@@ -5,7 +5,7 @@ from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 import time
 from sqlalchemy.types import TypeDecorator, DECIMAL
 import datetime
-from sqlalchemy import func, create_engine, ForeignKey, String, Column, Table
+from sqlalchemy import func, create_engine, ForeignKey, String, Text, Column, Table, UniqueConstraint, Index
 from sqlalchemy import DOUBLE
 from flask_login import UserMixin
 
@@ -31,10 +31,45 @@ class LocalTable:
     pass
 
 
+class SyncWatermark(Base, LocalTable):
+    """
+    This class tracks (per table) the highest row id the
+    website has acknowledged receiving from this vehicle.
+    """
+    __tablename__ = 'sync_watermark'
+    table_name: Mapped[str] = mapped_column(String(40), primary_key=True)
+
+    # Highest id the website has confirmed, rows above this still need to upload
+    last_id: Mapped[int] = mapped_column(default=0)
+    updated_utc: Mapped[Optional[datetime.datetime]]
+
+
+class TableStats(Base, LocalTable):
+    """
+    Running row count and time span of a local table, kept up to date by the
+    code that writes and compacts it so the dashboard never has to COUNT(*).
+    """
+    __tablename__ = 'table_stats'
+    table_name: Mapped[str] = mapped_column(String(40), primary_key=True)
+
+    row_count: Mapped[int] = mapped_column(default=0)
+    first_utc: Mapped[Optional[datetime.datetime]]
+    last_utc: Mapped[Optional[datetime.datetime]]
+
+
+class TableIngest(Base, LocalTable):
+    """Rows written to a local table per (utc) day"""
+    __tablename__ = 'table_ingest'
+    table_name: Mapped[str] = mapped_column(String(40), primary_key=True)
+    day: Mapped[datetime.date] = mapped_column(primary_key=True)
+
+    rows: Mapped[int] = mapped_column(default=0)
+
+
 class Role(Base):
     __tablename__ = 'role'
     id: Mapped[int] = mapped_column(primary_key=True)
-    vehicle_id: Mapped[int] = mapped_column(ForeignKey('vehicle.id'))
+    vehicle_id: Mapped[int] = mapped_column(ForeignKey('vehicle.id'), index=True)
     name: Mapped[str] = mapped_column(String(40))
 
     view_location: Mapped[bool]
@@ -48,9 +83,9 @@ class Role(Base):
 class Follow(Base):
     __tablename__ = 'follow'
     id: Mapped[int] = mapped_column(primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey('user.id'))
+    user_id: Mapped[int] = mapped_column(ForeignKey('user.id'), index=True)
     user: Mapped[List['User']] = relationship(back_populates='follows')
-    vehicle_id: Mapped[int] = mapped_column(ForeignKey('vehicle.id'))
+    vehicle_id: Mapped[int] = mapped_column(ForeignKey('vehicle.id'), index=True)
     vehicle: Mapped['Vehicle'] = relationship(back_populates='follows')
     role_id: Mapped[Optional['Role']] = mapped_column(ForeignKey('role.id'))
     role: Mapped['Role'] = relationship()
@@ -62,7 +97,7 @@ class Vehicle(Base):
     last_heartbeat: Mapped[datetime.datetime] = mapped_column(server_default=func.now())
     next_expected_heartbeat: Mapped[Optional[datetime.datetime]]
     name: Mapped[str] = mapped_column(String(36))
-    owner_id: Mapped[int] = mapped_column(ForeignKey('user.id'))
+    owner_id: Mapped[int] = mapped_column(ForeignKey('user.id'), index=True)
     owner: Mapped['User'] = relationship(back_populates='vehicles')
 
     roles: Mapped[List['Role']] = relationship()
@@ -94,7 +129,7 @@ class Pitstop(Base):
     __tablename__ = 'pitstop'
     id: Mapped[int] = mapped_column(primary_key=True)
     date: Mapped[datetime.datetime] = mapped_column(server_default=func.now())
-    vehicle_id: Mapped[Optional[int]] = mapped_column(ForeignKey('vehicle.id'))
+    vehicle_id: Mapped[Optional[int]] = mapped_column(ForeignKey('vehicle.id'), index=True)
     vehicle: Mapped[Optional['Vehicle']] = relationship(back_populates='pitstops')
 
     gallons_filled: Mapped[float]
@@ -106,10 +141,10 @@ class VehiclePermission(Base):
     __tablename__ = 'vehicle_permission'
     id: Mapped[int] = mapped_column(primary_key=True)
 
-    owner_id: Mapped[int] = mapped_column(ForeignKey('user.id'))
+    owner_id: Mapped[int] = mapped_column(ForeignKey('user.id'), index=True)
     owner: Mapped['User'] = relationship(back_populates='vehicle_permissions')
 
-    vehicle_id: Mapped[int] = mapped_column(ForeignKey('vehicle.id'))
+    vehicle_id: Mapped[int] = mapped_column(ForeignKey('vehicle.id'), index=True)
     vehicle: Mapped['Vehicle'] = relationship(back_populates='permissions')
 
 
@@ -123,11 +158,18 @@ class Heartbeat(Base):
     """
     # ID identifier and table name
     __tablename__ = 'heartbeat'
+    __table_args__ = (
+        UniqueConstraint('vehicle_id', 'origin_id', name='uq_heartbeat_vehicle_id_origin_id'),
+        # "Latest heartbeat of this vehicle" lookups
+        Index('ix_heartbeat_vehicle_id_time_utc', 'vehicle_id', 'time_utc'),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     
     # Vehicle this heartbeat belongs to
     vehicle_id: Mapped[Optional[int]] = mapped_column(ForeignKey('vehicle.id'))
     vehicle: Mapped[Optional['Vehicle']] = relationship(back_populates='heartbeats')
+    # The id this row had in the vehicle's local database (None on the vehicle itself)
+    origin_id: Mapped[Optional[int]]
 
     # If this was expected/on schedule or late
     on_schedule: Mapped[bool]
@@ -137,7 +179,7 @@ class Heartbeat(Base):
     internet: Mapped[bool]
 
     # Time of connection and next expected
-    time_utc: Mapped[datetime.datetime]
+    time_utc: Mapped[datetime.datetime] = mapped_column(index=True)
     next_time: Mapped[datetime.datetime]
     
 
@@ -161,14 +203,21 @@ class DHTData(Base):
 
 class GPSData(Base, LocalTable):
     __tablename__ = 'gps'
+    __table_args__ = (
+        UniqueConstraint('vehicle_id', 'origin_id', name='uq_gps_vehicle_id_origin_id'),
+        # "Latest point of this vehicle" and track-by-time lookups
+        Index('ix_gps_vehicle_id_utc_time', 'vehicle_id', 'utc_time'),
+    )
 
     # Key for this GPS data point
     id: Mapped[int] = mapped_column(primary_key=True)
-    # Time of recording
-    utc_time: Mapped[datetime.datetime] = mapped_column(server_default=func.now())
+    # Time of recording (indexed alone too, the van's local table has no vehicle_id)
+    utc_time: Mapped[datetime.datetime] = mapped_column(server_default=func.now(), index=True)
     # Owner
     vehicle_id: Mapped[Optional[int]] = mapped_column(ForeignKey('vehicle.id'))
     vehicle: Mapped[Optional["Vehicle"]] = relationship(back_populates="gps_data")
+    # The id this row had in the vehicle's local database (None on the vehicle itself)
+    origin_id: Mapped[Optional[int]]
 
     # Location information
     latitude: Mapped[float]
@@ -190,21 +239,95 @@ class GPSData(Base, LocalTable):
     tomorrow_io: Mapped['TomorrowIO'] = relationship(back_populates='gps_data')
 
 
+class GPSRollup(Base, LocalTable):
+    """
+    Downsampled GPS history on the vehicle, one row per time bucket
+    averaged from the full resolution points the compaction job removed.
+    """
+    __tablename__ = 'gps_rollup'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # Start of the bucket this row summarizes
+    utc_time: Mapped[datetime.datetime] = mapped_column(index=True)
+
+    # Averaged location and speed over the bucket
+    latitude: Mapped[float]
+    longitude: Mapped[float]
+    altitude: Mapped[Optional[float]]
+    ground_speed: Mapped[Optional[float]]
+
+    # How many points were folded into this row
+    samples: Mapped[int]
+
+
+class TrackChunk(Base):
+    """
+    One utc day of a vehicle's GPS track simplified for one map zoom level and stored
+    as an encoded polyline, so the location page never loads raw points (see website/tracks.py).
+    """
+    __tablename__ = 'track_chunk'
+    __table_args__ = (
+        # Chunks of a vehicle at a level, in time order
+        UniqueConstraint('vehicle_id', 'level', 'day', name='uq_track_chunk_vehicle_id_level_day'),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    vehicle_id: Mapped[int] = mapped_column(ForeignKey('vehicle.id'))
+    level: Mapped[int]
+    day: Mapped[datetime.date]
+
+    # Set when new points arrive for the day, the chunk is rebuilt the next time it's read
+    stale: Mapped[bool] = mapped_column(default=True)
+
+    # Time span and bounding box of the day's points, for range and viewport lookups
+    start_utc: Mapped[Optional[datetime.datetime]]
+    end_utc: Mapped[Optional[datetime.datetime]]
+    min_latitude: Mapped[Optional[float]]
+    max_latitude: Mapped[Optional[float]]
+    min_longitude: Mapped[Optional[float]]
+    max_longitude: Mapped[Optional[float]]
+
+    # Points in the day and how many were kept
+    source_points: Mapped[int] = mapped_column(default=0)
+    points: Mapped[int] = mapped_column(default=0)
+    polyline: Mapped[str] = mapped_column(Text, default='')
+
+
+class TrackBuild(Base):
+    """Progress of building a vehicle's whole track_chunk history, which runs in the background"""
+    __tablename__ = 'track_build'
+
+    vehicle_id: Mapped[int] = mapped_column(ForeignKey('vehicle.id'), primary_key=True)
+    # Bumped as the build makes progress, a build that stops updating is taken over by the next request
+    updated_utc: Mapped[datetime.datetime]
+    # Every day before this is built, a restarted build picks up here
+    built_until: Mapped[Optional[datetime.datetime]]
+    finished_utc: Mapped[Optional[datetime.datetime]]
+
+
 class TomorrowIO(Base):
     """TomorrowIO API Data"""
     __tablename__ = 'tomorrow_io'
+    __table_args__ = (
+        UniqueConstraint('vehicle_id', 'origin_id', name='uq_tomorrow_io_vehicle_id_origin_id'),
+        # The website looks weather up by owner
+        Index('ix_tomorrow_io_owner_id_utc_time', 'owner_id', 'utc_time'),
+    )
 
     # id
     id: Mapped[int] = mapped_column(primary_key=True)
     # Owner
     owner_id: Mapped[Optional[int]] = mapped_column(ForeignKey('user.id'))
     owner: Mapped[Optional["User"]] = relationship(back_populates="tio_data")
+    # Vehicle that uploaded this and the id it had in the vehicle's local database
+    vehicle_id: Mapped[Optional[int]] = mapped_column(ForeignKey('vehicle.id'))
+    origin_id: Mapped[Optional[int]]
 
-    utc_time: Mapped[datetime.datetime] = mapped_column(server_default=func.now())
+    utc_time: Mapped[datetime.datetime] = mapped_column(server_default=func.now(), index=True)
 
     invalid: Mapped[bool]
 
-    gps_id: Mapped[int] = mapped_column(ForeignKey("gps.id"))
+    gps_id: Mapped[int] = mapped_column(ForeignKey("gps.id"), index=True)
     gps_data: Mapped["GPSData"] = relationship(back_populates="tomorrow_io")
     cloud_base: Mapped[Optional[float]]
     cloud_ceiling: Mapped[Optional[float]]
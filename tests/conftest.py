@@ -0,0 +1,28 @@
+import os
+import tempfile
+
+import pytest
+
+import geocoding
+from models import User, Vehicle
+
+# The van's modules open $VLS_DATA_PATH/database.db as they're imported, keep the tests out of the real one
+os.environ['VLS_DATA_PATH'] = tempfile.mkdtemp(prefix='vls-tests-')
+
+
+@pytest.fixture
+def website(tmp_path, monkeypatch):
+    """The website on its own sqlite file, with one user (a@b.c) owning one vehicle (van) and an offline geocoder"""
+    monkeypatch.setenv('VLS_DATABASE_URI', f'sqlite:///{tmp_path}/website.db')
+    monkeypatch.setattr(geocoding, '_namer', geocoding.LocationNamer(geocoding.StubGeocoder()))
+    from website.database import db
+    from website.website import create_app
+
+    application = create_app()
+    with application.app_context():
+        user = User(email='a@b.c', username='a', password='')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Vehicle(name='van', owner_id=user.id))
+        db.session.commit()
+    return application
@@ -0,0 +1,26 @@
+import pytest
+
+from van.sync.cadence import HeartbeatCadence
+
+
+def test_backs_off_to_the_cap_and_snaps_back():
+    cadence = HeartbeatCadence(fast_seconds=30, max_seconds=600, jitter=0)
+    assert cadence.online and cadence.interval == 30
+
+    assert [cadence.failed() for _ in range(7)] == [60, 120, 240, 480, 600, 600, 600]
+    assert not cadence.online and cadence.failures == 7
+
+    # The first success after being offline reports the reconnect, later ones don't
+    assert cadence.succeeded()
+    assert cadence.interval == 30 and cadence.online
+    assert not cadence.succeeded()
+
+    # And the backoff starts over
+    assert cadence.failed() == 60
+
+
+def test_jitter_stays_within_bounds():
+    cadence = HeartbeatCadence(fast_seconds=30, max_seconds=600, jitter=0.1)
+    for failures in range(1, 12):
+        expected = min(30 * 2 ** failures, 600)
+        assert cadence.failed() == pytest.approx(expected, rel=0.1)
@@ -0,0 +1,75 @@
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from models import Base, GPSData, GPSRollup, Heartbeat, SyncWatermark, TomorrowIO
+from van.scheduling.compaction import compact
+from van.stats import build_stats, read_stats
+
+
+def gps_at(utc_time: datetime.datetime, latitude: float = 45.0) -> GPSData:
+    return GPSData(utc_time=utc_time, latitude=latitude, longitude=-120.0, altitude=10.0, fix_quality='1',
+                   satellites_used=5, hdop=1.0, ground_speed=2.0)
+
+
+def heartbeat_at(time_utc: datetime.datetime) -> Heartbeat:
+    return Heartbeat(on_schedule=True, server=True, internet=True, time_utc=time_utc, next_time=time_utc)
+
+
+def test_old_acknowledged_rows_are_rolled_up(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/van.db')
+    Base.metadata.create_all(engine)
+
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    old = (now - datetime.timedelta(days=10)).replace(second=0, microsecond=0)
+    recent = now - datetime.timedelta(days=1)
+    with Session(engine) as session:
+        # Two minutes of old points: four in the first, two in the second
+        session.add_all([gps_at(old + datetime.timedelta(seconds=second), latitude=44.0 + second)
+                         for second in range(4)])
+        session.add_all([gps_at(old + datetime.timedelta(seconds=60 + second)) for second in range(2)])
+        # Old but a weather reading points at it
+        session.add(TomorrowIO(invalid=False, utc_time=old, gps_data=gps_at(old)))
+        session.add_all([gps_at(recent) for _ in range(2)])
+        session.add_all([heartbeat_at(old), heartbeat_at(recent)])
+        session.flush()
+        # Everything so far has been uploaded, this last old point hasn't
+        session.add_all([SyncWatermark(table_name='gps', last_id=9), SyncWatermark(table_name='heartbeat', last_id=2)])
+        session.add(gps_at(old + datetime.timedelta(seconds=120)))
+        session.commit()
+    build_stats(engine)
+
+    assert compact(engine, keep=datetime.timedelta(days=7)) == {'gps': 6, 'heartbeat': 1}
+
+    with Session(engine) as session:
+        rollups = session.scalars(select(GPSRollup).order_by(GPSRollup.utc_time)).all()
+        assert [(rollup.utc_time, rollup.samples) for rollup in rollups] == \
+               [(old, 4), (old + datetime.timedelta(seconds=60), 2)]
+        assert rollups[0].latitude == pytest.approx(45.5)
+        assert rollups[0].altitude == pytest.approx(10.0)
+
+        # The referenced, unacknowledged and recent points are still there, as is the recent heartbeat
+        remaining = session.scalars(select(GPSData.utc_time).order_by(GPSData.id)).all()
+        assert remaining == [old, recent, recent, old + datetime.timedelta(seconds=120)]
+        assert session.scalars(select(Heartbeat.time_utc)).all() == [recent]
+
+        # And the statistics kept up
+        stats = read_stats(session)
+        for name, model in (('gps', GPSData), ('heartbeat', Heartbeat), ('gps_rollup', GPSRollup)):
+            assert stats[name]['rows'] == session.scalar(select(func.count()).select_from(model))
+
+
+def test_nothing_to_compact(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/van.db')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(gps_at(datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)))
+        session.add(SyncWatermark(table_name='gps', last_id=1))
+        session.commit()
+
+    assert compact(engine) == {'gps': 0, 'heartbeat': 0}
+    with Session(engine) as session:
+        assert session.scalar(select(func.count()).select_from(GPSData)) == 1
+        assert session.scalar(select(func.count()).select_from(GPSRollup)) == 0
@@ -0,0 +1,73 @@
+import orjson
+import pytest
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from models import GPSData
+from van.console import run_console_query
+from van.database import engine
+
+
+@pytest.fixture(autouse=True)
+def gps_rows():
+    with Session(engine) as session:
+        session.execute(delete(GPSData))
+        session.execute(insert(GPSData), [{'latitude': 45.0, 'longitude': -120.0, 'altitude': 0.0,
+                                           'fix_quality': '1', 'satellites_used': 5, 'hdop': 1.0}] * 10)
+        session.commit()
+
+
+def run(sql: str, **kwargs) -> list[dict]:
+    return [orjson.loads(line) for line in run_console_query(sql, **kwargs)]
+
+
+def gps_count() -> int:
+    with Session(engine) as session:
+        return session.scalar(select(func.count()).select_from(GPSData))
+
+
+@pytest.mark.parametrize('sql', [
+    'DELETE FROM gps',
+    "INSERT INTO gps (latitude, longitude, fix_quality, satellites_used, hdop) VALUES (1, 2, '1', 3, 4)",
+    'UPDATE gps SET latitude = 0',
+    'DROP TABLE gps',
+])
+def test_writes_fail(sql):
+    assert run(sql)[-1]['error']
+    assert gps_count() == 10
+
+
+@pytest.mark.parametrize('sql', [
+    "ATTACH DATABASE ':memory:' AS other",
+    'PRAGMA query_only = OFF',
+    'PRAGMA journal_mode = DELETE',
+])
+def test_attach_and_pragma_assignment_are_refused(sql):
+    assert 'not authorized' in run(sql)[-1]['error']
+
+
+def test_introspection_pragmas_are_allowed():
+    lines = run('PRAGMA table_info(gps)')
+    assert lines[-1]['error'] is None
+    assert 'latitude' in [row[1] for line in lines if 'rows' in line for row in line['rows']]
+
+
+def test_plan_headings_rows_then_summary():
+    lines = run('SELECT id, latitude FROM gps ORDER BY id')
+    assert 'plan' in lines[0]
+    assert lines[1] == {'headings': ['id', 'latitude']}
+    assert [row[0] for line in lines[2:-1] for row in line['rows']] == list(range(1, 11))
+    assert lines[-1]['rows_total'] == 10 and lines[-1]['truncated'] is False
+
+
+def test_max_rows_truncates():
+    summary = run('SELECT * FROM gps', max_rows=3)[-1]
+    assert summary['rows_total'] == 3
+    assert summary['truncated'] is True
+
+
+def test_runaway_query_times_out():
+    summary = run('WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c',
+                  timeout=0.2)[-1]
+    assert summary['error'] == 'Query took longer than 0.2 seconds'
+    assert summary['time'] < 2
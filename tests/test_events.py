@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+import orjson
+
+from van import events
+from van.events import EventBus
+
+
+def received(queue: asyncio.Queue) -> list[dict]:
+    messages = []
+    while not queue.empty():
+        messages.append(orjson.loads(queue.get_nowait()))
+    return messages
+
+
+def test_events_only_reach_their_topics_subscribers():
+    async def scenario():
+        bus = EventBus()
+        gps, weather = bus.subscribe(['gps']), bus.subscribe(['weather', 'gps'])
+        bus.publish('gps', {'latitude': 45.0})
+        bus.publish('weather', {'temperature': 20})
+
+        message, = received(gps)
+        assert message['data'] == {'latitude': 45.0}
+        assert message['time'].endswith('+00:00')
+        assert [message['topic'] for message in received(weather)] == ['gps', 'weather']
+
+        # Topics can be changed on the fly, and unsubscribed queues get nothing
+        bus.update(gps, add=['heartbeat'], remove=['gps'])
+        bus.unsubscribe(weather)
+        bus.publish('gps', {})
+        bus.publish('heartbeat', {'server': True})
+        assert [message['topic'] for message in received(gps)] == ['heartbeat']
+        assert received(weather) == []
+
+    asyncio.run(scenario())
+
+
+def test_publishing_from_worker_threads():
+    async def scenario():
+        bus = EventBus()
+        queue = bus.subscribe(['scheduler'])
+        workers = [threading.Thread(target=bus.publish, args=('scheduler', {'job': job})) for job in range(5)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        # Handed over to the loop, so they arrive once it gets a turn
+        messages = [orjson.loads(await asyncio.wait_for(queue.get(), 1)) for _ in range(5)]
+        assert sorted(message['data']['job'] for message in messages) == list(range(5))
+
+    asyncio.run(scenario())
+
+
+def test_publishing_without_subscribers_does_nothing(monkeypatch):
+    def encode_event(topic, data):
+        raise AssertionError(f'{topic} event encoded with nobody listening')
+    monkeypatch.setattr(events, 'encode_event', encode_event)
+
+    bus = EventBus()
+    bus.publish('gps', {})  # Before anyone ever subscribed
+
+    async def scenario():
+        bus.subscribe(['weather'])
+        bus.publish('gps', {})
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_loses_oldest_events():
+    async def scenario():
+        bus = EventBus(queue_size=2)
+        queue = bus.subscribe(['gps'])
+        for number in range(4):
+            bus.publish('gps', {'number': number})
+        assert [message['data']['number'] for message in received(queue)] == [2, 3]
+
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+import datetime
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session
+
+from export import export_statement
+from models import Base, GPSData
+
+
+def gps_row(utc_time: datetime.datetime) -> dict:
+    return {'utc_time': utc_time, 'latitude': 45.0, 'longitude': -120.0, 'altitude': 0.0,
+            'fix_quality': '1', 'satellites_used': 5, 'hdop': 1.0}
+
+
+def exported_ids(session: Session, start: str, end: str) -> list[int]:
+    columns, statement = export_statement('gps', 'csv', start=start, end=end)
+    return sorted(row[columns.index('id')] for row in session.execute(statement))
+
+
+def test_time_range_includes_rows_at_start():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.execute(insert(GPSData), [gps_row(datetime.datetime(2026, 1, 1, 0, 0, 0)),
+                                          gps_row(datetime.datetime(2026, 1, 1, 0, 0, 0, 500000)),
+                                          gps_row(datetime.datetime(2026, 1, 2, 0, 0, 0))])
+        # Stored the way CURRENT_TIMESTAMP does it, without the fraction
+        session.execute(text("INSERT INTO gps (utc_time, latitude, longitude, altitude, fix_quality, "
+                             "satellites_used, hdop) VALUES ('2026-01-01 00:00:00', 45, -120, 0, '1', 5, 1)"))
+        session.commit()
+
+        assert exported_ids(session, '2026-01-01T00:00:00', '2026-01-02T00:00:00') == [1, 2, 4]
+        assert exported_ids(session, '2026-01-01T00:00:00.5', '2026-01-02T00:00:00') == [2]
+        assert exported_ids(session, '2025-12-31T00:00:00', '2026-01-01T00:00:00') == []
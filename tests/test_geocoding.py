@@ -0,0 +1,84 @@
+import threading
+from types import SimpleNamespace
+
+import geopy.geocoders
+import pytest
+from geopy.exc import GeocoderTimedOut
+
+from geocoding import LocationNamer, NominatimGeocoder, geohash
+
+
+class FakeNominatim:
+    """Stands in for geopy's Nominatim client, records every lookup"""
+
+    def __init__(self, user_agent, timeout):
+        self.calls = []
+        self.names = {}  # (latitude, longitude) -> address, anything else gets a made up one
+        self.fail = False
+        self.release = threading.Event()
+        self.release.set()
+
+    def reverse(self, point, zoom):
+        self.release.wait(5)
+        self.calls.append(point)
+        if self.fail:
+            raise GeocoderTimedOut('timed out')
+        address = self.names.get(point, f'Place at {point[0]}, {point[1]}')
+        return SimpleNamespace(address=address) if address else None
+
+
+@pytest.fixture
+def nominatim(monkeypatch) -> NominatimGeocoder:
+    monkeypatch.setattr(geopy.geocoders, 'Nominatim', FakeNominatim)
+    return NominatimGeocoder(min_interval=0)
+
+
+def test_names_are_cached_per_cell(nominatim, tmp_path):
+    namer = LocationNamer(nominatim, str(tmp_path / 'geocode.db'))
+    assert namer.name(45.0, -120.0) == 'Place at 45.0, -120.0'
+
+    # A few meters away is the same cell at zoom 18, so no new lookup
+    assert geohash(45.0, -120.0) == geohash(45.00001, -120.00001)
+    assert namer.name(45.00001, -120.00001) == 'Place at 45.0, -120.0'
+    assert len(nominatim.client.calls) == 1
+
+    # Somewhere else is a new lookup, and city level names use bigger cells
+    namer.name(46.0, -120.0)
+    namer.name(45.0, -120.0, zoom=10)
+    namer.name(45.01, -120.01, zoom=10)
+    assert len(nominatim.client.calls) == 3
+
+    # The disk cache outlives the namer
+    restarted = LocationNamer(nominatim, str(tmp_path / 'geocode.db'))
+    assert restarted.name(45.0, -120.0) == 'Place at 45.0, -120.0'
+    assert len(nominatim.client.calls) == 3
+
+
+def test_unnamed_and_failed_lookups_fall_back_to_coordinates(nominatim):
+    namer = LocationNamer(nominatim)
+    nominatim.client.names[(0.0, -150.0)] = None
+    assert namer.name(0.0, -150.0) == '0.0, -150.0'
+    # Open water is remembered as having no name
+    assert namer.name(0.0, -150.0) == '0.0, -150.0'
+    assert len(nominatim.client.calls) == 1
+
+    # A failure isn't remembered, the next call asks again
+    nominatim.client.fail = True
+    assert namer.name(45.0, -120.0) == '45.0, -120.0'
+    nominatim.client.fail = False
+    assert namer.name(45.0, -120.0) == 'Place at 45.0, -120.0'
+    assert len(nominatim.client.calls) == 3
+
+
+def test_no_wait_looks_up_in_the_background(nominatim):
+    namer = LocationNamer(nominatim)
+    nominatim.client.release.clear()
+
+    # Returns the coordinates straight away however slow the lookup is, and asks only once per cell
+    assert namer.name(45.0, -120.0, wait=False) == '45.0, -120.0'
+    assert namer.name(45.0, -120.0, wait=False) == '45.0, -120.0'
+    nominatim.client.release.set()
+    namer.join()
+
+    assert nominatim.client.calls == [(45.0, -120.0)]
+    assert namer.name(45.0, -120.0, wait=False) == 'Place at 45.0, -120.0'
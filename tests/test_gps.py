@@ -0,0 +1,96 @@
+import calendar
+from functools import reduce
+
+import pytest
+
+from van.sensors.gps import GPSManager
+from van.sensors.gps_replay import ReplaySource
+
+# The textbook example, checksum included, so the checksum isn't only checked against our own helper
+reference_gga = b'$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47'
+
+
+def sentence(body: str) -> bytes:
+    checksum = reduce(lambda value, char: value ^ ord(char), body, 0)
+    return f'${body}*{checksum:02X}'.encode('ascii')
+
+
+def parse(tmp_path, *sentences: bytes, history: int = 3600) -> GPSManager:
+    # Replayed from a plain NMEA file as fast as possible, the first line is thrown away as possibly corrupt
+    path = tmp_path / 'capture.nmea'
+    path.write_bytes(b'\r\n' + b''.join(line + b'\r\n' for line in sentences))
+    manager = GPSManager(source=ReplaySource(str(path), speed=0), history=history)
+    assert not manager.wait(5)
+    return manager
+
+
+def test_parses_gga(tmp_path):
+    manager = parse(tmp_path, reference_gga)
+    fix = manager.latest
+    assert fix.source == 'GPGGA'
+    assert fix.latitude == pytest.approx(48 + 7.038 / 60)
+    assert fix.longitude == pytest.approx(11 + 31 / 60)
+    assert (fix.altitude, fix.fix_quality, fix.satellites_used, fix.hdop) == (545.4, 'GPS Fix', 8, 0.9)
+    assert manager.checksum_errors == manager.malformed_sentences == 0
+
+
+def test_rmc_date_is_used_for_fix_times(tmp_path):
+    manager = parse(tmp_path,
+                    sentence('GPRMC,123519,A,4807.038,N,01131.000,E,022.4,084.4,181026,003.1,W'),
+                    sentence('GNGGA,123519,4807.038,S,01131.000,W,1,08,0.9,545.4,M,46.9,M,,'))
+    fix = manager.latest
+    assert fix.time == calendar.timegm((2026, 10, 18, 12, 35, 19))
+    # Any constellation's talker id is dispatched to the same parser
+    assert fix.source == 'GNGGA'
+    assert fix.latitude < 0 and fix.longitude < 0
+
+
+def test_rejects_bad_checksum(tmp_path):
+    manager = parse(tmp_path, reference_gga[:-1] + b'8', reference_gga.replace(b'*47', b'*zz'))
+    assert manager.latest is None
+    assert manager.checksum_errors == 2
+
+
+def test_truncated_sentences(tmp_path):
+    # Cut off before the checksum, and cut off with a valid checksum but missing fields
+    manager = parse(tmp_path, reference_gga[:30], sentence('GPGGA,123519,4807.038,N'))
+    assert manager.latest is None
+    assert manager.checksum_errors == 1
+    assert manager.malformed_sentences == 1
+
+
+def test_ignores_unknown_talkers_and_sentence_types(tmp_path):
+    manager = parse(tmp_path,
+                    sentence('XXGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,'),
+                    sentence('GPXYZ,1,2,3'),
+                    sentence('GPGSV,1,1,00'))
+    assert manager.latest is None
+    assert manager.checksum_errors == manager.malformed_sentences == 0
+    assert manager.count == 0
+
+
+def gga(second: int) -> bytes:
+    return sentence(f'GPGGA,1235{second:02d},4807.038,N,01131.000,E,1,08,0.9,{second}.0,M,46.9,M,,')
+
+
+def test_history_wraps_around_at_capacity(tmp_path):
+    manager = parse(tmp_path, *(gga(second) for second in range(5)), history=3)
+    assert manager.count == 5
+    assert [fix.altitude for fix in manager.history()] == [2.0, 3.0, 4.0]
+    assert [fix.altitude for fix in manager.history(2)] == [3.0, 4.0]
+    assert manager.history()[-1] is manager.latest
+
+
+def test_velocity_completes_the_current_fix(tmp_path):
+    manager = parse(tmp_path, gga(0), sentence('GPVTG,054.7,T,034.4,M,005.5,N,010.2,K'))
+    # VTG belongs to the same epoch, so it replaces the fix rather than taking a new slot
+    assert manager.count == 1
+    assert manager.history() == [manager.latest]
+    assert (manager.latest.true_track, manager.latest.ground_speed) == (54.7, 10.2)
+    assert manager.latest.altitude == 0.0
+
+
+def test_fixes_are_immutable(tmp_path):
+    fix = parse(tmp_path, gga(0)).latest
+    with pytest.raises(AttributeError):
+        fix.latitude = 0.0
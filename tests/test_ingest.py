@@ -0,0 +1,39 @@
+import datetime
+
+from sqlalchemy import func, select
+
+from models import GPSData, Heartbeat, TomorrowIO
+from van.sync.payload import encode_payload
+from website.database import db
+
+
+def heartbeat_upload() -> dict:
+    time = datetime.datetime(2026, 1, 1, 12, 0, 0)
+    gps = {'headers': ['id', 'utc_time', 'latitude', 'longitude', 'altitude', 'fix_quality',
+                       'satellites_used', 'hdop'],
+           'data': [[gps_id, time + datetime.timedelta(seconds=gps_id), 45.0, -120.0, 0.0, '1', 5, 1.0]
+                    for gps_id in (7, 8, 9)]}
+    tio = {'headers': ['id', 'utc_time', 'invalid', 'gps_id', 'temperature'],
+           'data': [[1, time, False, 8, 20.5]]}
+    heartbeat = {'headers': ['id', 'on_schedule', 'server', 'internet', 'time_utc', 'next_time'],
+                 'data': [[3, True, True, True, time, time + datetime.timedelta(seconds=30)]]}
+    return {'email': 'a@b.c', 'vehicle_name': 'van', 'next_heartbeat': '2026-01-01T12:00:30',
+            'database': {'gps': gps, 'tio': tio, 'heartbeat': heartbeat}}
+
+
+def test_repeated_upload_stores_rows_once(website):
+    body, headers = encode_payload(heartbeat_upload())
+    client = website.test_client()
+
+    # The van didn't hear back the first time and sends the same rows again
+    responses = [client.post('/api/heartbeat.json', data=body, headers=headers) for _ in range(2)]
+    for response in responses:
+        assert response.status_code == 200
+        assert response.json['received'] == {'gps': [7, 8, 9], 'tio': [1], 'heartbeat': [3]}
+
+    with website.app_context():
+        for model, rows in ((GPSData, 3), (TomorrowIO, 1), (Heartbeat, 1)):
+            assert db.session.scalar(select(func.count()).select_from(model)) == rows
+        # The weather reading points at the website's id for the van's gps point 8
+        tio = db.session.scalars(select(TomorrowIO)).one()
+        assert db.session.get(GPSData, tio.gps_id).origin_id == 8
@@ -0,0 +1,116 @@
+import gzip
+import logging
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from van.log_files import CompressingRotatingFileHandler, log_segments
+
+
+@pytest.fixture
+def rotating_log(tmp_path):
+    """A logger writing to hub.log through a handler factory, the handler is closed afterwards"""
+    log = logging.getLogger('tests.rotating')
+    log.propagate = False
+    log.setLevel(logging.INFO)
+
+    def attach(**kwargs) -> CompressingRotatingFileHandler:
+        handler = CompressingRotatingFileHandler(str(tmp_path / 'hub.log'), **kwargs)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        log.addHandler(handler)
+        return handler
+
+    yield log, attach
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+        handler.close()
+
+
+def test_rotated_segments_are_gzipped_in_order(tmp_path, rotating_log):
+    log, attach = rotating_log
+    attach(max_bytes=10, backup_count=100)
+    for i in range(6):
+        log.info(f'message number {i}')
+
+    segments = log_segments(str(tmp_path / 'hub.log'))
+    assert len(segments) == 5
+    # Newest first, and together with the live file nothing was lost
+    contents = [gzip.decompress(open(path, 'rb').read()).decode() for path in reversed(segments)]
+    contents.append((tmp_path / 'hub.log').read_text())
+    assert ''.join(contents) == ''.join(f'message number {i}\n' for i in range(6))
+
+
+def test_retention_keeps_backup_count(tmp_path, rotating_log):
+    log, attach = rotating_log
+    attach(max_bytes=10, backup_count=3)
+    for i in range(10):
+        log.info(f'message number {i}')
+
+    segments = log_segments(str(tmp_path / 'hub.log'))
+    assert len(segments) == 3
+    assert gzip.decompress(open(segments[0], 'rb').read()) == b'message number 8\n'
+
+
+def test_retention_keeps_total_size(tmp_path, rotating_log):
+    log, attach = rotating_log
+    attach(max_bytes=10, backup_count=100, max_total_bytes=200)
+    for i in range(20):
+        log.info(f'message number {i}')
+
+    segments = log_segments(str(tmp_path / 'hub.log'))
+    assert 0 < sum(os.path.getsize(path) for path in segments) <= 200
+    assert len(segments) < 19
+    assert gzip.decompress(open(segments[0], 'rb').read()) == b'message number 18\n'
+
+
+def test_rotates_by_age(tmp_path, rotating_log):
+    log, attach = rotating_log
+    handler = attach(max_bytes=0, rotate_seconds=60)
+    log.info('first')
+    handler.opened -= 61
+    log.info('second')
+
+    assert len(log_segments(str(tmp_path / 'hub.log'))) == 1
+    assert (tmp_path / 'hub.log').read_text() == 'second\n'
+
+
+@pytest.fixture
+def log_client():
+    from van.endpoints import endpoints, log_directory
+
+    logs = log_directory()
+    os.makedirs(logs, exist_ok=True)
+    for name in os.listdir(logs):
+        os.remove(os.path.join(logs, name))
+    with open(os.path.join(logs, 'hub.log'), 'w') as file:
+        file.write('live\n')
+    with gzip.open(os.path.join(logs, 'hub.log.20260101-000000-000000.gz'), 'wb') as file:
+        file.write(b'old\n')
+
+    app = FastAPI()
+    app.include_router(endpoints)
+    return TestClient(app), logs
+
+
+def test_delete_log_files(log_client):
+    client, logs = log_client
+    assert client.delete('/logs/hub.log.20260101-000000-000000.gz.json').status_code == 200
+    assert os.listdir(logs) == ['hub.log']
+
+    # The live log is emptied, not removed from under the handler writing to it
+    assert client.delete('/logs/hub.log.json').status_code == 200
+    assert os.path.getsize(os.path.join(logs, 'hub.log')) == 0
+
+
+@pytest.mark.parametrize('name', ['..', '.', 'database.db', '..%2Fdatabase.db', '%2E%2E%2Fdatabase.db'])
+def test_delete_refuses_names_outside_the_log_directory(log_client, name):
+    client, logs = log_client
+    database = os.path.join(os.path.dirname(logs), 'database.db')
+    size = os.path.getsize(database)
+
+    assert client.delete(f'/logs/{name}.json').status_code in (404, 405)
+    assert client.get(f'/logs/files/{name}').status_code in (404, 405)
+    assert os.path.getsize(database) == size
+    assert sorted(os.listdir(logs)) == ['hub.log', 'hub.log.20260101-000000-000000.gz']
@@ -0,0 +1,72 @@
+import os
+
+from van.logtail import LogTailer
+
+
+def append(path, text: str):
+    with open(path, 'a') as file:
+        file.write(text)
+
+
+def test_new_file_contents_are_backlog(tmp_path):
+    append(tmp_path / 'hub.log', 'old\n')
+    tailer = LogTailer(str(tmp_path))
+    assert tailer.poll()[1] == {'hub.log': {'lines': [], 'size': 4}}
+    # Nothing changed, nothing to send
+    assert tailer.poll()[1] == {}
+
+
+def test_partial_lines_wait_until_finished(tmp_path):
+    log = tmp_path / 'hub.log'
+    append(log, '')
+    tailer = LogTailer(str(tmp_path))
+    tailer.poll()
+
+    append(log, 'one\ntw')
+    assert tailer.poll()[1]['hub.log']['lines'] == ['one']
+    append(log, 'o\nthree\n')
+    assert tailer.poll()[1]['hub.log']['lines'] == ['two', 'three']
+
+    # The snapshot backlog stops where the last poll's whole lines did
+    append(log, 'fo')
+    _, changes, snapshot = tailer.snapshot()
+    assert changes['hub.log']['lines'] == []
+    assert snapshot['hub.log']['lines'] == ['one', 'two', 'three']
+
+
+def test_truncated_file_starts_over(tmp_path):
+    log = tmp_path / 'hub.log'
+    append(log, 'a long line before the truncation\n')
+    tailer = LogTailer(str(tmp_path))
+    tailer.poll()
+
+    with open(log, 'w') as file:
+        file.write('fresh\n')
+    change = tailer.poll()[1]['hub.log']
+    assert change['reset'] and change['lines'] == ['fresh']
+
+
+def test_rotated_file_starts_over(tmp_path):
+    log = tmp_path / 'hub.log'
+    append(log, 'before\n')
+    tailer = LogTailer(str(tmp_path))
+    tailer.poll()
+
+    # A new file under the same name, bigger than what we've read so only the inode gives it away
+    os.rename(log, tmp_path / 'hub.log.20260101-000000-000000.gz')
+    append(log, 'after rotation\n')
+    changes = tailer.poll()[1]
+    assert changes == {'hub.log': {'lines': ['after rotation'], 'size': 15, 'reset': True}}
+
+
+def test_large_bursts_are_spread_over_polls(tmp_path):
+    log = tmp_path / 'hub.log'
+    append(log, '')
+    tailer = LogTailer(str(tmp_path), max_read=10)
+    tailer.poll()
+
+    append(log, ''.join(f'line {i}\n' for i in range(5)))
+    lines = []
+    for _ in range(5):
+        lines += tailer.poll()[1].get('hub.log', {}).get('lines', [])
+    assert lines == [f'line {i}' for i in range(5)]
@@ -0,0 +1,42 @@
+import datetime
+import gzip
+
+import orjson
+
+from van.sync.payload import columnar_content_type, encode_payload, legacy_content_type
+from website.ingest import parse_rows
+
+headers = ['id', 'utc_time', 'latitude', 'altitude', 'ground_speed', 'fix_quality']
+rows = [
+    [1, datetime.datetime(2026, 1, 1, 12, 0, 0), 45.5, None, 3.25, 'GPS Fix'],
+    [2, datetime.datetime(2026, 1, 1, 12, 0, 1, 250000), -45.5, 120.0, None, 'Not Fixed'],
+]
+
+
+def decoded(body: bytes, content_headers: dict) -> list[list]:
+    # What the website does with the upload (website.ingest.read_upload and parse_rows)
+    if content_headers.get('Content-Encoding') == 'gzip':
+        body = gzip.decompress(body)
+    table_data = orjson.loads(body)['database']['gps']
+    return [[row[header] for header in headers] for row in parse_rows(table_data, datetime_fields=('utc_time',))]
+
+
+def test_columnar_round_trip():
+    body, content_headers = encode_payload({'database': {'gps': {'headers': headers, 'data': rows}}})
+    assert content_headers == {'Content-Type': columnar_content_type, 'Content-Encoding': 'gzip'}
+    assert decoded(body, content_headers) == rows
+
+
+def test_plain_json_round_trip():
+    # Old websites get every value as text, None included, and read it back the same
+    body, content_headers = encode_payload({'database': {'gps': {'headers': headers, 'data': rows}}},
+                                           columnar=False)
+    assert content_headers == {'Content-Type': legacy_content_type}
+    assert [[str(value) for value in row] for row in decoded(body, content_headers)] == \
+           [[str(value) for value in row] for row in rows]
+    assert decoded(body, content_headers)[0][3] is None
+
+
+def test_empty_table_round_trip():
+    body, content_headers = encode_payload({'database': {'gps': {'headers': headers, 'data': []}}})
+    assert decoded(body, content_headers) == []
@@ -0,0 +1,71 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from models import GPSData
+from van.sensors.gps import GPS
+from van.sensors.registry import build_sensors, load_sensor_config
+from van.sensors.tomorrow_io import TIO
+
+
+def gps_reading(latitude: float, longitude: float = -120.0, satellites_used: int = 8) -> GPSData:
+    return GPSData(latitude=latitude, longitude=longitude, altitude=0.0, fix_quality='GPS Fix',
+                   satellites_used=satellites_used, hdop=1.0)
+
+
+def test_config_enabling_only_tio_keeps_gps_first(monkeypatch):
+    monkeypatch.setenv('VLS_SENSORS', json.dumps([{'name': 'tio', 'enabled': True}]))
+    config = load_sensor_config()
+    assert [entry['name'] for entry in config] == ['gps', 'tio']
+    assert config[1]['enabled'] and config[1]['options'] == {'gps': 'gps'}
+
+    # And it builds, since tio's gps reference comes before it (no receiver here, so fake gps values)
+    config[0]['options']['location'] = '/dev/no-such-gps'
+    gps, tio = build_sensors(config, development=True)
+    assert isinstance(gps, GPS) and isinstance(tio, TIO)
+    assert tio.gps is gps
+
+
+def test_new_sensors_go_after_the_defaults(monkeypatch):
+    monkeypatch.setenv('VLS_SENSORS', json.dumps([{'name': 'roof_gps', 'type': 'gps'}, {'name': 'gps'}]))
+    assert [entry['name'] for entry in load_sensor_config()] == ['gps', 'tio', 'roof_gps']
+
+
+def test_duplicate_sensor_names_are_rejected(monkeypatch):
+    monkeypatch.setenv('VLS_SENSORS', json.dumps([{'name': 'gps'}, {'name': 'gps', 'enabled': False}]))
+    with pytest.raises(ValueError, match='unique'):
+        load_sensor_config()
+
+
+def test_records_only_when_moved_past_the_threshold():
+    gps = GPS(location='/dev/no-such-gps', development=True,
+              record_on_change={'distance': 10}, max_quiet_seconds=600)
+    meter = 1 / 111195  # Degrees of latitude
+
+    assert gps.should_record(gps_reading(45.0))
+    assert not gps.should_record(gps_reading(45.0 + 5 * meter))
+    # Measured from the last recorded reading, not the last skipped one
+    assert not gps.should_record(gps_reading(45.0 + 9 * meter))
+    assert gps.should_record(gps_reading(45.0 + 11 * meter))
+    assert gps.skipped == 2
+
+
+def test_field_thresholds_and_max_quiet(monkeypatch):
+    gps = GPS(location='/dev/no-such-gps', development=True,
+              record_on_change={'satellites_used': 2}, max_quiet_seconds=600)
+    clock = SimpleNamespace(monotonic=lambda: 1000.0)
+    monkeypatch.setattr('van.sensors.abstracts.time', clock)
+
+    assert gps.should_record(gps_reading(45.0, satellites_used=8))
+    assert not gps.should_record(gps_reading(46.0, satellites_used=9))
+    assert gps.should_record(gps_reading(45.0, satellites_used=10))
+
+    # Nothing changed, but it's been quiet too long
+    clock.monotonic = lambda: 1601.0
+    assert gps.should_record(gps_reading(45.0, satellites_used=10))
+
+
+def test_no_thresholds_records_everything():
+    gps = GPS(location='/dev/no-such-gps', development=True, record_on_change={})
+    assert all(gps.should_record(gps_reading(45.0)) for _ in range(3))
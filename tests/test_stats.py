@@ -0,0 +1,59 @@
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from models import Base, GPSData, TableStats, TomorrowIO
+from van.scheduling.buffer import SensorBuffer
+from van.stats import build_stats, read_stats, stats_tables
+
+
+def gps_reading() -> GPSData:
+    return GPSData(latitude=45.0, longitude=-120.0, altitude=0.0, fix_quality='1', satellites_used=5, hdop=1.0)
+
+
+def table_counts(session: Session) -> dict[str, int]:
+    return {name: session.scalar(select(func.count()).select_from(model))
+            for name, (model, _) in stats_tables.items()}
+
+
+def test_stats_match_the_tables_after_a_flush(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/van.db')
+    Base.metadata.create_all(engine)
+    buffer = SensorBuffer(engine, max_readings=100)
+
+    # Weather readings bring their own new gps point, or share one the gps sensor also buffered
+    shared = gps_reading()
+    readings = [gps_reading() for _ in range(3)] + [shared]
+    readings += [TomorrowIO(invalid=False, gps_data=gps_reading()) for _ in range(2)]
+    readings.append(TomorrowIO(invalid=False, gps_data=shared))
+    for reading in readings:
+        buffer.add(reading)
+    buffer.flush()
+
+    # And one whose gps point was already saved by an earlier flush
+    with Session(engine) as session:
+        saved = session.scalars(select(GPSData)).first()
+        session.expunge(saved)
+    buffer.add(TomorrowIO(invalid=False, gps_id=saved.id))
+    buffer.flush()
+
+    with Session(engine) as session:
+        counts = table_counts(session)
+        assert counts['gps'] == 6 and counts['tio'] == 4
+        assert {name: table['rows'] for name, table in read_stats(session).items()} == counts
+
+
+def test_build_stats_counts_existing_rows(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/van.db')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all([gps_reading() for _ in range(4)])
+        session.commit()
+
+    build_stats(engine)
+    # Only tables without statistics are counted, so running it again changes nothing
+    build_stats(engine)
+    with Session(engine) as session:
+        assert session.scalar(select(func.count()).select_from(TableStats)) == len(stats_tables)
+        stats = read_stats(session)
+        assert {name: table['rows'] for name, table in stats.items()} == table_counts(session)
+        assert sum(stats['gps']['days'].values()) == 4
@@ -0,0 +1,35 @@
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from models import Base, GPSData
+from van.tables import fetch_page
+
+
+def gps_rows(count: int) -> list[dict]:
+    # No utc_time, so SQLite fills it in with CURRENT_TIMESTAMP like the sensors do
+    return [{'latitude': 45.0, 'longitude': -120.0, 'altitude': 0.0, 'fix_quality': '1',
+             'satellites_used': 5, 'hdop': 1.0} for _ in range(count)]
+
+
+def page_through(session: Session, descending: bool, limit: int = 2) -> list[int]:
+    ids, after = [], None
+    for _ in range(20):
+        page = fetch_page(session, GPSData, columns=['id'], sort='utc_time',
+                          descending=descending, after=after, limit=limit)
+        ids.extend(row[0] for row in page['rows'])
+        after = page['next']
+        if after is None:
+            return ids
+    raise AssertionError(f'Paging never finished, got {ids}')
+
+
+def test_pages_through_rows_sharing_a_timestamp():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        # All in one statement, so every row gets the same second
+        session.execute(insert(GPSData), gps_rows(5))
+        session.commit()
+
+        assert page_through(session, descending=True) == [5, 4, 3, 2, 1]
+        assert page_through(session, descending=False) == [1, 2, 3, 4, 5]
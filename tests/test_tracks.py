@@ -0,0 +1,82 @@
+import datetime
+import math
+import random
+
+import pytest
+
+from models import TrackBuild
+from website.database import db
+from website.tracks import build_timeout, claim_build, encode_polyline, simplify, track_level, track_levels
+
+
+def test_encode_polyline_matches_google_example():
+    # From Google's encoded polyline algorithm format documentation
+    points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    assert encode_polyline(points) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+    assert encode_polyline([]) == ''
+
+
+@pytest.mark.parametrize('zoom, level', [(3, 4), (4, 4), (5, 8), (15, 16), (16, 16), (20, 16)])
+def test_track_level(zoom, level):
+    assert track_level(zoom) == level
+    # The chosen level's tolerance is never coarser than a pixel at the requested zoom
+    if zoom <= max(track_levels):
+        assert track_levels[level] <= 156543.03 / 2 ** zoom
+
+
+def test_simplify_drops_points_within_tolerance():
+    # A bump of 5m in the middle of a straight ~2km line goes, one of 20m stays
+    meters = 1 / 110540
+    assert simplify([(0, 0), (5 * meters, 0.01), (0, 0.02)], tolerance=10) == [(0, 0), (0, 0.02)]
+    assert simplify([(0, 0), (20 * meters, 0.01), (0, 0.02)], tolerance=10) == \
+           [(0, 0), (20 * meters, 0.01), (0, 0.02)]
+
+
+def test_simplified_line_stays_within_tolerance():
+    generator = random.Random(1)
+    points = [(45.0, -120.0)]
+    for _ in range(500):
+        latitude, longitude = points[-1]
+        points.append((latitude + generator.uniform(-1, 1) * 1e-4, longitude + generator.uniform(0, 2) * 1e-4))
+
+    tolerance = 15
+    simplified = simplify(points, tolerance)
+    assert simplified[0] == points[0] and simplified[-1] == points[-1]
+    assert len(simplified) < len(points)
+
+    # Every original point is within tolerance of the simplified line (same flat projection simplify uses)
+    scale = math.cos(math.radians(points[0][0]))
+
+    def project(point):
+        return point[1] * 111320 * scale, point[0] * 110540
+
+    def segment_distance(point, start, end):
+        (x, y), (x1, y1), (x2, y2) = project(point), project(start), project(end)
+        dx, dy = x2 - x1, y2 - y1
+        t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / (dx * dx + dy * dy)))
+        return math.hypot(x - x1 - t * dx, y - y1 - t * dy)
+
+    for point in points:
+        assert min(segment_distance(point, start, end)
+                   for start, end in zip(simplified, simplified[1:])) <= tolerance + 1e-6
+
+
+def test_stale_build_claim_is_taken_over(website):
+    with website.app_context():
+        assert claim_build(1)
+        # Someone is already building it
+        assert not claim_build(1)
+
+        # That build stopped making progress
+        build = db.session.get(TrackBuild, 1)
+        build.updated_utc = datetime.datetime.utcnow() - build_timeout - datetime.timedelta(minutes=1)
+        db.session.commit()
+        assert claim_build(1)
+        assert not claim_build(1)
+
+        # A finished build is never claimed again, however old
+        build = db.session.get(TrackBuild, 1)
+        build.updated_utc = datetime.datetime.utcnow() - build_timeout * 10
+        build.finished_utc = build.updated_utc
+        db.session.commit()
+        assert not claim_build(1)
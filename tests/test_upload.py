@@ -0,0 +1,142 @@
+import asyncio
+import gzip
+import time
+
+import httpx
+import orjson
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from models import Base, GPSData
+from van.sync.payload import columnar_content_type, legacy_content_type
+from van.sync.upload import Uploader
+from van.sync.watermark import SyncEngine
+
+
+def gps_rows(count: int) -> list[dict]:
+    # Distinct values, so the compressed size grows with the rows
+    return [{'latitude': 45.0 + i * 0.00137, 'longitude': -120.0 - i * 0.00291, 'altitude': i * 1.7,
+             'fix_quality': '1', 'satellites_used': 5, 'hdop': 1.0} for i in range(count)]
+
+
+class FakeServer:
+    """Stands in for Uploader.post, answers with the given status codes in turn and then acknowledges everything"""
+
+    def __init__(self, *statuses: int):
+        self.statuses = list(statuses)
+        self.content_types = []
+
+    async def post(self, url: str, headers: dict, body: bytes, content_headers: dict) -> httpx.Response:
+        self.content_types.append(content_headers['Content-Type'])
+        if self.statuses:
+            return httpx.Response(self.statuses.pop(0))
+        return httpx.Response(200, json={'received': {'gps': []}})
+
+
+def uploader_for(tmp_path, server: FakeServer, rows: int = 3, **kwargs) -> Uploader:
+    engine = create_engine(f'sqlite:///{tmp_path}/van.db')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.execute(insert(GPSData), gps_rows(rows))
+        session.commit()
+    uploader = Uploader(SyncEngine(engine, {'gps': GPSData}), **kwargs)
+    uploader.post = server.post
+    return uploader
+
+
+def test_falls_back_to_plain_json_for_a_while_on_415(tmp_path):
+    server = FakeServer(415)
+    uploader = uploader_for(tmp_path, server, plain_json_seconds=0.2)
+
+    # Refused, then resent as plain json straight away
+    asyncio.run(uploader.upload('http://website', {}, {}))
+    assert server.content_types == [columnar_content_type, legacy_content_type]
+    assert not uploader.columnar
+
+    # Still within the window, so no columnar attempt
+    server.content_types.clear()
+    asyncio.run(uploader.upload('http://website', {}, {}))
+    assert server.content_types == [legacy_content_type]
+
+    # And once it's over columnar is tried again
+    time.sleep(0.25)
+    server.content_types.clear()
+    asyncio.run(uploader.upload('http://website', {}, {}))
+    assert uploader.columnar
+    assert server.content_types == [columnar_content_type]
+
+
+def test_other_errors_keep_the_format(tmp_path):
+    server = FakeServer(400)
+    uploader = uploader_for(tmp_path, server)
+
+    assert asyncio.run(uploader.upload('http://website', {}, {})) == 0
+    assert server.content_types == [columnar_content_type]
+    assert uploader.columnar
+    assert not uploader.connected
+
+
+class AcknowledgingServer(FakeServer):
+    """Acknowledges every gps row it's sent, and remembers how many came in each chunk"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    async def post(self, url: str, headers: dict, body: bytes, content_headers: dict) -> httpx.Response:
+        gps = orjson.loads(gzip.decompress(body))['database']['gps']
+        ids = gps['columns'][gps['headers'].index('id')]
+        self.chunks.append(len(ids))
+        return httpx.Response(200, json={'received': {'gps': ids}})
+
+
+def test_unreadable_response_acknowledges_nothing(tmp_path):
+    responses = [httpx.Response(200, text='<html>Bad gateway</html>'), httpx.Response(200, json={'ok': True})]
+    for number, response in enumerate(responses):
+        async def post(*args):
+            return response
+        (tmp_path / str(number)).mkdir()
+        uploader = uploader_for(tmp_path / str(number), FakeServer())
+        uploader.post = post
+
+        assert asyncio.run(uploader.upload('http://website', {}, {})) == 0
+        assert not uploader.connected
+        assert len(uploader.sync_engine.collect()['gps']['data']) == 3
+
+
+def test_fit_chunk_halves_rows_until_the_body_fits(tmp_path):
+    uploader = uploader_for(tmp_path, FakeServer(), rows=64, max_rows=64)
+    database = uploader.sync_engine.collect(64)
+    _, full_body, _ = uploader.fit_chunk({}, database)
+
+    uploader.max_bytes = len(full_body) // 3
+    fitted, body, _ = uploader.fit_chunk({}, database)
+    rows = len(fitted['gps']['data'])
+    assert rows in (32, 16, 8, 4, 2)
+    assert len(body) <= uploader.max_bytes
+
+    # It's the biggest halving that fits, twice as many rows would not have
+    uploader.max_bytes = len(full_body)
+    _, doubled, _ = uploader.fit_chunk({}, uploader.sync_engine.collect(rows * 2))
+    assert len(doubled) > len(full_body) // 3
+
+    # A single row is sent however big it is
+    uploader.max_bytes = 1
+    fitted, _, _ = uploader.fit_chunk({}, database)
+    assert len(fitted['gps']['data']) == 1
+
+
+def test_stops_after_max_chunks(tmp_path):
+    server = AcknowledgingServer()
+    uploader = uploader_for(tmp_path, server, rows=25, max_rows=4, max_chunks=3)
+
+    assert asyncio.run(uploader.upload('http://website', {}, {})) == 12
+    assert server.chunks == [4, 4, 4]
+    assert uploader.connected and not uploader.caught_up
+
+    # The rest goes with the following heartbeats
+    server.chunks.clear()
+    asyncio.run(uploader.upload('http://website', {}, {}))
+    asyncio.run(uploader.upload('http://website', {}, {}))
+    assert sum(server.chunks) == 13
+    assert uploader.caught_up
@@ -0,0 +1,40 @@
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from models import Base, GPSData, SyncWatermark
+from van.sync.watermark import SyncEngine
+
+
+def gps_rows(count: int) -> list[dict]:
+    return [{'latitude': 45.0, 'longitude': -120.0, 'altitude': 0.0, 'fix_quality': '1',
+             'satellites_used': 5, 'hdop': 1.0} for _ in range(count)]
+
+
+def collected_ids(sync: SyncEngine) -> list[int]:
+    gps = sync.collect()['gps']
+    return [row[gps['headers'].index('id')] for row in gps['data']]
+
+
+def test_only_acknowledged_rows_advance_the_watermark(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/van.db')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.execute(insert(GPSData), gps_rows(5))
+        session.commit()
+    sync = SyncEngine(engine, {'gps': GPSData})
+
+    database = sync.collect()
+    assert collected_ids(sync) == [1, 2, 3, 4, 5]
+
+    # 3 went missing, so the mark stops at 2 even though 4 arrived
+    sync.acknowledge(database, {'gps': [1, 2, 4]})
+    with Session(engine) as session:
+        assert session.get(SyncWatermark, 'gps').last_id == 2
+    assert collected_ids(sync) == [3, 4, 5]
+
+    # Nothing acknowledged, nothing moves
+    sync.acknowledge(sync.collect(), {'gps': []})
+    assert collected_ids(sync) == [3, 4, 5]
+
+    sync.acknowledge(sync.collect(), {'gps': [3, 4, 5]})
+    assert collected_ids(sync) == []
@@ -0,0 +1,98 @@
+import email.utils
+import threading
+import time
+
+import pytest
+import requests
+
+from van.sensors.weather_cache import WeatherCache
+
+
+class FakeResponse(requests.Response):
+    def __init__(self, status_code: int, headers: dict = None, values: dict = None):
+        super().__init__()
+        self.status_code = status_code
+        self.headers.update(headers or {})
+        self._values = values
+
+    def json(self, **kwargs):
+        return {'data': {'values': self._values}}
+
+
+class FakeAPI:
+    """Stands in for the cache's requests session, counts calls and returns temperature = call number"""
+
+    def __init__(self, status_code: int = 200, headers: dict = None, delay: float = 0):
+        self.status_code, self.headers, self.delay = status_code, headers, delay
+        self.locations = []
+
+    def get(self, url, params, headers, timeout):
+        time.sleep(self.delay)
+        self.locations.append(params['location'])
+        return FakeResponse(self.status_code, self.headers, {'temperature': len(self.locations)})
+
+
+def cache_with(api: FakeAPI, **kwargs) -> WeatherCache:
+    cache = WeatherCache(**kwargs)
+    cache._session = api
+    return cache
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('120', 120),
+    ('0', 0),
+    (None, 600),  # No header, ten times min_refresh_seconds
+    ('soon', 600),
+])
+def test_retry_after_seconds_and_garbage(value, expected):
+    cache = WeatherCache(min_refresh_seconds=60)
+    assert cache.retry_after(FakeResponse(429, {'Retry-After': value} if value else {})) == expected
+
+
+def test_retry_after_http_date():
+    cache = WeatherCache(min_refresh_seconds=60)
+    retry_at = email.utils.formatdate(time.time() + 300, usegmt=True)
+    assert cache.retry_after(FakeResponse(429, {'Retry-After': retry_at})) == pytest.approx(300, abs=2)
+    # A date already gone means go ahead
+    gone = email.utils.formatdate(time.time() - 300, usegmt=True)
+    assert cache.retry_after(FakeResponse(429, {'Retry-After': gone})) == 0
+
+
+def test_min_refresh_is_per_cell():
+    api = FakeAPI()
+    cache = cache_with(api, min_refresh_seconds=60)
+    assert cache.fetch(45.0, -120.0) == {'temperature': 1}
+    # Same cell again is throttled, a different cell isn't
+    assert cache.fetch(45.0, -120.0) is None
+    assert cache.fetch(10.0, 10.0) == {'temperature': 2}
+    assert cache.requests_made == 2
+
+
+def test_rate_limit_pauses_every_cell():
+    api = FakeAPI(status_code=429, headers={'Retry-After': '120'})
+    cache = cache_with(api, min_refresh_seconds=0)
+    assert cache.fetch(45.0, -120.0) is None
+    assert cache.fetch(10.0, 10.0) is None
+    assert len(api.locations) == 1
+
+
+def test_serves_stale_while_revalidating():
+    api = FakeAPI(delay=0.2)
+    cache = cache_with(api, bucket_seconds=1, min_refresh_seconds=0)
+    assert cache.get(45.0, -120.0) == {'temperature': 1}
+
+    # Into the next bucket, the old reading comes back straight away while one refresh runs behind it
+    time.sleep(1.05 - time.time() % 1)
+    start = time.monotonic()
+    results = []
+    readers = [threading.Thread(target=lambda: results.append(cache.get(45.0, -120.0))) for _ in range(5)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    assert time.monotonic() - start < 0.15
+    assert results == [{'temperature': 1}] * 5
+
+    time.sleep(0.4)
+    assert len(api.locations) == 2
+    assert cache.get(45.0, -120.0) == {'temperature': 2}
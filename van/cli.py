@@ -1,10 +1,101 @@
 #!/usr/bin/env python
 
 import argparse
+import time
 
 parser = argparse.ArgumentParser()
 subparsers = parser.add_subparsers()
 
 sensor_parser = subparsers.add_parser('sensor')
 
-parser.parse_args()
+# GPS capture/replay tools, for working on the gps pipeline without a receiver plugged in
+gps_parser = subparsers.add_parser('gps', help='Capture, replay and benchmark raw gps streams')
+gps_commands = gps_parser.add_subparsers(dest='gps_command', required=True)
+
+capture_parser = gps_commands.add_parser('capture', help='Record the raw serial stream to a capture file')
+capture_parser.add_argument('output')
+capture_parser.add_argument('--location', default='/dev/ttyACM0')
+capture_parser.add_argument('--baud', type=int, default=9600)
+capture_parser.add_argument('--seconds', type=float, default=None, help='Stop after this long (default: until ctrl-c)')
+
+replay_parser = gps_commands.add_parser('replay', help='Replay a capture into a pseudo terminal')
+replay_parser.add_argument('capture')
+replay_parser.add_argument('--speed', type=float, default=1.0)
+replay_parser.add_argument('--loop', action='store_true')
+
+bench_parser = gps_commands.add_parser('bench', help='Parse a capture as fast as possible and report throughput')
+bench_parser.add_argument('capture')
+
+# Local TomorrowIO stand-in, so the weather sensor can run without spending API quota
+weather_parser = subparsers.add_parser('weather', help='Tools for the TomorrowIO weather sensor')
+weather_commands = weather_parser.add_subparsers(dest='weather_command', required=True)
+
+standin_parser = weather_commands.add_parser('standin', help='Serve fake realtime weather on localhost')
+standin_parser.add_argument('--port', type=int, default=8765)
+
+
+def gps_capture(args):
+    import serial
+    from van.sensors.gps_replay import CaptureWriter
+
+    writer = CaptureWriter(serial.Serial(args.location, args.baud), args.output)
+    start = time.monotonic()
+    lines = 0
+    try:
+        while args.seconds is None or time.monotonic() - start < args.seconds:
+            writer.readline()
+            lines += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+    print(f'Captured {lines} lines to {args.output}')
+
+
+def gps_replay(args):
+    from van.sensors.gps_replay import replay_to_pty
+
+    _, device = replay_to_pty(args.capture, speed=args.speed, loop=args.loop)
+    print(f'Replaying {args.capture} at {args.speed}x on {device} (ctrl-c to stop)')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+
+
+def gps_bench(args):
+    from van.sensors.gps import GPSManager
+    from van.sensors.gps_replay import ReplaySource
+
+    source = ReplaySource(args.capture, speed=0)
+    start = time.perf_counter()
+    manager = GPSManager(source=source)
+    manager.wait()
+    elapsed = time.perf_counter() - start
+
+    print(f'Parsed {source.lines} sentences in {elapsed:.3f}s '
+          f'({source.lines / elapsed:.0f} sentences/s, {elapsed / max(source.lines, 1) * 1e6:.1f}us each)')
+    print(f'{manager.count} fixes, {manager.checksum_errors} checksum errors, '
+          f'{manager.malformed_sentences} malformed sentences')
+
+
+def weather_standin(args):
+    from van.sensors.weather_standin import WeatherStandIn
+
+    server = WeatherStandIn(port=args.port)
+    print(f'Serving fake TomorrowIO weather at {server.url}, set VLS_TOMORROW_IO_URL={server.url} (ctrl-c to stop)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+capture_parser.set_defaults(run=gps_capture)
+replay_parser.set_defaults(run=gps_replay)
+bench_parser.set_defaults(run=gps_bench)
+standin_parser.set_defaults(run=weather_standin)
+
+args = parser.parse_args()
+if hasattr(args, 'run'):
+    args.run(args)
@@ -0,0 +1,106 @@
+import sqlite3
+import time
+from typing import Iterator
+
+import orjson
+
+from van.database import database_path
+
+# Bounds for a single console query
+max_console_rows = 10000
+default_console_rows = 1000
+default_timeout = 5.0
+console_chunk_rows = 200
+
+# Pragmas that take an argument but only read (pragma name = value sets things, so those are refused)
+introspection_pragmas = {'table_info', 'table_xinfo', 'index_list', 'index_info', 'index_xinfo', 'foreign_key_list'}
+
+
+def console_authorizer(action: int, arg1, arg2, database, trigger) -> int:
+    # A read only connection can still attach other files or change pragmas, so refuse those
+    if action in (sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH):
+        return sqlite3.SQLITE_DENY
+    if action == sqlite3.SQLITE_PRAGMA and arg2 is not None and arg1.lower() not in introspection_pragmas:
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK
+
+
+def read_only_connection() -> sqlite3.Connection:
+    """A connection that can't write, opened read only and with query_only on for good measure"""
+    connection = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True, check_same_thread=False)
+    connection.execute('PRAGMA query_only = ON')
+    connection.set_authorizer(console_authorizer)
+    return connection
+
+
+def query_plan(connection: sqlite3.Connection, sql: str) -> list[str]:
+    """EXPLAIN QUERY PLAN output as indented lines, empty if the statement can't be explained"""
+    try:
+        rows = connection.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall()
+    except sqlite3.Error:
+        return []
+
+    depths, lines = {}, []
+    for node_id, parent, _, detail in rows:
+        depths[node_id] = depths.get(parent, -1) + 1
+        lines.append('  ' * depths[node_id] + detail)
+    return lines
+
+
+def run_console_query(sql: str, max_rows: int = default_console_rows,
+                      timeout: float = default_timeout) -> Iterator[bytes]:
+    """
+    Runs one statement on a read only connection and streams the result as ndjson:
+    {"plan"} first (so it shows even if the query fails), {"headings"} once the query runs, then {"rows"} chunks,
+    then {"rows_total", "time", "truncated", "error"}. Only max_rows rows are read, and a progress handler
+    interrupts the query once it has spent timeout seconds in the database. Time spent waiting for the client
+    to read a chunk doesn't count, so a slow connection can't time out a fast query.
+    """
+    max_rows = max(1, min(max_rows, max_console_rows))
+    total, truncated, error = 0, False, None
+    spent, resumed = 0.0, time.perf_counter()  # The clock only runs between resumed and the next yield
+
+    def pause() -> float:
+        nonlocal spent
+        spent += time.perf_counter() - resumed
+        return spent
+
+    connection = read_only_connection()
+    # Called every 1000 virtual machine instructions, returning True aborts the statement
+    connection.set_progress_handler(lambda: spent + time.perf_counter() - resumed > timeout, 1000)
+    try:
+        plan = query_plan(connection, sql)
+        pause()
+        yield orjson.dumps({'plan': plan}) + b'\n'
+        resumed = time.perf_counter()
+
+        cursor = connection.execute(sql)
+        headings = [column[0] for column in cursor.description] if cursor.description else []
+        pause()
+        yield orjson.dumps({'headings': headings}) + b'\n'
+        resumed = time.perf_counter()
+
+        while total < max_rows:
+            rows = cursor.fetchmany(min(console_chunk_rows, max_rows - total))
+            if not rows:
+                break
+            total += len(rows)
+            pause()
+            yield orjson.dumps({'rows': rows}, default=str) + b'\n'
+            resumed = time.perf_counter()
+        else:
+            # One more row would tell us there was more than we sent
+            truncated = cursor.fetchone() is not None
+    except sqlite3.OperationalError as e:
+        error = f'Query took longer than {timeout} seconds' if str(e) == 'interrupted' else str(e)
+    except (sqlite3.Error, sqlite3.Warning) as e:
+        error = str(e)
+    finally:
+        connection.close()
+
+    yield orjson.dumps({
+        'rows_total': total,
+        'truncated': truncated,
+        'time': pause(),
+        'error': error,
+    }) + b'\n'
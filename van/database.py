@@ -2,7 +2,7 @@ import os
 from pathlib import Path
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import Session
 
 from models import Base
@@ -13,10 +13,53 @@ load_dotenv()
 # If the data folder doesn't exist at the given location, create it
 Path(f'{os.getenv("VLS_DATA_PATH")}').mkdir(parents=True, exist_ok=True)
 
+# Storage profiles are sets of PRAGMAs applied to every new connection,
+# pick one with the VLS_DB_PROFILE environment variable (defaults to 'wal')
+storage_profiles = {
+    # Plain sqlite defaults (rollback journal, full fsync on every commit)
+    'default': {},
+    # Sensors write while the heartbeat, pages and sql console read without blocking them
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',  # WAL only fsyncs on checkpoints, and stays consistent after power loss
+        'cache_size': -16000,  # Negative means KiB, so ~16MB of page cache
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'auto_vacuum': 'INCREMENTAL',  # Lets compaction give deleted pages back (only takes on new databases)
+        'wal_autocheckpoint': 1000,  # Checkpoint back into the database every ~1000 pages (4MB)
+        'journal_size_limit': 16 * 1024 * 1024,  # And truncate the WAL file back down to 16MB afterward
+    },
+    # Same as wal but for hubs short on RAM
+    'low_memory': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'FILE',
+        'auto_vacuum': 'INCREMENTAL',
+        'wal_autocheckpoint': 1000,
+        'journal_size_limit': 4 * 1024 * 1024,
+    },
+}
+
+storage_profile = os.getenv('VLS_DB_PROFILE', 'wal')
+if storage_profile not in storage_profiles:
+    raise ValueError(f'Unknown VLS_DB_PROFILE "{storage_profile}", expected one of {list(storage_profiles)}')
+
 # Create the database
+database_path = f'{os.getenv("VLS_DATA_PATH")}/database.db'
 engine = create_engine(
-    f'sqlite:///{os.getenv("VLS_DATA_PATH")}/database.db',
+    f'sqlite:///{database_path}',
     connect_args={'check_same_thread': False, 'timeout': 1000})
+
+
+@event.listens_for(engine, 'connect')
+def apply_storage_profile(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in storage_profiles[storage_profile].items():
+        cursor.execute(f'PRAGMA {pragma}={value}')
+    cursor.close()
+
 print('<== NOTICE ==>')
 print(__name__)
 print('>============<')
@@ -1,29 +1,41 @@
 import asyncio
 import os
-import timeit
-from typing import Annotated
+from datetime import datetime
+from typing import Annotated, Optional
 
+import orjson
 from fastapi import APIRouter, Form
 from fastapi import Depends
 from fastapi import Request
 from fastapi.exceptions import HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, ORJSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.websockets import WebSocket
-from geopy.exc import GeocoderUnavailable
-from geopy.geocoders import Nominatim
+from fastapi.websockets import WebSocket, WebSocketDisconnect
 from sqlalchemy import desc
 from sqlalchemy.orm import Session
-from sqlalchemy.sql import text
 
-from van.database import get_db
+from geocoding import get_location_namer
+from export import (ExportRequestError, encode_export, export_filename, export_formats, export_statement,
+                    local_export_tables)
+from van.console import default_console_rows, default_timeout, run_console_query
+from van.database import engine, get_db
+from van.events import encode_event, event_bus, event_topics, put_event
+from van.log_files import log_segments
+from van.logtail import LogTailer
 from models import GPSData, TomorrowIO
 from van.scheduling.tools import get_scheduler, schedule_info
+from van.stats import read_stats
+from van.tables import PageRequestError, browsable_tables, fetch_page, sortable_columns
 
+# Endpoints that touch the database or block are plain def, FastAPI runs those in its threadpool
+# so they never hold up the event loop (and the websockets on it)
 endpoints = APIRouter()
 template_path = os.path.abspath(f'{os.getenv("VLS_INSTALL")}/van/static/templates')
 templates = Jinja2Templates(directory=template_path)
 
+# Follows the log files for every client subscribed to the logs topic
+log_tailer = LogTailer(f'{os.getenv("VLS_DATA_PATH")}/logs')
+
 
 @endpoints.get('/control.html', response_class=HTMLResponse)
 async def control_page(request: Request):
@@ -34,20 +46,18 @@ async def control_page(request: Request):
 
 
 @endpoints.get('/hub.html', response_class=HTMLResponse)
-async def hub_page(request: Request, database=Depends(get_db)):
+def hub_page(request: Request, database=Depends(get_db)):
     last_weather: TomorrowIO = database.query(TomorrowIO).order_by(desc('utc_time')).first()
     last_gps = database.query(GPSData).order_by(desc('utc_time')).first()
 
-    weather_location = f'{last_weather.gps_data.latitude}, {last_weather.gps_data.longitude}'
-    geolocator = Nominatim(user_agent=__name__)
+    # Maintained by the writes, so this doesn't scan the tables like COUNT(*) would
+    stats = read_stats(database)
+    tio_count = stats['tio']['rows']
+    gps_count = stats['gps']['rows']
 
-    tio_count = database.query(TomorrowIO).count()
-    gps_count = database.query(GPSData).count()
-    try:
-        weather_location = geolocator.reverse(f'{last_weather.gps_data.latitude}, {last_weather.gps_data.longitude}',
-                                              zoom=10)
-    except GeocoderUnavailable:
-        pass  # Just continue and use the original weather location
+    # Cached name of the town, if it isn't cached yet show the coordinates and look it up in the background
+    weather_location = get_location_namer().name(last_weather.gps_data.latitude, last_weather.gps_data.longitude,
+                                                 zoom=10, wait=False)
 
     weather_time = last_weather.utc_time.astimezone().strftime("%m/%d/%Y, %I:%M:%S %p")
     gps_time = last_gps.utc_time.astimezone().strftime("%m/%d/%Y, %I:%M:%S %p")
@@ -65,21 +75,35 @@ async def hub_page(request: Request, database=Depends(get_db)):
     )
 
 
+# Row counts, time spans and daily ingest of the local tables for the dashboard, read from the maintained statistics
+@endpoints.get('/stats.json', response_class=ORJSONResponse)
+def stats_json(database: Annotated[Session, Depends(get_db)], days: int = 7):
+    if not 0 < days <= 366:
+        raise HTTPException(status_code=400, detail='days must be between 1 and 366')
+    return ORJSONResponse(content=read_stats(database, days))
+
+
 @endpoints.get('/logs.html', response_class=HTMLResponse)
 async def log_page(request: Request):
-    log_files = os.listdir(os.getenv('VLS_DATA_PATH') + '/logs')
-    log_sizes = []
+    logs = log_directory()
+    entries = sorted(os.scandir(logs), key=lambda entry: entry.name)
 
-    for log in log_files:
-        try:
-            size = os.stat(f'{os.getenv("VLS_DATA_PATH")}/logs/{log}').st_size / 1024
-        except FileNotFoundError:
-            size = 0
-
-        log_sizes.append({
-            'name': log,
-            'size': size
-        })
+    # Each live log followed by its rotated segments, newest first
+    log_sizes = []
+    segments = {entry.name for entry in entries if entry.name.endswith('.gz')}
+    for entry in entries:
+        if entry.name.endswith('.gz') or not entry.is_file():
+            continue
+        rotated = []
+        for path in log_segments(entry.path):
+            name = os.path.basename(path)
+            segments.discard(name)
+            rotated.append(log_file_info(path))
+        log_sizes.append({**log_file_info(entry.path), 'segments': rotated})
+
+    # Segments whose live log is gone (renamed or deleted) are still listed so they can be cleaned up
+    for name in sorted(segments, reverse=True):
+        log_sizes.append({**log_file_info(os.path.join(logs, name)), 'segments': []})
 
     context = {'title': 'log.txt', 'log_sizes': log_sizes}
     return templates.TemplateResponse(
@@ -88,58 +112,98 @@ async def log_page(request: Request):
         context=context)
 
 
-@endpoints.websocket('/ws/logs')
-async def websocket_endpoint_log(websocket: WebSocket):
-    await websocket.accept()
-
-    # Define the process for reading logs
-    async def log_reader(n=5):
-        # Create an output object for each log file we can find
-        log_files = os.listdir(os.getenv('VLS_DATA_PATH') + '/logs')
-        output = {log: {'log': []} for log in log_files}
-        for log in log_files:
-            log_file = f'{os.getenv("VLS_DATA_PATH")}/logs/{log}'
-            try:
-                with open(log_file, 'r') as file:
-                    for line in file.readlines()[-n:]:
-                        html_line = f'<p>{line}</p>'
-                        output[log]['log'].append(html_line)
-
-                    file.seek(0, os.SEEK_END)
-                    size = file.tell()
-                    ftype = 'b'
-
-                    if size // 1024 != 0:
-                        size = size / 1024
-                        ftype = 'kb'
-
-                    if size // 1024 != 0:
-                        size = size / 1024
-                        ftype = 'mb'
-
-                    if size // 1024 != 0:
-                        size = size / 1024
-                        ftype = 'gb'
+def log_directory() -> str:
+    return f'{os.getenv("VLS_DATA_PATH")}/logs'
 
-                    output[log]['size'] = size
-                    output[log]['size_type'] = ftype
 
+def log_file_info(path: str) -> dict:
+    try:
+        stat = os.stat(path)
+        size, modified = stat.st_size / 1024, datetime.fromtimestamp(stat.st_mtime).strftime('%m/%d/%Y, %I:%M:%S %p')
+    except FileNotFoundError:
+        size, modified = 0, ''
+    return {'name': os.path.basename(path), 'size': size, 'modified': modified}
+
+
+def log_file_path(log_name: str) -> str:
+    # Only names actually in the log directory, so a request can't reach anything outside it
+    logs = log_directory()
+    if log_name not in os.listdir(logs):
+        raise HTTPException(status_code=404, detail=f'No log named "{log_name}"')
+    return os.path.join(logs, log_name)
+
+
+@endpoints.get('/logs/files/{log_name}')
+def download_log(log_name: str):
+    path = log_file_path(log_name)
+    media_type = 'application/gzip' if log_name.endswith('.gz') else 'text/plain'
+    return FileResponse(path, media_type=media_type, filename=log_name)
+
+
+@endpoints.delete('/logs/{log_name}.json')
+def delete_log(log_name: str):
+    path = log_file_path(log_name)
+    if log_name.endswith('.gz'):
+        os.remove(path)
+    else:
+        # The live log is still open for writing, empty it instead of pulling it out from under the handler
+        with open(path, 'r+') as file:
+            file.truncate(0)
+    return {'deleted': log_name}
+
+
+@endpoints.websocket('/ws/events')
+async def websocket_events(websocket: WebSocket, topics: str = ''):
+    """
+    One socket for all of a page's live updates. Topics are picked with ?topics=gps,weather and changed later
+    by sending {"subscribe": [...]} or {"unsubscribe": [...]}, every message out is {"topic", "time", "data"}.
+    """
+    await websocket.accept()
+    requested = {topic for topic in topics.split(',') if topic}
+    events = event_bus.subscribe(requested & set(event_topics))
 
-            except OSError:
-                with open(log_file, 'w') as file:
-                    pass
+    # The logs topic is fed by the shared log tailer, the backlog first and then only new lines
+    log_forwarder: Optional[asyncio.Task] = None
 
-        return output
+    async def forward_logs():
+        updates = await log_tailer.subscribe()
+        try:
+            while True:
+                put_event(events, encode_event('logs', await updates.get()))
+        finally:
+            log_tailer.unsubscribe(updates)
+
+    def follow_logs(follow: bool):
+        nonlocal log_forwarder
+        if follow and log_forwarder is None:
+            log_forwarder = asyncio.create_task(forward_logs())
+        elif not follow and log_forwarder is not None:
+            log_forwarder.cancel()
+            log_forwarder = None
+
+    async def forward_events():
+        while True:
+            await websocket.send_text(await events.get())
 
+    follow_logs('logs' in requested)
+    forwarder = asyncio.create_task(forward_events())
     try:
         while True:
-            await asyncio.sleep(1)
-            logs = await log_reader(30)
-            await websocket.send_json(logs)
-    except Exception as e:
-        raise e
+            try:
+                message = orjson.loads(await websocket.receive_text())
+                add = set(message.get('subscribe', [])) & set(event_topics)
+                remove = set(message.get('unsubscribe', []))
+            except (ValueError, TypeError, AttributeError):
+                continue  # Not a subscription change, ignore it
+            event_bus.update(events, add=add, remove=remove)
+            if 'logs' in add | remove:
+                follow_logs('logs' in add)
+    except WebSocketDisconnect:
+        pass
     finally:
-        await websocket.close()
+        forwarder.cancel()
+        follow_logs(False)
+        event_bus.unsubscribe(events)
 
 
 @endpoints.get('/sql.html', response_class=HTMLResponse)
@@ -150,62 +214,88 @@ async def sql_page(request: Request):
     )
 
 
-@endpoints.post('/sql.json', response_class=JSONResponse)
-async def sql_json(request: Request,
-                   sql_query: Annotated[str, Form()],
-                   database: Annotated[Session, Depends(get_db)]):
-    # TODO: Add some safety here
-    start = timeit.default_timer()
-    statement = text(sql_query)
-    results = database.execute(statement)
-    headings = [key for key in results._metadata.keys]
-    data = [[item for item in row] for row in results]
-    total_time = timeit.default_timer() - start
-    return JSONResponse(content={
-        'insert': {
-            'headings': headings,
-            'data': data,
-        },
-        'rows': len(data),
-        'time': total_time
-    })
+@endpoints.post('/sql.json')
+def sql_json(sql_query: Annotated[str, Form()],
+             max_rows: Annotated[int, Form()] = default_console_rows,
+             timeout: Annotated[float, Form()] = default_timeout):
+    # Read only connection, bounded rows and time, streamed as ndjson chunks (see van/console.py)
+    return StreamingResponse(run_console_query(sql_query, max_rows=max_rows, timeout=min(timeout, 30)),
+                             media_type='application/x-ndjson')
 
 
-@endpoints.get('/gps.html', response_class=HTMLResponse)
-async def gps_page(request: Request, database: Annotated[Session, Depends(get_db)]):
-    gps_query = database.query(GPSData)
-    all_headers = GPSData.__table__.columns.keys()
-    headers = GPSData.__table__.columns.keys()
-    data = [row.as_list() for row in gps_query.all()]
+def data_page(request: Request, table_name: str, data_type: str):
+    # Only the headers are rendered, data.js fetches the rows a page at a time from /api/<table>.json
+    model = browsable_tables[table_name]
     return templates.TemplateResponse(
         request=request,
         name='data.html',
         context={
-            'data_type': 'GPS',
-            'all_headers': all_headers,
-            'headers': headers,
-            'data': data
+            'data_type': data_type,
+            'table_name': table_name,
+            'all_headers': model.__table__.columns.keys(),
+            'sortable': sortable_columns(model),
         }
     )
 
 
+@endpoints.get('/gps.html', response_class=HTMLResponse)
+async def gps_page(request: Request):
+    return data_page(request, 'gps', 'GPS')
+
+
 @endpoints.get('/tio.html', response_class=HTMLResponse)
-async def tio_page(request: Request, database: Annotated[Session, Depends(get_db)]):
-    tio_query = database.query(TomorrowIO)
-    all_headers = TomorrowIO.__table__.columns.keys()
-    print(all_headers)
-    headers = TomorrowIO.__table__.columns.keys()
-    data = [row.as_list() for row in tio_query.all()]
-    return templates.TemplateResponse(
-        request=request,
-        name='data.html',
-        context={
-            'data_type': 'TomorrowIO',
-            'all_headers': all_headers,
-            'headers': headers,
-            'data': data
-        }
-    )
+async def tio_page(request: Request):
+    return data_page(request, 'tio', 'TomorrowIO')
+
+
+# GPS history older than a week, averaged down by the compaction job
+@endpoints.get('/gps_rollup.html', response_class=HTMLResponse)
+async def gps_rollup_page(request: Request):
+    return data_page(request, 'gps_rollup', 'GPS History')
+
+
+@endpoints.get('/api/{table_name}.json', response_class=ORJSONResponse)
+def table_json(table_name: str,
+               database: Annotated[Session, Depends(get_db)],
+               limit: int = 100,
+               sort: str = 'id',
+               order: str = 'desc',
+               after: Optional[str] = None,
+               columns: Optional[str] = None):
+    if table_name not in browsable_tables:
+        raise HTTPException(status_code=404, detail=f'No table named "{table_name}"')
+    if order not in ('asc', 'desc'):
+        raise HTTPException(status_code=400, detail='order must be "asc" or "desc"')
+
+    try:
+        page = fetch_page(database, browsable_tables[table_name],
+                          columns=columns.split(',') if columns else None,
+                          sort=sort,
+                          descending=order == 'desc',
+                          after=after,
+                          limit=limit)
+    except PageRequestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return ORJSONResponse(content=page)
+
+
+@endpoints.get('/export/{table_name}.{fmt}')
+def export_table(table_name: str, fmt: str, start: Optional[str] = None, end: Optional[str] = None):
+    try:
+        columns, statement = export_statement(table_name, fmt, start=start, end=end, tables=local_export_tables)
+    except ExportRequestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Our own connection, since the response is still streaming after the endpoint (and get_db) returns
+    def chunks():
+        with engine.connect() as connection:
+            yield from connection.execute(statement).partitions()
+
+    return StreamingResponse(
+        encode_export(fmt, columns, chunks()),
+        media_type=export_formats[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{export_filename(table_name, fmt, start, end)}"'})
 
 
 @endpoints.get('/schedule.html', response_class=HTMLResponse)
@@ -0,0 +1,85 @@
+import asyncio
+import datetime
+import logging
+import threading
+from typing import Iterable, Optional
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Topics the dashboard can subscribe to, logs comes from the log tailer instead of the bus
+event_topics = ('gps', 'weather', 'heartbeat', 'scheduler', 'logs')
+
+
+def encode_event(topic: str, data) -> str:
+    return orjson.dumps({'topic': topic, 'time': datetime.datetime.now(datetime.timezone.utc), 'data': data},
+                        default=str).decode()
+
+
+def put_event(queue: asyncio.Queue, event: str):
+    # A client that stopped reading loses its oldest event rather than growing without bound
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+class EventBus:
+    """
+    In-process publish/subscribe for the hub's live updates. Sensors, the heartbeat and the scheduler
+    publish to a topic, every websocket subscribed to that topic gets the event in its queue.
+    An event is encoded once however many clients are listening, and publishing to a topic
+    nobody is subscribed to costs nothing. publish() can be called from any thread.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: dict[asyncio.Queue, set[str]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def listening(self, topic: str) -> bool:
+        return any(topic in topics for topics in list(self._subscribers.values()))
+
+    def subscribe(self, topics: Iterable[str] = ()) -> asyncio.Queue:
+        """Returns a queue of encoded events for the topics, call from the event loop"""
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[queue] = set(topics)
+        return queue
+
+    def update(self, queue: asyncio.Queue, add: Iterable[str] = (), remove: Iterable[str] = ()):
+        with self._lock:
+            topics = self._subscribers.get(queue)
+            if topics is not None:
+                topics.update(add)
+                topics.difference_update(remove)
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def publish(self, topic: str, data):
+        if self._loop is None or not self.listening(topic):
+            return
+        event = encode_event(topic, data)
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver(topic, event)
+        elif not self._loop.is_closed():
+            # Queues belong to the event loop, hand the event over from worker threads
+            self._loop.call_soon_threadsafe(self._deliver, topic, event)
+
+    def _deliver(self, topic: str, event: str):
+        with self._lock:
+            queues = [queue for queue, topics in self._subscribers.items() if topic in topics]
+        for queue in queues:
+            put_event(queue, event)
+
+
+event_bus = EventBus()
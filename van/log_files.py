@@ -0,0 +1,145 @@
+import gzip
+import logging
+import os
+import queue
+import shutil
+import time
+from datetime import datetime
+from logging.handlers import BaseRotatingHandler, QueueHandler, QueueListener
+from typing import Optional
+
+log_format = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+class CompressingRotatingFileHandler(BaseRotatingHandler):
+    """
+    File handler that starts a new segment once the file passes max_bytes or is rotate_seconds old.
+    The old segment is gzipped to <name>.<timestamp>.gz, then the oldest segments are deleted until
+    at most backup_count remain and they take up no more than max_total_bytes together.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 5 * 1024 * 1024, rotate_seconds: float = 24 * 60 * 60,
+                 backup_count: int = 10, max_total_bytes: int = 50 * 1024 * 1024):
+        super().__init__(filename, mode='a', encoding='utf-8', delay=False)
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.max_total_bytes = max_total_bytes
+
+        # Age is counted from when we opened the file, a restart starts the clock over
+        self.opened = time.time()
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.stream is None:
+            self.stream = self._open()
+        if self.max_bytes and self.stream.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self.opened >= self.rotate_seconds
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            # Microseconds so a burst of rotations still gets names that sort in the order they were written
+            segment = f'{self.baseFilename}.{datetime.now().strftime("%Y%m%d-%H%M%S-%f")}'
+            while os.path.exists(f'{segment}.gz'):
+                segment = f'{self.baseFilename}.{datetime.now().strftime("%Y%m%d-%H%M%S-%f")}'
+            os.rename(self.baseFilename, segment)
+            with open(segment, 'rb') as source, gzip.open(f'{segment}.gz', 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(segment)
+            self.prune()
+
+        self.stream = self._open()
+        self.opened = time.time()
+
+    def prune(self):
+        """Deletes the oldest compressed segments past backup_count or max_total_bytes"""
+        for path in log_segments(self.baseFilename)[self.backup_count:]:
+            os.remove(path)
+
+        total = 0
+        for path in log_segments(self.baseFilename):
+            total += os.path.getsize(path)
+            if total > self.max_total_bytes:
+                os.remove(path)
+
+
+def log_segments(log_path: str) -> list[str]:
+    """Compressed rotated segments of a log, newest first (the timestamps sort by age)"""
+    directory, name = os.path.split(log_path)
+    segments = [entry for entry in os.listdir(directory or '.')
+                if entry.startswith(f'{name}.') and entry.endswith('.gz')]
+    return [os.path.join(directory, entry) for entry in sorted(segments, reverse=True)]
+
+
+class RoutedQueueHandler(QueueHandler):
+    """Puts records on the shared queue tagged with the log file they belong in"""
+
+    def __init__(self, log_queue: queue.Queue, log_file: str):
+        super().__init__(log_queue)
+        self.log_file = log_file
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        record.log_file = self.log_file
+        return record
+
+
+class LogFileFilter(logging.Filter):
+    def __init__(self, log_file: str):
+        super().__init__()
+        self.log_file = log_file
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return getattr(record, 'log_file', None) == self.log_file
+
+
+def setup_log_files(directory: str, logging_map: dict[str, str],
+                    max_bytes: int = 5 * 1024 * 1024,
+                    rotate_seconds: float = 24 * 60 * 60,
+                    backup_count: int = 10,
+                    max_total_bytes: int = 50 * 1024 * 1024,
+                    level: int = logging.INFO) -> QueueListener:
+    """
+    Sends each logger in logging_map ({file name: logger name}) to <directory>/<file name>.log.
+    Loggers only put records on a queue, and one listener thread does the formatting, writing,
+    rotating and compressing, so request handlers never wait on the SD card.
+    Returns the started listener, stop() it on shutdown to flush what's left.
+    """
+    log_queue: queue.Queue = queue.Queue(-1)
+    formatter = logging.Formatter(log_format)
+
+    handlers = []
+    for log_file, logger_name in logging_map.items():
+        handler = CompressingRotatingFileHandler(os.path.join(directory, f'{log_file}.log'),
+                                                 max_bytes=max_bytes,
+                                                 rotate_seconds=rotate_seconds,
+                                                 backup_count=backup_count,
+                                                 max_total_bytes=max_total_bytes)
+        handler.setFormatter(formatter)
+        handler.addFilter(LogFileFilter(log_file))
+        handlers.append(handler)
+
+        log = logging.getLogger(logger_name)
+        log.setLevel(level)
+        log.addHandler(RoutedQueueHandler(log_queue, log_file))
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def stop_log_files(listener: Optional[QueueListener], logging_map: dict[str, str]):
+    """Flushes the queue, closes the files and takes the queue handlers back off the loggers"""
+    for logger_name in logging_map.values():
+        log = logging.getLogger(logger_name)
+        for handler in [h for h in log.handlers if isinstance(h, RoutedQueueHandler)]:
+            log.removeHandler(handler)
+
+    if listener:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
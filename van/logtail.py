@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TailState:
+    inode: int
+    offset: int  # Bytes of the file we've already sent out
+    partial: bytes = b''  # Text after the last newline, held until the line is finished
+
+
+def tail_lines(path: str, n: int, end: Optional[int] = None, block_size: int = 8192) -> list[str]:
+    """The last n lines before byte end of a file, read backwards in blocks so big logs cost the same as small"""
+    with open(path, 'rb') as file:
+        position = end if end is not None else file.seek(0, os.SEEK_END)
+        data = b''
+        while position > 0 and data.count(b'\n') <= n:
+            read = min(block_size, position)
+            position -= read
+            file.seek(position)
+            data = file.read(read) + data
+    lines = data.decode('utf-8', 'replace').splitlines()
+    return lines[-n:] if n else []
+
+
+class LogTailer:
+    """
+    Follows every log file in a directory for every client following the logs at once. Each file's offset is
+    tracked so a poll only reads the bytes appended since the last one, truncated or rotated files
+    (smaller than our offset, or a new inode) start over from the beginning, and new lines are fanned out
+    to every subscriber's queue. Nothing is read or sent while nothing changes, and the polling task
+    only runs while someone is subscribed.
+    """
+
+    def __init__(self, directory: str, interval: float = 1.0, backlog_lines: int = 30,
+                 max_read: int = 256 * 1024, queue_size: int = 100):
+        self.directory = directory
+        self.interval = interval
+        self.backlog_lines = backlog_lines
+        self.max_read = max_read  # Most bytes read from one file per poll, a burst is spread over a few polls
+        self.queue_size = queue_size
+
+        self._files: dict[str, TailState] = {}
+        # Each subscriber's queue and the poll its backlog covers, so it only gets changes from later polls
+        self._subscribers: dict[asyncio.Queue, int] = {}
+        self._generation = 0  # Polls so far
+        self._lock = threading.RLock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _log_files(self) -> dict[str, os.stat_result]:
+        # Rotated segments are compressed and never change, only follow the live files
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return {}
+        return {entry.name: entry.stat() for entry in entries
+                if entry.is_file() and not entry.name.endswith('.gz')}
+
+    def poll(self) -> tuple[int, dict[str, dict]]:
+        """
+        Reads whatever was appended to each log since the last poll,
+        returns the poll's number and {name: {'lines', 'size'}} for the files that changed
+        """
+        changes = {}
+        with self._lock:
+            self._generation += 1
+            files = self._log_files()
+            for name in list(self._files):
+                if name not in files:
+                    del self._files[name]
+
+            for name, stat in files.items():
+                state = self._files.get(name)
+                if state is None:
+                    # A file we haven't seen, its existing contents are backlog, so start following at the end
+                    self._files[name] = TailState(stat.st_ino, stat.st_size)
+                    changes[name] = {'lines': [], 'size': stat.st_size}
+                    continue
+
+                if stat.st_ino != state.inode or stat.st_size < state.offset:
+                    # Rotated (a new file under the same name) or truncated, read it from the top
+                    state.inode, state.offset, state.partial = stat.st_ino, 0, b''
+                    changes[name] = {'lines': [], 'size': stat.st_size, 'reset': True}
+
+                if stat.st_size == state.offset:
+                    continue
+
+                try:
+                    with open(os.path.join(self.directory, name), 'rb') as file:
+                        file.seek(state.offset)
+                        data = file.read(self.max_read)
+                except OSError:
+                    continue
+                state.offset += len(data)
+
+                # Only whole lines go out, the end of an unfinished line waits for the next poll
+                data = state.partial + data
+                complete, _, state.partial = data.rpartition(b'\n')
+                change = changes.setdefault(name, {'lines': [], 'size': stat.st_size})
+                if complete:
+                    change['lines'] = complete.decode('utf-8', 'replace').split('\n')
+            return self._generation, changes
+
+    def snapshot(self) -> tuple[int, dict[str, dict], dict[str, dict]]:
+        """
+        Polls, then takes the last backlog_lines of every log up to exactly where that poll read to.
+        Returns the poll's number, its changes (for the existing subscribers) and the snapshot.
+        """
+        snapshot = {}
+        with self._lock:
+            generation, changes = self.poll()
+            for name, state in self._files.items():
+                try:
+                    lines = tail_lines(os.path.join(self.directory, name), self.backlog_lines,
+                                       end=state.offset - len(state.partial))
+                except OSError:
+                    lines = []
+                snapshot[name] = {'lines': lines, 'size': state.offset, 'reset': True}
+        return generation, changes, snapshot
+
+    def publish(self, generation: int, changes: dict[str, dict]):
+        for queue, since in self._subscribers.items():
+            if generation <= since:
+                continue  # Already part of this subscriber's backlog
+            if queue.full():
+                # A client that stopped reading loses its oldest update rather than growing without bound
+                queue.get_nowait()
+            queue.put_nowait({'files': changes})
+
+    async def subscribe(self) -> asyncio.Queue:
+        """Returns a queue that gets the backlog of every log first, then only what's new"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+
+        # The poll behind the snapshot also has news for the existing subscribers
+        generation, changes, snapshot = await asyncio.to_thread(self.snapshot)
+        if changes:
+            self.publish(generation, changes)
+        queue.put_nowait({'files': snapshot})
+        self._subscribers[queue] = generation
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.pop(queue, None)
+
+    async def _run(self):
+        while self._subscribers:
+            await asyncio.sleep(self.interval)
+            try:
+                generation, changes = await asyncio.to_thread(self.poll)
+            except Exception:
+                logger.exception('Failed to read the logs')
+                continue
+            if changes:
+                self.publish(generation, changes)
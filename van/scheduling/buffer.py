@@ -0,0 +1,64 @@
+import logging
+import threading
+import timeit
+from typing import Optional
+
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session
+
+from models import Base
+from van.stats import count_readings
+
+logger = logging.getLogger(__name__)
+
+
+class SensorBuffer:
+    """
+    Write-behind buffer for sensor readings. Readings are held in memory and
+    written together in one transaction once max_readings have piled up or
+    when flush() is called by the timed flush job/shutdown, so the SD card sees
+    one commit per batch instead of one per reading.
+    """
+
+    def __init__(self, engine: Engine, max_readings: int = 20):
+        self.engine = engine
+        self.max_readings = max_readings
+        self._pending: list[Base] = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, reading: Base, max_readings: Optional[int] = None) -> bool:
+        """
+        Queues a reading, returns True if the buffer is full and should be flushed.
+        max_readings lets a sensor ask for a smaller batch than the buffer's own.
+        """
+        limit = min(self.max_readings, max_readings) if max_readings else self.max_readings
+        with self._lock:
+            self._pending.append(reading)
+            return len(self._pending) >= limit
+
+    def flush(self) -> int:
+        """Writes every queued reading in a single transaction and returns how many were written"""
+        with self._lock:
+            readings, self._pending = self._pending, []
+
+        if not readings:
+            return 0
+
+        start = timeit.default_timer()
+        try:
+            with Session(self.engine) as session:
+                session.add_all(readings)
+                # The statistics are updated in the same transaction so they always match the tables
+                count_readings(session, readings)
+                session.commit()
+        except Exception:
+            # Put the readings back so the next flush tries them again
+            with self._lock:
+                self._pending = readings + self._pending
+            raise
+
+        logger.info(f'Flushed {len(readings)} sensor readings in {timeit.default_timer() - start}')
+        return len(readings)
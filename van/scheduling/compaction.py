@@ -0,0 +1,77 @@
+import logging
+import time
+import timeit
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Engine, Integer, cast, delete, func, insert, select, text
+from sqlalchemy.orm import Session
+
+from models import GPSData, GPSRollup, Heartbeat, SyncWatermark, TomorrowIO
+from van.stats import count_changed
+
+logger = logging.getLogger(__name__)
+
+
+def acknowledged_id(session: Session, table_name: str) -> int:
+    """Highest id the website has confirmed for this sync table (0 if none)"""
+    mark = session.get(SyncWatermark, table_name)
+    return mark.last_id if mark else 0
+
+
+def compact(engine: Engine, keep: timedelta = timedelta(days=7), bucket_seconds: int = 60) -> dict:
+    """
+    Shrinks the local history. GPS points older than keep that the website has already
+    acknowledged are averaged into one GPSRollup row per bucket_seconds and deleted,
+    acknowledged heartbeats older than keep are deleted outright. Points a weather reading
+    still refers to are left alone. Returns how many rows were removed from each table.
+    """
+    start = timeit.default_timer()
+
+    # Heartbeats from before they were recorded in utc hold local time, they're off by the utc offset
+    # (a few hours against a keep of days) so at worst they're pruned a little early or late, and they're
+    # left as is since nothing records which offset they were written with.
+    # Line the cutoff up with a bucket boundary so one run never splits a bucket with the next
+    cutoff = datetime.fromtimestamp((time.time() - keep.total_seconds()) // bucket_seconds * bucket_seconds,
+                                    timezone.utc).replace(tzinfo=None)
+
+    with Session(engine) as session:
+        gps_done = (
+            (GPSData.utc_time < cutoff)
+            & (GPSData.id <= acknowledged_id(session, 'gps'))
+            & GPSData.id.not_in(select(TomorrowIO.gps_id))
+        )
+
+        # Average each bucket of old points into a single rollup row
+        bucket = cast(func.strftime('%s', GPSData.utc_time), Integer) // bucket_seconds * bucket_seconds
+        rollup = (
+            select(func.datetime(bucket, 'unixepoch'),
+                   func.avg(GPSData.latitude),
+                   func.avg(GPSData.longitude),
+                   func.avg(GPSData.altitude),
+                   func.avg(GPSData.ground_speed),
+                   func.count())
+            .where(gps_done)
+            .group_by(bucket)
+        )
+        rollups_added = session.execute(insert(GPSRollup).from_select(
+            ['utc_time', 'latitude', 'longitude', 'altitude', 'ground_speed', 'samples'], rollup)).rowcount
+        gps_removed = session.execute(delete(GPSData).where(gps_done)).rowcount
+
+        # Heartbeats only matter to the website once they're uploaded
+        heartbeat_removed = session.execute(delete(Heartbeat).where(
+            (Heartbeat.time_utc < cutoff) & (Heartbeat.id <= acknowledged_id(session, 'heartbeat'))
+        )).rowcount
+
+        count_changed(session, 'gps_rollup', rollups_added)
+        count_changed(session, 'gps', -gps_removed)
+        count_changed(session, 'heartbeat', -heartbeat_removed)
+        session.commit()
+
+    # Hand the freed pages back to the filesystem (a no-op unless auto_vacuum is INCREMENTAL)
+    with engine.connect() as connection:
+        connection.execute(text('PRAGMA incremental_vacuum'))
+        connection.commit()
+
+    logger.info(f'Compacted {gps_removed} gps and {heartbeat_removed} heartbeat rows '
+                f'in {timeit.default_timer() - start}')
+    return {'gps': gps_removed, 'heartbeat': heartbeat_removed}
@@ -1,12 +1,18 @@
+import asyncio
 import logging
 import timeit
+from datetime import timedelta
 from functools import partial
 
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, JobExecutionEvent
 from apscheduler.job import Job
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from sqlalchemy import Engine
 from sqlalchemy.orm import Session
 
+from van.events import event_bus
+from van.scheduling.buffer import SensorBuffer
+from van.scheduling.compaction import compact
 from van.sensors import Sensor
 
 logger = logging.getLogger(__name__)
@@ -18,38 +24,55 @@ def get_scheduler():
     return scheduler
 
 
-def schedule_sensors(sensors: list[Sensor], database: Engine):
-    """This takes a list of sensors and records their output to the provided database."""
+def schedule_sensors(sensors: list[Sensor], database: Engine,
+                     batch_size: int = 20, batch_seconds: int = 60) -> SensorBuffer:
+    """
+    This takes a list of sensors and records their output to the provided database.
+    Readings are written behind through a SensorBuffer, flushed every batch_size readings
+    (or a sensor's own batch_size if it's smaller) or batch_seconds seconds,
+    the buffer is returned so it can be flushed on shutdown.
+    Each sensor's record on change policy decides which readings make it into the buffer.
+    """
+    buffer = SensorBuffer(database, max_readings=batch_size)
 
     # Methodology for scheduling sensors
-    async def schedule_sensor(s: Sensor, db: Engine):
+    async def schedule_sensor(s: Sensor, sensor_buffer: SensorBuffer):
         # Get the start time so we can check runtime
         start = timeit.default_timer()
 
-        # Create a database session and commit the data
-        with Session(db) as session:
-            data = s.get_data()
+        # Queue the data, the buffer writes it out with everything else in its batch
+        data = s.get_data()
 
-            if data:
-                session.add(data)
-                session.commit()
+        if data:
+            # Every reading goes out live (only costs anything while a dashboard is listening), even ones not recorded
+            if event_bus.listening(s.topic):
+                event_bus.publish(s.topic, s.as_event(data))
 
-                # Calculate and log the time to get data and commit
-                sensor_time = timeit.default_timer() - start
-                logger.info(f'Recorded {s.data_type} sensor data in {sensor_time}')
+            # Readings that haven't changed enough since the last recorded one are dropped
+            if not s.should_record(data):
+                logger.debug(f'Skipped unchanged {s.name} sensor data ({s.skipped} skipped so far)')
                 return
 
-            # Calculate and log the time to get data and commit
+            if sensor_buffer.add(data, s.batch_size):
+                await asyncio.to_thread(sensor_buffer.flush)
+
+            # Calculate and log the time to get data and buffer it
             sensor_time = timeit.default_timer() - start
-            logger.info(f'Failed to record {s.data_type} sensor data in {sensor_time}')
+            logger.info(f'Recorded {s.name} sensor data in {sensor_time}')
+            return
 
+        # Calculate and log the time to get data
+        sensor_time = timeit.default_timer() - start
+        logger.info(f'Failed to record {s.name} sensor data in {sensor_time}')
 
     # Now that we've defined the method that logs the data,
-    # We create a partial function by binding the above method to the database and each sensor
+    # We create a partial function by binding the above method to the buffer and each sensor
     # And then schedule the sensor to run on a set interval
     for sensor in sensors:
         sensor: Sensor
-        report_sensor = partial(schedule_sensor, sensor, database)
+        if not sensor.enabled:
+            continue
+        report_sensor = partial(schedule_sensor, sensor, buffer)
         scheduler.add_job(report_sensor, 'interval',
                           id=sensor.schedule_config['id'],
                           name=sensor.schedule_config['description'],
@@ -58,6 +81,50 @@ def schedule_sensors(sensors: list[Sensor], database: Engine):
     # ** sensor.default_schedule,
     # name = sensor.sensor_description)
 
+    # Make sure quiet sensors still get written within batch_seconds
+    async def flush_buffer(sensor_buffer: SensorBuffer):
+        await asyncio.to_thread(sensor_buffer.flush)
+
+    scheduler.add_job(partial(flush_buffer, buffer), 'interval',
+                      id='flush_sensors',
+                      name='Write buffered sensor readings to the database.',
+                      seconds=batch_seconds)
+
+    return buffer
+
+
+def schedule_compaction(database: Engine, keep_days: int = 7, bucket_seconds: int = 60, hours: int = 6):
+    """
+    Schedules the retention job, which keeps full resolution data for keep_days,
+    averages older uploaded gps points into bucket_seconds rollups and prunes uploaded heartbeats.
+    """
+    async def run_compaction(db: Engine):
+        await asyncio.to_thread(compact, db, timedelta(days=keep_days), bucket_seconds)
+
+    scheduler.add_job(partial(run_compaction, database), 'interval',
+                      id='compact_history',
+                      name='Downsample and prune uploaded sensor history.',
+                      hours=hours)
+
+
+def publish_job_events():
+    """Publishes every job run, failure and missed run to the scheduler topic of the event bus"""
+    kinds = {EVENT_JOB_EXECUTED: 'executed', EVENT_JOB_ERROR: 'error', EVENT_JOB_MISSED: 'missed'}
+
+    def job_event(event: JobExecutionEvent):
+        if not event_bus.listening('scheduler'):
+            return
+        job = scheduler.get_job(event.job_id)
+        event_bus.publish('scheduler', {
+            'id': event.job_id,
+            'event': kinds.get(event.code, str(event.code)),
+            'scheduled_run_time': event.scheduled_run_time,
+            'next_run_time': job.next_run_time if job else None,
+            'exception': repr(event.exception) if event.exception else None,
+        })
+
+    scheduler.add_listener(job_event, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+
 
 def schedule_info(job: Job):
     """Helper method to return a dict of useful information about a scheduled job"""
@@ -1,23 +1,12 @@
 from van.sensors.abstracts import Sensor
 from van.sensors.gps import GPS
 from van.sensors.tomorrow_io import TIO
+from van.sensors.registry import build_sensors, load_sensor_config, sensor_types
 
 
 # This method will return sensor objects based
-# on active sensors for the server to listen to.
-# Every sensor running on the server should be initialized here
+# on the sensor config (see van/sensors/registry.py) for the server to listen to.
+# New sensor types need adding to sensor_types in the registry
 # If development is true, it will pass that to sensors and generate false data
 def activate_sensors(development: bool = False) -> list[Sensor]:
-    # GPS Sensor
-
-    gps_sensor = GPS(location='/dev/ttyACM0', baud=9600, development=development,
-                     default_schedule={'seconds': 10})
-
-    # TIO is a weather API sensor
-    tio_sensor = TIO(gps_sensor, development=development,
-                     default_schedule={'minutes': 3})
-
-    return [
-        gps_sensor,
-        #tio_sensor
-    ]
+    return build_sensors(load_sensor_config(), development=development)
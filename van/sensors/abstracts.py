@@ -1,18 +1,46 @@
+import time
+from datetime import datetime
 from abc import ABC, abstractmethod
+from types import SimpleNamespace
 from typing import Optional
 
 from models import Base
 
 
 class Sensor(ABC):
-    def __init__(self, development: bool = False, default_schedule = None):
+    # Sampling policy defaults, subclasses override these and the sensor config can override them per sensor
+    default_interval: dict = {'minutes': 1}
+    # Field -> minimum change needed before a new reading is recorded, empty records every reading
+    default_thresholds: dict = {}
+    # Flush the write buffer once this many readings are waiting, None leaves it to the shared buffer size
+    default_batch_size: Optional[int] = None
+    # Record a reading at least this often even if nothing changed, so we can tell the sensor is alive
+    default_max_quiet_seconds: Optional[float] = None
+    # Event bus topic live readings are published on, None uses the sensor's name
+    default_topic: Optional[str] = None
+
+    def __init__(self, development: bool = False, default_schedule=None, name: Optional[str] = None,
+                 batch_size: Optional[int] = None, record_on_change: Optional[dict] = None,
+                 max_quiet_seconds: Optional[float] = None, enabled: bool = True):
         self.development = development
+        # Disabled sensors exist only to feed other sensors, they aren't scheduled
+        self.enabled = enabled
+        self.name = name if name else self.data_type
+        self.topic = self.default_topic if self.default_topic else self.name
         self.schedule_config = {
-            'id': f'record_{self.data_type}',
-            'description': f'Automatically scheduled for recording {self.data_type} sensor data.'
+            'id': f'record_{self.name}',
+            'description': f'Automatically scheduled for recording {self.name} sensor data.'
         }
 
-        self.default_schedule = default_schedule if default_schedule else {'minutes': 1}
+        self.default_schedule = default_schedule if default_schedule else dict(self.default_interval)
+        self.batch_size = batch_size if batch_size is not None else self.default_batch_size
+        self.record_on_change = record_on_change if record_on_change is not None else dict(self.default_thresholds)
+        self.max_quiet_seconds = max_quiet_seconds if max_quiet_seconds is not None else self.default_max_quiet_seconds
+
+        # The last reading we actually recorded, and when, for the record on change check
+        self._last_recorded: Optional[SimpleNamespace] = None
+        self._last_recorded_at = 0.0
+        self.skipped = 0
 
     @property
     @abstractmethod
@@ -23,10 +51,48 @@ class Sensor(ABC):
     def get_data(self) -> Optional[Base]:
         pass
 
+    def changed(self, previous: SimpleNamespace, reading: Base) -> bool:
+        """Returns True if the reading differs enough from the previous recorded one to be worth recording"""
+        return fields_changed(previous, reading, self.record_on_change)
+
+    def should_record(self, reading: Base) -> bool:
+        """Applies the record on change policy, remembering the reading if it should be recorded"""
+        now = time.monotonic()
+        if (self.record_on_change and self._last_recorded is not None
+                and not self.changed(self._last_recorded, reading)
+                and (self.max_quiet_seconds is None or now - self._last_recorded_at < self.max_quiet_seconds)):
+            self.skipped += 1
+            return False
+
+        # Keep a plain copy, the reading itself is expired once the buffer commits it
+        self._last_recorded = SimpleNamespace(**{column.key: getattr(reading, column.key)
+                                                 for column in reading.__table__.columns})
+        self._last_recorded_at = now
+        return True
+
+    def as_event(self, reading: Base) -> dict:
+        """The reading as published to the event bus, stamped now if the database hasn't given it a time yet"""
+        event = {column.key: getattr(reading, column.key) for column in reading.__table__.columns}
+        if event.get('utc_time') is None:
+            event['utc_time'] = datetime.utcnow()
+        return event
+
     def shutdown(self):
         pass
 
 
+def fields_changed(previous: SimpleNamespace, reading: Base, thresholds: dict) -> bool:
+    """Returns True if any field moved at least its threshold, non-numeric fields count any change"""
+    for field, threshold in thresholds.items():
+        old, new = getattr(previous, field, None), getattr(reading, field, None)
+        if old is None or new is None or not isinstance(new, (int, float)):
+            if old != new:
+                return True
+        elif abs(new - old) >= threshold:
+            return True
+    return False
+
+
 class MalformedDataPointException(Exception):
     def __init__(self, msg):
         super().__init__(msg)
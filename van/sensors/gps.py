@@ -1,26 +1,72 @@
+import calendar
 import logging
+import math
 import threading
 import datetime
-from typing import Optional
+import time
+from types import SimpleNamespace
+from typing import NamedTuple, Optional
 
 import serial
 from serial import SerialException
 
 from models import GPSData
-from van.sensors.abstracts import Sensor
+from van.sensors.abstracts import Sensor, fields_changed
+from van.sensors.gps_replay import CaptureWriter, ReplaySource
 
 logger = logging.getLogger(__name__)
 
 
+class Fix(NamedTuple):
+    """One complete, immutable GPS reading. GPSManager swaps these in whole, so readers never see half a fix"""
+    time: Optional[float]  # UTC timestamp reported by the receiver
+    received: float  # Local timestamp the fix was parsed at
+    source: str  # Sentence the position came from, e.g. GNGGA
+    latitude: float
+    longitude: float
+    altitude: Optional[float]
+    fix_quality: str
+    satellites_used: int
+    hdop: Optional[float]
+    true_track: Optional[float]
+    magnetic_track: Optional[float]
+    ground_speed: Optional[float]
+
+
+def distance_meters(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great circle (haversine) distance between two points, plenty accurate for the few meters we care about"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * 6371008.8 * math.asin(math.sqrt(a))
+
+
 class GPS(Sensor):
-    def __init__(self, location: str = '/dev/ttyACM0', baud: int = 9600, development: bool = False, **kwargs):
+    # Parked overnight the position only wanders by the receiver's noise,
+    # so we only record once the van has moved, or every 10 minutes regardless
+    default_interval = {'seconds': 10}
+    default_thresholds = {'distance': 10.0}
+    default_max_quiet_seconds = 600
+
+    def __init__(self, location: str = '/dev/ttyACM0', baud: int = 9600, development: bool = False,
+                 max_age: float = 30, replay: Optional[str] = None, replay_speed: float = 1.0,
+                 capture: Optional[str] = None, **kwargs):
         super().__init__(development=development, **kwargs)
 
+        # Fixes older than this many seconds aren't recorded (lost signal, unplugged receiver)
+        self.max_age = max_age
+
+        # Replaying a capture file stands in for the receiver entirely
+        if replay:
+            self.manager = GPSManager(source=ReplaySource(replay, speed=replay_speed, loop=True))
+            logger.info(f'Launched GPSManager replaying "{replay}" at {replay_speed}x')
+            return
+
         # The following code tries to launch the GPSManager using specified location and baud
         # If it can not it will either switch to fake data is development is true, otherwise raise an exception
         self.manager: Optional[GPSManager] = None
         try:
-            self.manager = GPSManager(location, baud)
+            self.manager = GPSManager(location, baud, capture=capture)
             logger.info(f'Successfully launched GPSManager at location "{location}" and baud "{baud}"')
         except SerialException as exception:
             if development:
@@ -36,17 +82,20 @@ class GPS(Sensor):
 
     def get_data(self) -> Optional[GPSData]:
         if self.manager:
-            return GPSData(**self.manager.get_dict([
-                'latitude',
-                'longitude',
-                'altitude',
-                'fix_quality',
-                'satellites_used',
-                'hdop',
-                'true_track',
-                'magnetic_track',
-                'ground_speed'
-            ]))
+            fix = self.manager.latest
+            if fix is None or time.time() - fix.received > self.max_age:
+                return None
+            return GPSData(
+                latitude=fix.latitude,
+                longitude=fix.longitude,
+                altitude=fix.altitude,
+                fix_quality=fix.fix_quality,
+                satellites_used=fix.satellites_used,
+                hdop=fix.hdop,
+                true_track=fix.true_track,
+                magnetic_track=fix.magnetic_track,
+                ground_speed=fix.ground_speed,
+            )
 
         # Otherwise we need to return a fake data point
         return GPSData(
@@ -61,12 +110,24 @@ class GPS(Sensor):
             ground_speed=None,
         )
 
+    def changed(self, previous: SimpleNamespace, reading: GPSData) -> bool:
+        # 'distance' is meters moved, every other threshold is a plain field difference
+        thresholds = dict(self.record_on_change)
+        min_distance = thresholds.pop('distance', None)
+        if min_distance is not None:
+            moved = distance_meters(previous.latitude, previous.longitude, reading.latitude, reading.longitude)
+            if moved >= min_distance:
+                return True
+
+        return fields_changed(previous, reading, thresholds)
+
     def shutdown(self):
         if self.manager:
             self.manager.stop()
 
 class GPSManager:
-    unimplemented_formats = ('GPGSA', 'GPGSV', 'GPGLL', 'GPTXT', 'GPRMC')
+    # Sentence types we recognize but don't need, these are skipped without a warning
+    unimplemented_formats = ('GSA', 'GSV', 'GLL', 'TXT', 'ZDA')
     fix_quality_codes = {
         0: 'Not Fixed',
         1: 'GPS Fix',
@@ -110,15 +171,47 @@ class GPSManager:
         }
     }
 
-    def __init__(self, location: str = '/dev/ttyACM0', baud: int = 9600):
+    def __init__(self, location: str = '/dev/ttyACM0', baud: int = 9600, history: int = 3600,
+                 source=None, capture: Optional[str] = None):
+        """
+        Reads from the serial port at location, or from source if given (anything with
+        readline(), like a ReplaySource). If capture is a path the raw stream is recorded there.
+        """
         self._running = True
-        self.data = {} 
+
+        # The newest complete fix, replaced (never mutated) by the listener thread
+        self.latest: Optional[Fix] = None
+
+        # Fixed size ring buffer of recent fixes, slot (count % size) is written next
+        self._history: list[Optional[Fix]] = [None] * history
+        self._count = 0
+
+        # Last velocity from VTG, folded into the next fix. Only the listener thread touches this
+        self._velocity: tuple[Optional[float], Optional[float], Optional[float]] = (None, None, None)
+
+        # Sentence type (after the two letter talker id) -> parser, any talker in identifiers is accepted
+        self._parsers = {
+            b'GGA': self._parse_gga,
+            b'VTG': self._parse_vtg,
+            b'RMC': self._parse_rmc,
+        }
+        self._talkers = {talker.encode('ascii') for talker in GPSManager.identifiers}
+        self._unimplemented = {sentence_type.encode('ascii') for sentence_type in GPSManager.unimplemented_formats}
+        self._unknown = set()  # Formats we've already warned about once
+        self.checksum_errors = 0
+        self.malformed_sentences = 0
+
+        # UTC midnight of the current date as a timestamp, updated from RMC sentences
+        self._date = b''
+        self._date_timestamp = calendar.timegm(datetime.datetime.now(datetime.timezone.utc).date().timetuple())
 
         # Create the gps serial connection and flush/clear buffer
-        self._gps = serial.Serial(location, baud)
+        self._gps = source if source is not None else serial.Serial(location, baud)
+        if capture:
+            self._gps = CaptureWriter(self._gps, capture)
 
-        gps_thread = threading.Thread(target=self.listen)
-        gps_thread.start()
+        self._thread = threading.Thread(target=self.listen)
+        self._thread.start()
 
     def listen(self):
         # Flush the inputs and outputs
@@ -129,64 +222,136 @@ class GPSManager:
         try:
             _ = self._gps.readline()
             while self._running:
-                sentence = self._gps.readline().decode('utf-8')
+                sentence = self._gps.readline()
+
+                # Replays run dry at the end of their file, serial ports never return nothing
+                if not sentence and getattr(self._gps, 'finished', False):
+                    break
                 self._parse_sentence(sentence)
         except (Exception,) as e:
             raise e
 
-    def _parse_sentence(self, sentence: str):
-        words = sentence.split(',')
-        formatting = words.pop(0)[1:]
-        now = datetime.datetime.now()
-        if formatting == 'GPGGA':
-            source = 'GPGGA'
-            # Parse the time
-            gps_time = words[0].split('.')[0]
-            if len(gps_time) < 6:
-                gps_time = '0' + gps_time
-            date = datetime.date.today()
-            t = datetime.datetime(
-                year=date.year,
-                month=date.month,
-                day=date.day,
-                hour=int(gps_time[0:2]),
-                minute=int(gps_time[2:4]),
-                second=int(gps_time[4:6]),
-                tzinfo=datetime.timezone.utc
-            ).timestamp()
-            self.data['time'] = (t, now, source)
-
-            # Process N/S/E/W into decimal lat / long
-            latitude = float(words[1][0:2]) + (float(words[1][2:]) / 60)
-            if words[2] == 'S':
-                latitude = latitude * -1
-            longitude = float(words[3][0:3]) + (float(words[3][3:]) / 60)
-            if words[4] == 'W':
-                longitude = longitude * -1
-            self.data['latitude'] = (latitude, now, source)
-            self.data['longitude'] = (longitude, now, source)
-
-            # Process the signal quality
-            fix_quality = words[5]
-            if int(fix_quality) in GPSManager.fix_quality_codes:
-                fix_quality = GPSManager.fix_quality_codes[int(fix_quality)]
-            self.data['fix_quality'] = (fix_quality, now, source)
-            self.data['satellites_used'] = (int(words[6]), now, source)
-            self.data['hdop'] = (float(words[7]), now, source)
-            self.data['altitude'] = (float(words[8]), now, source)
-
-        elif formatting == 'GPVTG':
-            source = 'GPVTG'
-            self.data['true_track'] = (None if words[0] == '' else float(words[0]), now, source)
-            self.data['magnetic_track'] = (None if words[2] == '' else float(words[2]), now, source)
-            self.data['ground_speed'] = (None if words[6] == '' else float(words[6]), now, source)
-        elif formatting in GPSManager.unimplemented_formats:
-            pass
+    def _parse_sentence(self, sentence: bytes):
+        # Sentences look like $GPGGA,...*hh where hh is the XOR of everything between $ and *
+        sentence = sentence.strip()
+        star = sentence.rfind(b'*')
+        if star < 6 or sentence[0] != 0x24:  # $
+            self.checksum_errors += 1
+            return
+
+        body = sentence[1:star]
+        checksum = 0
+        for byte in body:
+            checksum ^= byte
+        try:
+            if checksum != int(sentence[star + 1:star + 3], 16):
+                self.checksum_errors += 1
+                return
+        except ValueError:
+            self.checksum_errors += 1
+            return
+
+        # Dispatch on the sentence type regardless of which constellation sent it (GPGGA, GNGGA, ...)
+        talker, sentence_type = body[0:2], body[2:5]
+        parser = self._parsers.get(sentence_type)
+        if parser is not None and talker in self._talkers:
+            try:
+                parser(body.split(b','), body[0:5].decode('ascii'))
+            except (ValueError, IndexError):
+                self.malformed_sentences += 1
+        elif sentence_type not in self._unimplemented and body[0:5] not in self._unknown:
+            self._unknown.add(body[0:5])
+            logger.warning(f'ATTENTION: Unseen NMEA Format: {body[0:5].decode("ascii", "replace")}')
+
+    def _time_of_day(self, field: bytes) -> float:
+        """hhmmss.ss -> UTC timestamp, using the date from the last RMC sentence"""
+        return (self._date_timestamp
+                + int(field[0:2]) * 3600 + int(field[2:4]) * 60 + float(field[4:]))
+
+    @staticmethod
+    def _coordinate(value: bytes, hemisphere: bytes) -> float:
+        """(d)ddmm.mmmm and N/S/E/W -> signed decimal degrees"""
+        minutes_start = value.index(b'.') - 2
+        degrees = int(value[:minutes_start]) + float(value[minutes_start:]) / 60
+        return -degrees if hemisphere in (b'S', b'W') else degrees
+
+    def _publish(self, fix: Fix, replace: bool = False):
+        """Makes fix the latest reading and stores it in history (over the previous slot if replace)"""
+        if replace and self._count:
+            self._history[(self._count - 1) % len(self._history)] = fix
         else:
-            logger.warning(f'ATTENTION: Unseen NMEA Format: {formatting}')
+            self._history[self._count % len(self._history)] = fix
+            self._count += 1
+        self.latest = fix
+
+    def _parse_gga(self, words: list[bytes], source: str):
+        # Without a fix the position fields are empty, and there's nothing to publish
+        if not words[2] or not words[4]:
+            return
+
+        # Process the signal quality
+        fix_quality = int(words[6] or 0)
+        true_track, magnetic_track, ground_speed = self._velocity
+        # Built positionally, this runs for every GGA sentence (field order matches Fix)
+        self._publish(Fix(
+            self._time_of_day(words[1]) if words[1] else None,
+            time.time(),
+            source,
+            self._coordinate(words[2], words[3]),
+            self._coordinate(words[4], words[5]),
+            float(words[9]) if words[9] else None,
+            GPSManager.fix_quality_codes.get(fix_quality, str(fix_quality)),
+            int(words[7] or 0),
+            float(words[8]) if words[8] else None,
+            true_track,
+            magnetic_track,
+            ground_speed,
+        ))
+
+    def _parse_vtg(self, words: list[bytes], source: str):
+        self._velocity = (
+            float(words[1]) if words[1] else None,
+            float(words[3]) if words[3] else None,
+            float(words[7]) if words[7] else None,
+        )
+
+        # VTG follows GGA in the same epoch, so give the current fix its velocity too
+        if self.latest is not None:
+            self._publish(Fix(*self.latest[:9], *self._velocity), replace=True)
+
+    def _parse_rmc(self, words: list[bytes], source: str):
+        # Only the date is used, GGA and VTG carry everything else
+        date = words[9]
+        if len(date) == 6 and date != self._date:
+            self._date = date
+            self._date_timestamp = calendar.timegm((2000 + int(date[4:6]), int(date[2:4]), int(date[0:2]), 0, 0, 0))
+
+    def history(self, n: Optional[int] = None) -> list[Fix]:
+        """The last n fixes (all that are buffered if n is None), oldest first"""
+        count, size = self._count, len(self._history)
+        n = min(count, size) if n is None else min(n, count, size)
+        return [self._history[i % size] for i in range(count - n, count)]
+
+    @property
+    def running(self) -> bool:
+        """True while the listener thread is reading, a replay stops by itself at the end of its file"""
+        return self._thread.is_alive()
+
+    @property
+    def count(self) -> int:
+        """How many fixes have been read so far (history only keeps the last few)"""
+        return self._count
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the listener stops or timeout seconds pass, returns whether it's still running"""
+        self._thread.join(timeout)
+        return self.running
 
     def get_dict(self, items: list[str]):
-        return {item: self.data[item][0] for item in items if item in self.data}
+        fix = self.latest
+        if fix is None:
+            return {}
+        return {item: getattr(fix, item) for item in items}
 
     def stop(self):
         self._running = False
@@ -0,0 +1,133 @@
+import os
+import struct
+import time
+from typing import BinaryIO, Optional
+
+# Capture files start with this, then hold (timestamp, length, bytes) records,
+# one per line read from the receiver. Files without it are read as plain NMEA text.
+capture_magic = b'VLSGPS1\n'
+record_header = struct.Struct('<dI')
+
+
+class CaptureWriter:
+    """
+    Wraps a serial port (or any source with readline) and records every
+    line it returns, with the time it arrived, to a capture file.
+    """
+
+    def __init__(self, source, path: str):
+        self.source = source
+        self._file: BinaryIO = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(capture_magic)
+
+    def readline(self) -> bytes:
+        line = self.source.readline()
+        self._file.write(record_header.pack(time.time(), len(line)))
+        self._file.write(line)
+        return line
+
+    def close(self):
+        self._file.close()
+        self.source.close()
+
+    def __getattr__(self, name):
+        # flushInput, flushOutput, etc. go straight to the real port
+        return getattr(self.source, name)
+
+
+class ReplaySource:
+    """
+    Stands in for the serial port, handing out lines from a capture file.
+    Lines are paced by their recorded timestamps divided by speed (speed=0 replays
+    as fast as possible, for benchmarks). Plain NMEA text files are paced at
+    interval seconds per line instead.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False, interval: float = 0.1):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.interval = interval
+        self.lines = 0
+        self.finished = False
+        self._file: Optional[BinaryIO] = None
+        self._open()
+
+    def _open(self):
+        if self._file:
+            self._file.close()
+        self._file = open(self.path, 'rb')
+        self._captured = self._file.read(len(capture_magic)) == capture_magic
+        if not self._captured:
+            self._file.seek(0)
+        self._first_recorded: Optional[float] = None
+        self._started = time.monotonic()
+
+    def _next(self) -> tuple[Optional[float], bytes]:
+        """The next (recorded time, line), or (None, b'') at the end of the file"""
+        if not self._captured:
+            line = self._file.readline()
+            return (self.lines * self.interval if line else None), line
+
+        header = self._file.read(record_header.size)
+        if len(header) < record_header.size:
+            return None, b''
+        recorded, length = record_header.unpack(header)
+        return recorded, self._file.read(length)
+
+    def readline(self) -> bytes:
+        if self.finished:
+            return b''
+
+        recorded, line = self._next()
+        if recorded is None and self.loop:
+            self._open()
+            recorded, line = self._next()
+        if recorded is None:
+            self.finished = True
+            return b''
+
+        # Wait until this line is due relative to the first one
+        if self.speed > 0:
+            if self._first_recorded is None:
+                self._first_recorded = recorded
+            due = self._started + (recorded - self._first_recorded) / self.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        self.lines += 1
+        return line
+
+    def flushInput(self):
+        pass
+
+    def flushOutput(self):
+        pass
+
+    def close(self):
+        self.finished = True
+        self._file.close()
+
+
+def replay_to_pty(path: str, speed: float = 1.0, loop: bool = False):
+    """
+    Replays a capture into a pseudo terminal and returns (master fd, device path),
+    so anything that opens serial devices (including GPSManager) can read it like a receiver.
+    """
+    import pty
+    import threading
+
+    master, slave = pty.openpty()
+    source = ReplaySource(path, speed=speed, loop=loop)
+
+    def pump():
+        while True:
+            line = source.readline()
+            if not line:
+                break
+            os.write(master, line)
+
+    threading.Thread(target=pump, daemon=True).start()
+    return master, os.ttyname(slave)
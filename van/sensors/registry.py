@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+from pathlib import Path
+
+from van.sensors.abstracts import Sensor
+from van.sensors.gps import GPS
+from van.sensors.tomorrow_io import TIO
+
+logger = logging.getLogger(__name__)
+
+# Every sensor type the config can ask for
+sensor_types: dict[str, type[Sensor]] = {
+    'gps': GPS,
+    'tio': TIO,
+}
+
+# Options that name another sensor in the config rather than being passed through as-is
+sensor_references = {
+    'tio': ('gps',),
+}
+
+
+def default_sensor_config() -> list[dict]:
+    """The sensors the hub runs when there's no config, the GPS receiver and the (disabled) weather API"""
+    return [
+        {
+            'name': 'gps',
+            'type': 'gps',
+            'options': {
+                'location': '/dev/ttyACM0',
+                'baud': 9600,
+                # VLS_GPS_REPLAY replays a capture file instead of reading the receiver,
+                # VLS_GPS_CAPTURE records the receiver's raw stream to a file (see van/cli.py gps)
+                'replay': os.getenv('VLS_GPS_REPLAY'),
+                'replay_speed': float(os.getenv('VLS_GPS_REPLAY_SPEED', 1)),
+                'capture': os.getenv('VLS_GPS_CAPTURE'),
+            },
+        },
+        {
+            'name': 'tio',
+            'type': 'tio',
+            'enabled': False,
+            'options': {'gps': 'gps'},
+        },
+    ]
+
+
+def load_sensor_config() -> list[dict]:
+    """
+    Reads the sensor config, a JSON list of sensor entries. Taken from VLS_SENSORS (the JSON itself),
+    else the file at VLS_SENSOR_CONFIG, else $VLS_DATA_PATH/sensors.json if it exists, else the defaults.
+    Each entry looks like:
+        {"name": "gps", "type": "gps", "enabled": true, "schedule": {"seconds": 10}, "batch_size": 20,
+         "record_on_change": {"distance": 10}, "max_quiet_seconds": 600, "options": {"baud": 9600}}
+    Everything but type is optional, entries named like a default sensor are merged over that default.
+    """
+    if os.getenv('VLS_SENSORS'):
+        config, source = json.loads(os.getenv('VLS_SENSORS')), 'VLS_SENSORS'
+    else:
+        path = os.getenv('VLS_SENSOR_CONFIG') or f'{os.getenv("VLS_DATA_PATH")}/sensors.json'
+        if not Path(path).is_file():
+            if os.getenv('VLS_SENSOR_CONFIG'):
+                raise FileNotFoundError(f'Sensor config "{path}" does not exist')
+            return default_sensor_config()
+        config, source = json.loads(Path(path).read_text()), path
+
+    if not isinstance(config, list):
+        raise ValueError(f'Sensor config from {source} must be a list of sensor entries')
+
+    # Merge entries over the defaults by name, so a config only needs to mention what it changes.
+    # The defaults keep their order (sensors have to come after the ones they reference), new sensors go last
+    merged = {entry['name']: entry for entry in default_sensor_config()}
+    names = [entry.get('name', entry.get('type')) for entry in config]
+    if len(set(names)) != len(names):
+        raise ValueError(f'Sensor names must be unique, got {names}')
+    for name, entry in zip(names, config):
+        default = merged.get(name)
+        if default:
+            entry = {**default, **entry, 'options': {**default.get('options', {}), **entry.get('options', {})}}
+        merged[name] = entry
+
+    logger.info(f'Loaded {len(config)} sensor entries from {source}')
+    return list(merged.values())
+
+
+def build_sensors(config: list[dict], development: bool = False) -> list[Sensor]:
+    """
+    Creates the sensors in config order, a sensor can only reference sensors listed before it.
+    Disabled sensors are only created if an enabled one references them, and aren't scheduled.
+    """
+    names = [entry.get('name', entry.get('type')) for entry in config]
+    if len(set(names)) != len(names):
+        raise ValueError(f'Sensor names must be unique, got {names}')
+
+    # Walk backwards so references pull in the sensors they need before we get to them
+    needed = {name for name, entry in zip(names, config) if entry.get('enabled', True)}
+    for name, entry in reversed(list(zip(names, config))):
+        if name in needed:
+            needed.update(entry.get('options', {}).get(option)
+                          for option in sensor_references.get(entry.get('type'), ()))
+
+    built: dict[str, Sensor] = {}
+    for name, entry in zip(names, config):
+        sensor_type = entry.get('type')
+        if sensor_type not in sensor_types:
+            raise ValueError(f'Unknown sensor type "{sensor_type}", expected one of {list(sensor_types)}')
+        if name not in needed:
+            continue
+
+        options = dict(entry.get('options', {}))
+        for option in sensor_references.get(sensor_type, ()):
+            reference = options.get(option)
+            if reference not in built:
+                raise ValueError(f'Sensor "{name}" references unknown sensor "{reference}" for "{option}"')
+            options[option] = built[reference]
+
+        built[name] = sensor_types[sensor_type](
+            development=development,
+            name=name,
+            enabled=entry.get('enabled', True),
+            default_schedule=entry.get('schedule'),
+            batch_size=entry.get('batch_size'),
+            record_on_change=entry.get('record_on_change'),
+            max_quiet_seconds=entry.get('max_quiet_seconds'),
+            **options,
+        )
+        logger.info(f'Created sensor "{name}" ({sensor_type}) every {built[name].default_schedule}, '
+                    f'record on change {built[name].record_on_change or "off"}')
+
+    return list(built.values())
@@ -1,39 +1,32 @@
-import os
 from typing import Optional
 
-import requests
-from requests.exceptions import ConnectionError
 from models import Base, GPSData, TomorrowIO
 from van.sensors.abstracts import Sensor
+from van.sensors.weather_cache import WeatherCache, weather_cache_from_env
 
 
 class TIO(Sensor):
-    def __init__(self, gps, development, **kwargs):
+    default_interval = {'minutes': 3}
+    default_topic = 'weather'
+
+    def __init__(self, gps, development, cache: Optional[WeatherCache] = None, **kwargs):
         super().__init__(development=development, **kwargs)
         self.gps = gps
 
+        # Weather is cached by location and time so we don't spend API quota on every reading
+        self.cache = cache if cache else weather_cache_from_env()
+
     def get_data(self) -> Optional[Base]:
-        # Get the most recent GPSData from the database
+        # Get the most recent GPSData, no fix means we don't know where to ask about
         gps: GPSData = self.gps.get_data()
-
-        try:
-            response = requests.get(
-                url=f'https://api.tomorrow.io/v4/weather/realtime'
-                    f'?location={gps.latitude},{gps.longitude}'
-                    f'&apikey={os.getenv("TOMORROW_IO_KEY")}',
-                headers={
-                    "accept": "application/json"}
-            )
-        except ConnectionError:
+        if gps is None:
             return None
 
-        # TODO: Handle case; No GPS Points
-        # TODO: Handle case; GPS points are old
-
-        if response.status_code != 200:
+        # Cached (or if it's a while since we were here, fresh) weather for the location
+        tio = self.cache.get(gps.latitude, gps.longitude)
+        if tio is None:
             return None
 
-        tio = response.json()['data']['values']
         return TomorrowIO(
             gps_data=gps,
             invalid=self.development,
@@ -0,0 +1,193 @@
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import requests
+
+from geocoding import geohash
+
+logger = logging.getLogger(__name__)
+
+
+class WeatherCache:
+    """
+    Caches TomorrowIO realtime weather by location cell (geohash, precision 5 is ~5km) and time bucket.
+    A reading from the current bucket is served as is, an older one (up to max_stale_seconds) is served
+    straight away while a single background request refreshes it, and only a cold cell blocks on the API.
+    Requests for the same cell are coalesced, and a cell is never fetched more than once every
+    min_refresh_seconds, so the quota lasts no matter how often the sensor asks.
+    Readings are kept in a small sqlite file so a restart doesn't start cold.
+    """
+
+    def __init__(self, path: Optional[str] = None,
+                 base_url: str = 'https://api.tomorrow.io',
+                 api_key: Optional[str] = None,
+                 precision: int = 5,
+                 bucket_seconds: int = 15 * 60,
+                 max_stale_seconds: int = 3 * 60 * 60,
+                 min_refresh_seconds: float = 60,
+                 timeout: float = 10):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.precision = precision
+        self.bucket_seconds = bucket_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self.timeout = timeout
+
+        self.requests_made = 0
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+        self._inflight: dict[str, threading.Event] = {}
+        self._next_request: dict[str, float] = {}  # Cell -> monotonic time it may be fetched again
+        self._rate_limited_until = 0.0  # Monotonic time the API may be called again after a 429
+        self._memory: dict[str, tuple[int, float, dict]] = {}  # Cell -> (bucket, fetched, values)
+
+        # Without a path readings only live in memory
+        self._database: Optional[sqlite3.Connection] = None
+        if path:
+            self._database = sqlite3.connect(path, check_same_thread=False)
+            self._database.execute('CREATE TABLE IF NOT EXISTS weather ('
+                                   'geohash TEXT NOT NULL, bucket INTEGER NOT NULL, fetched REAL NOT NULL, '
+                                   'data TEXT NOT NULL, PRIMARY KEY (geohash, bucket))')
+            self._database.commit()
+
+    def _latest(self, cell: str) -> Optional[tuple[int, float, dict]]:
+        with self._lock:
+            if cell in self._memory:
+                return self._memory[cell]
+            if self._database is None:
+                return None
+            row = self._database.execute('SELECT bucket, fetched, data FROM weather WHERE geohash = ? '
+                                         'ORDER BY bucket DESC LIMIT 1', (cell,)).fetchone()
+            if row is None:
+                return None
+            self._memory[cell] = (row[0], row[1], json.loads(row[2]))
+            return self._memory[cell]
+
+    def _store(self, cell: str, values: dict):
+        fetched = time.time()
+        bucket = int(fetched // self.bucket_seconds)
+        with self._lock:
+            self._memory[cell] = (bucket, fetched, values)
+            if self._database is not None:
+                self._database.execute('INSERT OR REPLACE INTO weather VALUES (?, ?, ?, ?)',
+                                       (cell, bucket, fetched, json.dumps(values)))
+                # Nothing older than max_stale_seconds is ever served, so don't keep it around
+                self._database.execute('DELETE FROM weather WHERE fetched < ?',
+                                       (fetched - self.max_stale_seconds,))
+                self._database.commit()
+
+    def retry_after(self, response: requests.Response) -> float:
+        """Seconds to wait from a Retry-After header, which is either a number of seconds or an HTTP-date"""
+        default = self.min_refresh_seconds * 10
+        value = response.headers.get('Retry-After')
+        if not value:
+            return default
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return default
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=datetime.timezone.utc)
+        return max((when - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0)
+
+    def fetch(self, latitude: float, longitude: float) -> Optional[dict]:
+        """Calls the realtime API, returns the weather values or None (throttled, failed or rate limited)"""
+        cell = geohash(latitude, longitude, self.precision)
+        with self._lock:
+            now = time.monotonic()
+            if now < self._rate_limited_until or now < self._next_request.get(cell, 0):
+                return None
+            # Forget cells whose throttle ran out so moving around doesn't grow this forever
+            self._next_request = {c: t for c, t in self._next_request.items() if t > now}
+            self._next_request[cell] = now + self.min_refresh_seconds
+            self.requests_made += 1
+
+        try:
+            response = self._session.get(
+                url=f'{self.base_url}/v4/weather/realtime',
+                params={'location': f'{latitude},{longitude}', 'apikey': self.api_key},
+                headers={'accept': 'application/json'},
+                timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.warning(f'TomorrowIO request failed: {e!r}')
+            return None
+
+        if response.status_code == 429:
+            # Out of quota (for every cell), wait as long as the API asks before trying again
+            retry_after = self.retry_after(response)
+            with self._lock:
+                self._rate_limited_until = max(self._rate_limited_until, time.monotonic() + retry_after)
+            logger.warning(f'TomorrowIO rate limited us, next request in {retry_after:.0f}s')
+            return None
+        if response.status_code != 200:
+            logger.warning(f'TomorrowIO request failed ({response.status_code}): {response.content[:200]}')
+            return None
+
+        return response.json()['data']['values']
+
+    def _refresh(self, cell: str, latitude: float, longitude: float) -> Optional[dict]:
+        # Coalesce, if this cell is already being fetched just wait for that request
+        with self._lock:
+            event = self._inflight.get(cell)
+            owner = event is None
+            if owner:
+                event = self._inflight[cell] = threading.Event()
+
+        if not owner:
+            event.wait(self.timeout)
+            latest = self._latest(cell)
+            return latest[2] if latest else None
+
+        try:
+            values = self.fetch(latitude, longitude)
+            if values is not None:
+                self._store(cell, values)
+            return values
+        finally:
+            with self._lock:
+                del self._inflight[cell]
+            event.set()
+
+    def get(self, latitude: float, longitude: float) -> Optional[dict]:
+        """Returns the weather values for a location, or None if there's nothing recent enough"""
+        cell = geohash(latitude, longitude, self.precision)
+        latest = self._latest(cell)
+        now = time.time()
+
+        if latest is not None:
+            bucket, fetched, values = latest
+            if bucket == int(now // self.bucket_seconds):
+                return values
+            if now - fetched < self.max_stale_seconds:
+                # Stale while revalidate, serve what we have and refresh it in the background
+                if cell not in self._inflight:
+                    threading.Thread(target=self._refresh, args=(cell, latitude, longitude),
+                                     name='weather-refresh', daemon=True).start()
+                return values
+
+        return self._refresh(cell, latitude, longitude)
+
+
+def weather_cache_from_env() -> WeatherCache:
+    """
+    The cache the TIO sensor uses, stored at $VLS_DATA_PATH/weather.db.
+    VLS_TOMORROW_IO_URL points it at another server (e.g. the stand-in in van/sensors/weather_standin.py)
+    and VLS_WEATHER_MIN_REFRESH sets the minimum seconds between API calls for a cell.
+    """
+    path = f'{os.getenv("VLS_DATA_PATH")}/weather.db' if os.getenv('VLS_DATA_PATH') else None
+    return WeatherCache(path,
+                        base_url=os.getenv('VLS_TOMORROW_IO_URL', 'https://api.tomorrow.io'),
+                        api_key=os.getenv('TOMORROW_IO_KEY'),
+                        min_refresh_seconds=float(os.getenv('VLS_WEATHER_MIN_REFRESH', 60)))
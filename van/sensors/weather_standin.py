@@ -0,0 +1,89 @@
+import json
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Shaped like a TomorrowIO realtime response, only the values the TIO sensor reads
+standin_values = {
+    'cloudBase': 0.8,
+    'cloudCeiling': 1.2,
+    'cloudCover': 40,
+    'dewPoint': 8.5,
+    'freezingRainIntensity': 0,
+    'humidity': 62,
+    'precipitationProbability': 0,
+    'pressureSurfaceLevel': 991.2,
+    'rainIntensity': 0,
+    'sleetIntensity': 0,
+    'snowIntensity': 0,
+    'temperature': 15.6,
+    'temperatureApparent': 15.6,
+    'uvHealthConcern': 0,
+    'uvIndex': 1,
+    'visibility': 16,
+    'weatherCode': 1101,
+    'windDirection': 220,
+    'windGust': 6.1,
+    'windSpeed': 3.4,
+}
+
+
+class WeatherStandIn(ThreadingHTTPServer):
+    """
+    Local stand-in for the TomorrowIO realtime endpoint, for tests and development without
+    spending API quota. Point VLS_TOMORROW_IO_URL at url. Every request is counted in requests,
+    and status can be set to answer with an error (429 to test rate limiting).
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), WeatherStandInHandler)
+        self.requests: list[str] = []
+        self.status = 200
+        self._thread: threading.Thread = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def start(self) -> 'WeatherStandIn':
+        self._thread = threading.Thread(target=self.serve_forever, name='weather-standin', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class WeatherStandInHandler(BaseHTTPRequestHandler):
+    server: WeatherStandIn
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        location = parse_qs(url.query).get('location', [''])[0]
+        self.server.requests.append(location)
+
+        if url.path != '/v4/weather/realtime' or not location:
+            return self.reply(400, {'message': 'location is required'})
+        if self.server.status != 200:
+            return self.reply(self.server.status, {'message': 'Stand-in error'})
+
+        latitude, longitude = (float(value) for value in location.split(','))
+        self.reply(200, {
+            'data': {'time': datetime.now(timezone.utc).isoformat(), 'values': standin_values},
+            'location': {'lat': latitude, 'lon': longitude},
+        })
+
+    def reply(self, status: int, body: dict):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        if status == 429:
+            self.send_header('Retry-After', '60')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass  # Keep test output quiet
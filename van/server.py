@@ -1,5 +1,6 @@
 #!/usr/bin/env python3.x
-import requests
+import asyncio
+import httpx
 from dotenv import load_dotenv
 import base64
 import logging
@@ -7,20 +8,23 @@ import os
 from contextlib import asynccontextmanager
 from functools import partial
 from pathlib import Path
+from typing import Optional
 import pytz
 from sqlalchemy import desc, asc
 import uvicorn
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
-from urllib3.exceptions import MaxRetryError, NewConnectionError
-from urllib import request
 
 from van.sensors import activate_sensors
-from van.scheduling.tools import scheduler, schedule_sensors
+from van.scheduling.tools import scheduler, schedule_sensors, schedule_compaction, publish_job_events
 from van.endpoints import endpoints, not_found_exception_handler
+from van.events import event_bus
+from van.log_files import setup_log_files, stop_log_files
+from van.stats import build_stats, count_inserted
 from van.database import engine
+from van.sync import HeartbeatCadence, SyncEngine, Uploader
 from models import GPSData, TomorrowIO, Vehicle, Heartbeat
 
 dev_env = True
@@ -44,99 +48,114 @@ logging_map = {
     'apscheduler.txt': 'apscheduler'
 }
 
-def can_connect(url_string: str) -> bool:
+# These are the local tables uploaded to the server
+# Each one keeps its own watermark so we only send new rows
+sync_engine = SyncEngine(engine, {
+    'gps': GPSData,
+    'tio': TomorrowIO,
+    'heartbeat': Heartbeat,
+})
+uploader = Uploader(sync_engine)
+
+# Heartbeats every 30 seconds while the server is reachable, backing off to 30 minutes in dead zones
+cadence = HeartbeatCadence(fast_seconds=30, max_seconds=30 * 60)
+
+# Probed while offline, a HEAD request is much cheaper than building and sending the backlog
+server_root = 'http://127.0.0.1:5000/' if dev_env else 'https://justapyr0.pythonanywhere.com/'
+
+
+async def can_connect(url_string: str) -> bool:
     try:
-        request.urlopen(url_string, timeout=1)
+        await uploader.client.head(url_string, timeout=1)
         return True
-    except request.URLError:
+    except httpx.HTTPError:
         return False
 
-def record_heartbeat():
-    # Starting point for the heartbeat object
+
+def last_heartbeat() -> Optional[Heartbeat]:
+    with Session(engine) as session:
+        return session.query(Heartbeat).order_by(desc('time_utc')).first()
+
+
+def save_heartbeat(heartbeat_dict: dict):
+    with Session(engine) as session:
+        session.add(Heartbeat(**heartbeat_dict))
+        count_inserted(session, 'heartbeat', 1, heartbeat_dict['time_utc'])
+        session.commit()
+
+
+async def record_heartbeat(started: datetime, server: bool, next_time: datetime):
+    # Starting point for the heartbeat object (times are naive utc like the rest of the database)
     heartbeat_dict = {
-        'time_utc': datetime.now(),
-        'next_time': scheduler.get_job('heartbeat').next_run_time
+        'time_utc': started,
+        'next_time': next_time,
+        'server': server,
     }
 
-    # Get the last heartbeat
-    last = None
-    with Session(engine) as session:
-        last = session.query(Heartbeat).order_by(desc('time_utc')).first()
+    # Get the last heartbeat (database calls run in a worker thread to keep the event loop free)
+    last = await asyncio.to_thread(last_heartbeat)
 
     # Check if this heartbeat was expected or if it's late 
-    if last == None or datetime.now() - last.next_time < timedelta(seconds=1):
+    if last == None or started - last.next_time < timedelta(seconds=1):
         heartbeat_dict['on_schedule'] = True
     else:
         heartbeat_dict['on_schedule'] = False
 
-    # Check for connectivity to server and internet
+    # If the server is down check if it's just the server or the whole connection
     google_url = 'http://142.250.190.142'
-    server_url = ('http://127.0.0.1:5000/api/heartbeat.json' if dev_env else 
-        'https://justapyr0.pythonanywhere.com/api/heartbeat.json')
+    heartbeat_dict['internet'] = True if server else await can_connect(google_url)
+    await asyncio.to_thread(save_heartbeat, heartbeat_dict)
+    event_bus.publish('heartbeat', heartbeat_dict)
 
-    heartbeat_dict['server'] = can_connect(server_url)
-    heartbeat_dict['internet'] = True if heartbeat_dict['server'] else can_connect(google_url)
-    with Session(engine) as session:
-        session.add(Heartbeat(**heartbeat_dict))
-        session.commit()
-    
 
-def heartbeat():
+async def heartbeat():
+    started = datetime.utcnow()
 
-    # Generate the data structure we send to the server
-    data = {
-        'database': {
-            'gps': {'headers': GPSData.__table__.columns.keys(), 'data': []},
+    # While offline we only probe, and skip collecting and encoding the backlog if the server's still gone
+    if not cadence.online and not await can_connect(server_root):
+        connected = False
+    else:
+        # These fields go along with every chunk we send to the server,
+        # the uploader packs only rows newer than each table's acknowledged watermark.
+        # If this gets through we'll be back on the fast cadence, so that's when the next one is due
+        next_heartbeat = datetime.now(timezone.utc) + timedelta(seconds=cadence.fast_seconds)
+        fields = {
+            'email': os.getenv('VLS_VEHICLE_EMAIL'),
+            'vehicle_name': os.getenv('VLS_V_NAME'),
+            'next_heartbeat': next_heartbeat.isoformat(),
         }
-    }
 
-    # This list provides names and model data tables
-    # For any tables we want to upload to the server
-    # TODO Autogenerate this list
-    upload = [
-        ('gps', GPSData),
-    ]
-
-    # TODO abort beforehand if no connection
-    # This packs the data from the table and names provided in the list
-    with Session(engine) as session:
-        for data_name, table in upload:
-            data['database'][data_name]['data'] = [
-                line.as_list() for line in session.query(table).all()
-            ]
-
-    # Now we try to send this all to the server
-    try:
         # Create an authorization header by encoding email/password (Basic-Auth)
         basic_auth_string = f'{os.getenv("VLS_VEHICLE_EMAIL")}:{os.getenv("VLS_V_USER_PASSWORD")}'
         basic_auth_encoded = base64.b64encode(basic_auth_string.encode('ascii'))
         request_headers = {
             'Authorization': f'Basic {basic_auth_encoded}',
-            'Content-Type': 'application/json'
         }
 
         # Construct the URL
-        url = ('http://127.0.0.1:5000/api/heartbeat.json' if dev_env else 
+        url = ('http://127.0.0.1:5000/api/heartbeat.json' if dev_env else
             f'https://justapyr0.pythonanywhere.com/api/heartbeat/{os.getenv("VLS_V_NAME")}.json')
 
-        # And post to server
-        response = requests.post(
-            url=url,
-            json=data,
-            headers=request_headers)
+        # Now we send the backlog to the server in chunks, anything left over resumes next heartbeat
+        await uploader.upload(url, request_headers, fields)
+        connected = uploader.connected
 
-        # Filter for responses that aren't 200
-        # TODO: We should differentiate between requests
-        if response.status_code != 200:
-            print(response.status_code)
-            print(response.content)
+    # Back off while offline, snap back to the fast cadence as soon as we get through
+    if connected:
+        reconnected = cadence.succeeded()
+    else:
+        reconnected = False
+        cadence.failed()
+    next_run = datetime.now(timezone.utc) + timedelta(seconds=cadence.interval)
 
-        # Commit all the changes that we made
-        # TODO: Consider another handshake before commiting this delete
-        session.commit()
+    # Coming back online with a backlog, keep going straight away instead of waiting a whole interval
+    if reconnected and not uploader.caught_up:
+        next_run = datetime.now(timezone.utc)
 
-    except requests.exceptions.ConnectionError as e:
-        return
+    if scheduler.get_job('heartbeat'):
+        scheduler.modify_job('heartbeat', next_run_time=next_run)
+
+    await record_heartbeat(started, connected, next_run.replace(tzinfo=None))
 
 
 @asynccontextmanager
@@ -156,23 +175,26 @@ async def lifespan(app: FastAPI):
     # Check to make sure the data path exists for logs (Database will go in the data path root)
     Path(f'{os.getenv("VLS_DATA_PATH")}/logs').mkdir(parents=True, exist_ok=True)
 
-    # Map library logs to output log files
+    # Map library logs to output log files, written by a background thread and rotated/compressed as they grow
     logging.basicConfig(level=logging.INFO)
-    for log_file, logger_name in logging_map.items():
-        path = os.path.abspath(f'{os.getenv("VLS_DATA_PATH")}/logs/{log_file}.log')
-        #file_handler = logging.FileHandler(path)
-        logger = logging.getLogger(logger_name)
-        #logger.addHandler(file_handler)
+    log_listener = setup_log_files(f'{os.getenv("VLS_DATA_PATH")}/logs', logging_map)
+
+    # Count any table we don't have statistics for yet, from then on the writes keep them current
+    await asyncio.to_thread(build_stats, engine)
 
-    # Get and start the scheduler
+    # Get and start the scheduler, with its job runs going out live on the event bus
+    publish_job_events()
     scheduler.start()
 
     # Activate the sensors, create a payload for them, then schedule them
     sensors = activate_sensors(development=dev_env)
-    schedule_sensors(sensors, engine)
+    sensor_buffer = schedule_sensors(sensors, engine)
 
-    # schedule the heartbeat call
-    scheduler.add_job(heartbeat, trigger='interval', seconds=30,
+    # Keep the local history from growing forever
+    schedule_compaction(engine)
+
+    # schedule the heartbeat call, each heartbeat moves its own next run to follow the connection's cadence
+    scheduler.add_job(heartbeat, trigger='interval', seconds=cadence.fast_seconds,
                       id='heartbeat',
                       name="Connect to the online server to upload/download data.")
 
@@ -183,18 +205,25 @@ async def lifespan(app: FastAPI):
     app.mount('/static', StaticFiles(directory=f'{os.getenv("VLS_INSTALL")}/van/static'), name="static")
 
     # Call a start-up heartbeat
-    heartbeat()
+    await heartbeat()
 
     # Launch the server
     yield
 
-    # Shutdown the scheduler
+    # Shutdown the scheduler and close the upload connection
     scheduler.shutdown()
+    await uploader.aclose()
+
+    # Write out any sensor readings still waiting in the buffer
+    sensor_buffer.flush()
 
     # After the server runs shut down all the sensors
     for sensor in sensors:
         sensor.shutdown()
 
+    # Write out whatever is still queued for the log files
+    stop_log_files(log_listener, logging_map)
+
 
 load_dotenv()
 server = FastAPI(title='Van Hub',
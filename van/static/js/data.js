@@ -1,32 +1,119 @@
-let data_table = null
+// The data pages only render their headers, rows are fetched from /api/<table>.json
+// one page at a time (keyset pagination, so later pages are as quick as the first)
+let table_state = null
 
 window.addEventListener('DOMContentLoaded', event => {
-    // Simple-DataTables
-    // https://github.com/fiduswriter/Simple-DataTables/wiki
-
     const dt_object = document.getElementById("data_table");
     if (dt_object) {
-        let options = {
+        table_state = {
+            table: dt_object.dataset.table,
+            sortable: dt_object.dataset.sortable.split(','),
+            sort: 'id',
+            order: 'desc',
+            // Cursor of every page we've been to, so previous just steps back through them
+            cursors: [null],
+            next: null,
         }
-        data_table = new simpleDatatables.DataTable(dt_object, options);
-        let columns = data_table.columns
-        columns.hide(0);
-        console.log(columns.visible(0))
-        data_table.columns.hide(1);
-        data_table.columns.hide(2);
-        console.log(data_table.columns.visible(0))
+        load_first_page();
     }
 });
 
-function toggle_column(column_index) {
-    var data_columns = data_table.columns;
-    var target = column_index - 1;
+function selected_columns() {
+    return Array.from(document.querySelectorAll('.column-toggle'))
+        .filter(checkbox => checkbox.checked)
+        .map(checkbox => checkbox.value);
+}
+
+async function load_page() {
+    const params = new URLSearchParams({
+        limit: document.getElementById('page_size').value,
+        sort: table_state.sort,
+        order: table_state.order,
+        columns: selected_columns().join(','),
+    });
+    const cursor = table_state.cursors[table_state.cursors.length - 1];
+    if (cursor) {
+        params.set('after', cursor);
+    }
 
-    if (data_columns.visible(target)) {
-        data_columns.hide([target]);
+    const response = await fetch(`/api/${table_state.table}.json?${params}`);
+    if (!response.ok) {
+        document.getElementById('page_status').textContent = `Failed to load rows (${response.status})`;
+        return;
+    }
+    const page = await response.json();
+    table_state.next = page.next;
+    render_page(page);
+}
+
+function render_page(page) {
+    const table = document.getElementById('data_table');
+
+    const head = document.createElement('tr');
+    for (const column of page.columns) {
+        const th = document.createElement('th');
+        th.textContent = column;
+        if (table_state.sortable.includes(column)) {
+            th.style.cursor = 'pointer';
+            if (column === table_state.sort) {
+                th.textContent += table_state.order === 'desc' ? ' ▼' : ' ▲';
+            }
+            th.onclick = () => sort_by(column);
+        }
+        head.appendChild(th);
+    }
+    table.tHead.replaceChildren(head);
+
+    const body = document.createDocumentFragment();
+    for (const row of page.rows) {
+        const tr = document.createElement('tr');
+        for (const cell of row) {
+            const td = document.createElement('td');
+            td.textContent = cell === null ? '' : cell;
+            tr.appendChild(td);
+        }
+        body.appendChild(tr);
+    }
+    table.tBodies[0].replaceChildren(body);
+
+    const page_number = table_state.cursors.length;
+    document.getElementById('page_status').textContent = `Page ${page_number} (${page.rows.length} rows)`;
+    document.getElementById('previous_page').disabled = page_number === 1;
+    document.getElementById('next_page').disabled = !table_state.next;
+}
+
+function load_first_page() {
+    table_state.cursors = [null];
+    load_page();
+}
+
+function next_page() {
+    if (table_state.next) {
+        table_state.cursors.push(table_state.next);
+        load_page();
+    }
+}
+
+function previous_page() {
+    if (table_state.cursors.length > 1) {
+        table_state.cursors.pop();
+        load_page();
+    }
+}
+
+function sort_by(column) {
+    // Clicking the sorted column flips the order, a new column starts newest/largest first
+    if (table_state.sort === column) {
+        table_state.order = table_state.order === 'desc' ? 'asc' : 'desc';
     }
     else {
-        data_columns.show([target]);
+        table_state.sort = column;
+        table_state.order = 'desc';
     }
+    load_first_page();
 }
 
+function toggle_column() {
+    // Only the checked columns are requested, so hiding columns also shrinks the response
+    load_page();
+}
@@ -0,0 +1,18 @@
+// One websocket per page for all of its live updates. handlers maps each topic
+// (gps, weather, heartbeat, scheduler, logs) to a function called with every event's data
+function subscribe_events(handlers) {
+    const topics = Object.keys(handlers).join(",");
+    const socket = new WebSocket(`ws://${window.location.host}/ws/events?topics=${topics}`);
+    socket.onmessage = function (event) {
+        const message = JSON.parse(event.data);
+        const handler = handlers[message['topic']];
+        if (handler) {
+            handler(message['data'], message['time']);
+        }
+    };
+    // The hub restarting shouldn't leave the page dead, try again in a few seconds
+    socket.onclose = function () {
+        setTimeout(function () { subscribe_events(handlers); }, 5000);
+    };
+    return socket;
+}
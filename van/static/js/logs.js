@@ -1,34 +1,72 @@
-var ws_log = new WebSocket("ws://localhost:8000/ws/logs");
-ws_log.onmessage = function (event) {
-    log_data = JSON.parse(event.data);
+// Which tab each log file goes in, log files are named after these (e.g. server.txt.log)
+const log_panes = {
+    'server.txt': 'webserver_log',
+    'traffic.txt': 'traffic_log',
+    'apscheduler.txt': 'apscheduler_log',
+};
+// Lines kept in each tab, older ones are dropped so a long open tab doesn't grow forever
+const max_log_lines = 1000;
 
-    var traffic_html = document.getElementById("traffic_log");
-    for (line in log_data['traffic.txt']['log']) {
-        traffic_html.insertAdjacentHTML("beforeend", log_data['traffic.txt']['log'][line]);
+function format_size(size) {
+    const units = ['b', 'kb', 'mb', 'gb'];
+    let unit = 0;
+    while (size >= 1024 && unit < units.length - 1) {
+        size = size / 1024;
+        unit++;
     }
+    return size.toFixed(3) + " " + units[unit];
+}
 
-    var apscheduler_html = document.getElementById("apscheduler_log");
-    for (line in log_data['apscheduler.txt']['log']) {
-        apscheduler_html.insertAdjacentHTML("beforeend", log_data['apscheduler.txt']['log'][line]);
+function log_pane(log_name) {
+    for (const prefix in log_panes) {
+        if (log_name.startsWith(prefix)) {
+            return document.getElementById(log_panes[prefix]);
+        }
     }
+    return null;
+}
 
-    var webserver_html = document.getElementById("webserver_log");
-    for (line in log_data['server.txt']['log']) {
-        webserver_html.insertAdjacentHTML("beforeend", log_data['server.txt']['log'][line]);
-    }
-
-    document.getElementById("server.txt_size").innerHTML = log_data['server.txt'].size.toFixed(3) + " " + log_data['server.txt'].size_type;
-    document.getElementById("apscheduler.txt_size").innerHTML = log_data['apscheduler.txt'].size.toFixed(3) + " " + log_data['apscheduler.txt'].size_type;
-    document.getElementById("traffic.txt_size").innerHTML = log_data['traffic.txt'].size.toFixed(3) + " " + log_data['traffic.txt'].size_type;
+// The first message has the last lines of every log (marked reset), after that
+// the server only sends the lines appended since, and nothing at all while the logs are quiet
+function show_logs(log_data) {
+    for (const [log_name, update] of Object.entries(log_data['files'])) {
+        const size_cell = document.getElementById(log_name + "_size");
+        if (size_cell) {
+            size_cell.textContent = format_size(update['size']);
+        }
 
+        const pane = log_pane(log_name);
+        if (!pane) {
+            continue;
+        }
+        if (update['reset']) {
+            pane.replaceChildren();
+        }
+        for (const line of update['lines']) {
+            const p = document.createElement("p");
+            p.textContent = line;
+            pane.appendChild(p);
+        }
+        while (pane.childElementCount > max_log_lines) {
+            pane.firstElementChild.remove();
+        }
     }
+}
+
+subscribe_events({'logs': show_logs});
 
-    function delete_log(val){
-        fetch("http://raspberrypi.local:8000/logs/"+val+".json", {
-            method: 'DELETE',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: null //if you do not want to send any addional data,  replace the complete JSON.stringify(YOUR_ADDITIONAL_DATA) with null
-        })
-    }
\ No newline at end of file
+// Rotated segments are deleted, live logs are emptied (the tailer then resets their tab)
+function delete_log(val){
+    fetch("/logs/"+encodeURIComponent(val)+".json", {
+        method: 'DELETE',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: null
+    }).then(function (response) {
+        const row = document.getElementById(val + "_row");
+        if (response.ok && row) {
+            row.remove();
+        }
+    })
+}
@@ -1,5 +1,4 @@
 let editor = document.querySelector("#editor");
-let result_table = null
 
 
 ace.edit(editor, {
@@ -7,41 +6,83 @@ ace.edit(editor, {
     mode: "ace/mode/sql"
 });
 
-window.addEventListener('DOMContentLoaded', event => {
-    // Simple-DataTables
-    // https://github.com/fiduswriter/Simple-DataTables/wiki
 
-    const datatablesSimple = document.getElementById("sql_result_table");
-    if (datatablesSimple) {
-        let options = {
-            searchable: false,
-            paging: false
+// sql.json streams ndjson: the query plan, the headings, chunks of rows, then a summary line
+function handle_message(message, table) {
+    if ("plan" in message) {
+        document.getElementById("query_plan").textContent = message["plan"].join("\n");
+    }
+    if ("headings" in message) {
+        const head = document.createElement("tr");
+        for (const heading of message["headings"]) {
+            const th = document.createElement("th");
+            th.textContent = heading;
+            head.appendChild(th);
         }
-        result_table = new simpleDatatables.DataTable(datatablesSimple, options);
+        table.tHead.replaceChildren(head);
     }
-});
-
-
+    if ("rows" in message) {
+        const body = document.createDocumentFragment();
+        for (const row of message["rows"]) {
+            const tr = document.createElement("tr");
+            for (const cell of row) {
+                const td = document.createElement("td");
+                td.textContent = cell === null ? "NULL" : cell;
+                tr.appendChild(td);
+            }
+            body.appendChild(tr);
+        }
+        table.tBodies[0].appendChild(body);
+    }
+    if ("rows_total" in message) {
+        let info = "Fetched " + message["rows_total"] + " rows in " + message["time"].toFixed(3) + " seconds.";
+        if (message["truncated"]) {
+            info += " Stopped at the row limit, there are more rows.";
+        }
+        if (message["error"]) {
+            info += " Error: " + message["error"];
+        }
+        document.getElementById("query_info").textContent = info;
+    }
+}
 
 
-//- Using an anonymous function:
 document.getElementById("submit_query").onclick = async () => {
     var editor = ace.edit("editor")
+    const table = document.getElementById("sql_result_table");
+    table.tHead.replaceChildren();
+    table.tBodies[0].replaceChildren();
+    document.getElementById("query_info").textContent = "Running...";
 
     const formData = new FormData();
     formData.append("sql_query", editor.getValue())
-    let results = {}
+    formData.append("max_rows", document.getElementById("max_rows").value)
 
     try {
         const response = await fetch("sql.json", {
             method: "POST",
             body: formData,
         });
-        results = await response.json()
+
+        // Render each chunk as it arrives rather than waiting for the whole result
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffered = "";
+        while (true) {
+            const {value, done} = await reader.read();
+            if (done) {
+                break;
+            }
+            buffered += value;
+            const lines = buffered.split("\n");
+            buffered = lines.pop();
+            for (const line of lines) {
+                if (line) {
+                    handle_message(JSON.parse(line), table);
+                }
+            }
+        }
     } catch (e) {
         console.error(e)
+        document.getElementById("query_info").textContent = "Query failed: " + e;
     }
-
-    result_table.insert(results["insert"])
-    document.getElementById("query_info").innerHTML = "Fetched " + results["rows"] + " in " + results["time"] + " seconds."
-};
\ No newline at end of file
+};
@@ -0,0 +1,135 @@
+import datetime
+import logging
+import timeit
+from collections import Counter
+from typing import Iterable, Optional
+
+from sqlalchemy import Engine, func, inspect, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from models import Base, GPSData, GPSRollup, Heartbeat, TableIngest, TableStats, TomorrowIO
+
+logger = logging.getLogger(__name__)
+
+# Tables with maintained statistics, and the column their time span is taken from
+stats_tables: dict[str, tuple[type[Base], str]] = {
+    'gps': (GPSData, 'utc_time'),
+    'tio': (TomorrowIO, 'utc_time'),
+    'heartbeat': (Heartbeat, 'time_utc'),
+    'gps_rollup': (GPSRollup, 'utc_time'),
+}
+stats_names = {model: name for name, (model, _) in stats_tables.items()}
+
+
+def count_inserted(session: Session, table_name: str, rows: int, when: Optional[datetime.datetime] = None):
+    """
+    Adds rows to a table's statistics, call it in the same transaction as the insert so the two never disagree.
+    Both updates are single upserts, so they don't race with other writers of the same table.
+    """
+    if rows <= 0:
+        return
+    when = when or datetime.datetime.utcnow()
+
+    session.execute(insert(TableStats).values(
+        table_name=table_name, row_count=rows, first_utc=when, last_utc=when
+    ).on_conflict_do_update(index_elements=['table_name'], set_={
+        'row_count': TableStats.row_count + rows,
+        'first_utc': func.coalesce(TableStats.first_utc, when),
+        'last_utc': func.max(func.coalesce(TableStats.last_utc, when), when),
+    }))
+
+    session.execute(insert(TableIngest).values(
+        table_name=table_name, day=when.date(), rows=rows
+    ).on_conflict_do_update(index_elements=['table_name', 'day'], set_={
+        'rows': TableIngest.rows + rows,
+    }))
+
+
+def count_readings(session: Session, readings: Iterable[Base]):
+    """
+    count_inserted for a batch of sensor readings, grouped by table. A weather reading brings its own
+    gps point along (saved through the relationship), so new points attached to one are counted too.
+    """
+    now = datetime.datetime.utcnow()
+    inserted = {id(reading): reading for reading in readings}
+    for reading in list(inserted.values()):
+        gps = reading.gps_data if isinstance(reading, TomorrowIO) else None
+        if gps is not None and not inspect(gps).persistent:
+            inserted[id(gps)] = gps
+    counts = Counter(stats_names.get(type(reading)) for reading in inserted.values())
+    for table_name, rows in counts.items():
+        if table_name:
+            count_inserted(session, table_name, rows, now)
+
+
+def count_changed(session: Session, table_name: str, change: int):
+    """
+    Adjusts a table's row count after a bulk insert/delete (compaction), its time span is looked
+    up again from the time index, which only reads the two ends of it
+    """
+    if change == 0:
+        return
+    model, time_field = stats_tables[table_name]
+    time_column = model.__table__.columns[time_field]
+    first = select(func.min(time_column)).scalar_subquery()
+    last = select(func.max(time_column)).scalar_subquery()
+
+    session.execute(insert(TableStats).values(
+        table_name=table_name, row_count=max(change, 0), first_utc=first, last_utc=last
+    ).on_conflict_do_update(index_elements=['table_name'], set_={
+        'row_count': func.max(TableStats.row_count + change, 0),
+        'first_utc': first,
+        'last_utc': last,
+    }))
+
+
+def build_stats(engine: Engine):
+    """
+    Counts any table that doesn't have statistics yet (a database from before they were kept).
+    This is the only full scan, once per table, everything after keeps the counts up to date.
+    Ingest per day is rebuilt from the rows still there, so days compaction already thinned out come up short.
+    """
+    with Session(engine) as session:
+        known = set(session.scalars(select(TableStats.table_name)))
+        for table_name, (model, time_field) in stats_tables.items():
+            if table_name in known:
+                continue
+
+            start = timeit.default_timer()
+            time_column = model.__table__.columns[time_field]
+            rows, first, last = session.execute(
+                select(func.count(), func.min(time_column), func.max(time_column))).one()
+            session.add(TableStats(table_name=table_name, row_count=rows, first_utc=first, last_utc=last))
+
+            day = func.date(time_column)
+            for ingest_day, ingest_rows in session.execute(select(day, func.count()).group_by(day)):
+                if ingest_day:
+                    session.add(TableIngest(table_name=table_name,
+                                            day=datetime.date.fromisoformat(ingest_day),
+                                            rows=ingest_rows))
+
+            logger.info(f'Built {table_name} statistics ({rows} rows) in {timeit.default_timer() - start}')
+        session.commit()
+
+
+def read_stats(session: Session, days: int = 7) -> dict:
+    """
+    Row counts, time spans and rows written per day over the last days days of every table.
+    Only reads the statistics tables, so it costs the same however big the data gets.
+    """
+    since = datetime.datetime.utcnow().date() - datetime.timedelta(days=days - 1)
+    stats = {table_name: {'rows': 0, 'first_utc': None, 'last_utc': None, 'per_day': 0, 'days': {}}
+             for table_name in stats_tables}
+
+    for row in session.scalars(select(TableStats)):
+        if row.table_name in stats:
+            stats[row.table_name].update(rows=row.row_count, first_utc=row.first_utc, last_utc=row.last_utc)
+
+    for row in session.scalars(select(TableIngest).where(TableIngest.day >= since).order_by(TableIngest.day)):
+        if row.table_name in stats:
+            stats[row.table_name]['days'][row.day.isoformat()] = row.rows
+
+    for table in stats.values():
+        table['per_day'] = sum(table['days'].values()) / days
+    return stats
@@ -0,0 +1,4 @@
+from van.sync.watermark import SyncEngine
+from van.sync.payload import encode_payload
+from van.sync.upload import Uploader
+from van.sync.cadence import HeartbeatCadence
@@ -0,0 +1,55 @@
+import logging
+import random
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatCadence:
+    """
+    Decides how long to wait before the next heartbeat. Connected we beat every
+    fast_seconds, each failed attempt in a row doubles the wait (with a little
+    jitter so we don't wake the modem on a fixed beat) up to max_seconds,
+    and the first success snaps straight back to fast_seconds.
+    """
+
+    def __init__(self, fast_seconds: float = 30, max_seconds: float = 30 * 60,
+                 factor: float = 2, jitter: float = 0.1):
+        self.fast_seconds = fast_seconds
+        self.max_seconds = max_seconds
+        self.factor = factor
+        self.jitter = jitter
+
+        self.failures = 0  # Failed attempts in a row
+        self.interval = fast_seconds  # Seconds until the next heartbeat
+        self.last_success: Optional[float] = None
+        self.offline_since: Optional[float] = None
+
+    @property
+    def online(self) -> bool:
+        return self.failures == 0
+
+    def succeeded(self) -> bool:
+        """Records a successful heartbeat, returns True if this is the first one after being offline"""
+        reconnected = not self.online
+        if reconnected:
+            logger.info(f'Server reachable again after {self.failures} failed heartbeats '
+                        f'({time.time() - self.offline_since:.0f}s offline)')
+
+        self.failures = 0
+        self.offline_since = None
+        self.last_success = time.time()
+        self.interval = self.fast_seconds
+        return reconnected
+
+    def failed(self) -> float:
+        """Records a failed heartbeat and returns the backed off interval"""
+        if self.online:
+            self.offline_since = time.time()
+        self.failures += 1
+
+        backoff = min(self.fast_seconds * self.factor ** min(self.failures, 32), self.max_seconds)
+        self.interval = backoff * random.uniform(1 - self.jitter, 1 + self.jitter)
+        logger.info(f'Heartbeat failed {self.failures} times in a row, next attempt in {self.interval:.0f}s')
+        return self.interval
@@ -0,0 +1,42 @@
+import gzip
+
+import orjson
+
+# Newer websites accept column-oriented, natively typed and gzipped uploads under this type
+columnar_content_type = 'application/vnd.vls.columnar+json'
+legacy_content_type = 'application/json'
+
+
+def to_columns(table_data: dict) -> dict:
+    """Turns a {'headers': [...], 'data': [rows]} table into {'headers': [...], 'columns': [columns]}"""
+    return {
+        'headers': table_data['headers'],
+        'columns': [list(column) for column in zip(*table_data['data'])] if table_data['data'] else
+                   [[] for _ in table_data['headers']]
+    }
+
+
+def to_text(table_data: dict) -> dict:
+    """Stringifies every value the same way Base.as_list() does, for websites that only read the old format"""
+    return {
+        'headers': table_data['headers'],
+        'data': [[str(value) for value in row] for row in table_data['data']]
+    }
+
+
+def encode_payload(data: dict, columnar: bool = True) -> tuple[bytes, dict]:
+    """
+    Serializes a heartbeat upload and returns the body along with the
+    Content-Type/Content-Encoding headers describing it.
+    """
+    convert = to_columns if columnar else to_text
+    body = dict(data)
+    body['database'] = {name: convert(table_data) for name, table_data in data['database'].items()}
+
+    if not columnar:
+        return orjson.dumps(body), {'Content-Type': legacy_content_type}
+
+    return gzip.compress(orjson.dumps(body)), {
+        'Content-Type': columnar_content_type,
+        'Content-Encoding': 'gzip'
+    }
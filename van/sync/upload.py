@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from van.sync.payload import encode_payload
+from van.sync.watermark import SyncEngine
+
+logger = logging.getLogger(__name__)
+
+
+class Uploader:
+    """
+    Sends the sync backlog to the website in bounded chunks. Every chunk is
+    acknowledged (and the watermarks advanced) before the next one is built,
+    so a dropped connection just resumes from the last acknowledged chunk
+    on the following heartbeat.
+
+    Network I/O runs on the event loop through one pooled keep-alive client,
+    while database reads/writes and encoding are pushed to worker threads.
+    """
+
+    def __init__(self, sync_engine: SyncEngine,
+                 max_rows: int = 500,
+                 max_bytes: int = 256 * 1024,
+                 max_chunks: int = 20,
+                 timeout: httpx.Timeout = httpx.Timeout(30, connect=5),
+                 plain_json_seconds: float = 60 * 60):
+        self.sync_engine = sync_engine
+        self.max_rows = max_rows  # Rows per table in one chunk
+        self.max_bytes = max_bytes  # Encoded body size of one chunk
+        self.max_chunks = max_chunks  # Chunks sent per heartbeat, the rest waits for the next one
+        self.timeout = timeout
+
+        # If the server says it doesn't understand the compressed columnar format (415) we send
+        # plain json for plain_json_seconds, then try columnar again in case the server was updated
+        self.plain_json_seconds = plain_json_seconds
+        self._plain_json_until = 0.0
+
+        # How the last upload went, the heartbeat cadence backs off on these
+        self.connected = False  # The server acknowledged at least the first chunk
+        self.caught_up = False  # Every waiting row was sent and acknowledged
+
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def columnar(self) -> bool:
+        return time.monotonic() >= self._plain_json_until
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Created on first use so it binds to the running event loop, then reused to keep the connection alive"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=2, keepalive_expiry=120))
+        return self._client
+
+    async def upload(self, url: str, headers: dict, fields: dict) -> int:
+        """
+        Posts chunks until the backlog is empty or max_chunks is reached,
+        fields (email, vehicle name, ...) are sent along with every chunk.
+        Returns the number of rows the website acknowledged.
+        """
+        acknowledged = 0
+        self.connected = self.caught_up = False
+        for chunk_number in range(self.max_chunks):
+            database = await asyncio.to_thread(self.sync_engine.collect, self.max_rows)
+            rows = sum(len(table_data['data']) for table_data in database.values())
+
+            # The first chunk goes out even when empty, since it doubles as the heartbeat itself
+            if rows == 0 and chunk_number > 0:
+                self.caught_up = True
+                break
+
+            database, body, content_headers = await asyncio.to_thread(self.fit_chunk, fields, database)
+            try:
+                response = await self.post(url, headers, body, content_headers)
+                if response.status_code == 415 and self.columnar:
+                    # Older servers only understand the plain json rows, so fall back for a while and resend.
+                    # Other errors (an unknown vehicle, a bad request) aren't about the format, so they don't count
+                    logger.warning(f'Server refused columnar upload ({response.status_code}), '
+                                   f'sending plain json for the next {self.plain_json_seconds} seconds')
+                    self._plain_json_until = time.monotonic() + self.plain_json_seconds
+                    database, body, content_headers = await asyncio.to_thread(self.fit_chunk, fields, database)
+                    response = await self.post(url, headers, body, content_headers)
+            except httpx.HTTPError as e:
+                logger.warning(f'Heartbeat upload interrupted after {chunk_number} chunks: {e!r}')
+                break
+
+            # TODO: We should differentiate between requests
+            if response.status_code != 200:
+                logger.warning(f'Heartbeat upload failed ({response.status_code}): {response.content}')
+                break
+
+            # Only advance the watermarks for rows the server says it received. A 200 that isn't
+            # our json (a proxy or hosting error page) acknowledges nothing
+            try:
+                received = response.json()['received']
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f'Heartbeat upload got an unreadable response ({e!r}): {response.content[:200]}')
+                break
+            await asyncio.to_thread(self.sync_engine.acknowledge, database, received)
+            acknowledged += sum(len(ids) for ids in received.values())
+            self.connected = True
+
+            # A chunk that wasn't full (or cut down to fit max_bytes) means we've caught up
+            sent = sum(len(table_data['data']) for table_data in database.values())
+            if sent == rows and all(len(table_data['data']) < self.max_rows for table_data in database.values()):
+                self.caught_up = True
+                break
+
+        return acknowledged
+
+    def fit_chunk(self, fields: dict, database: dict) -> tuple[dict, bytes, dict]:
+        """Encodes the chunk, halving the rows per table until the body fits in max_bytes"""
+        rows = max([len(table_data['data']) for table_data in database.values()] + [1])
+        while True:
+            database = {name: {'headers': table_data['headers'], 'data': table_data['data'][:rows]}
+                        for name, table_data in database.items()}
+            body, content_headers = encode_payload(fields | {'database': database}, columnar=self.columnar)
+            if len(body) <= self.max_bytes or rows == 1:
+                return database, body, content_headers
+            rows = rows // 2
+
+    async def post(self, url: str, headers: dict, body: bytes, content_headers: dict) -> httpx.Response:
+        return await self.client.post(
+            url=url,
+            content=body,
+            headers=headers | content_headers)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
@@ -0,0 +1,78 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session
+
+from models import Base, SyncWatermark
+
+logger = logging.getLogger(__name__)
+
+
+class SyncEngine:
+    """
+    Tracks a high-water mark for each uploaded table so a heartbeat
+    only packs rows the website hasn't acknowledged yet.
+    """
+
+    def __init__(self, engine: Engine, tables: dict[str, type[Base]], batch_size: int = 500):
+        self.engine = engine
+        self.tables = tables
+        self.batch_size = batch_size
+
+    def watermarks(self, session: Session) -> dict[str, int]:
+        """Returns the last acknowledged id of each table (0 if nothing has been acknowledged)"""
+        marks = {name: 0 for name in self.tables}
+        for mark in session.query(SyncWatermark).filter(SyncWatermark.table_name.in_(self.tables.keys())):
+            marks[mark.table_name] = mark.last_id
+        return marks
+
+    def collect(self, limit: int = None) -> dict:
+        """
+        Packs the rows above each table's watermark into the heartbeat 'database' structure.
+        Values are left as native python types, see van.sync.payload for how they go over the wire.
+        """
+        database = {}
+        with Session(self.engine) as session:
+            marks = self.watermarks(session)
+            for name, table in self.tables.items():
+                rows = (session.query(table)
+                        .filter(table.id > marks[name])
+                        .order_by(table.id)
+                        .limit(limit or self.batch_size))
+                headers = table.__table__.columns.keys()
+                database[name] = {
+                    'headers': headers,
+                    'data': [[getattr(row, column) for column in headers] for row in rows]
+                }
+        return database
+
+    def acknowledge(self, database: dict, received: dict[str, list]):
+        """
+        Advances the watermarks using the ids the website listed as received.
+        The mark only moves across the unbroken run of acknowledged rows,
+        so anything after a gap gets sent again on the next heartbeat.
+        """
+        with Session(self.engine) as session:
+            for name, table_data in database.items():
+                id_index = table_data['headers'].index('id')
+                acknowledged = {int(row_id) for row_id in received.get(name, [])}
+
+                last_id = None
+                for row in table_data['data']:
+                    if int(row[id_index]) not in acknowledged:
+                        break
+                    last_id = int(row[id_index])
+
+                if last_id is None:
+                    continue
+
+                mark = session.get(SyncWatermark, name)
+                if mark is None:
+                    mark = SyncWatermark(table_name=name, last_id=0)
+                    session.add(mark)
+                mark.last_id = max(mark.last_id, last_id)
+                mark.updated_utc = datetime.utcnow()
+                logger.info(f'Advanced {name} sync watermark to {mark.last_id}')
+
+            session.commit()
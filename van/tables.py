@@ -0,0 +1,104 @@
+import base64
+import json
+from typing import Optional
+
+from sqlalchemy import DateTime, String, select, tuple_, type_coerce
+from sqlalchemy.orm import Session
+
+from models import Base, GPSData, GPSRollup, TomorrowIO
+
+# Tables the data pages can browse through /api/<name>.json, named like the sync tables
+browsable_tables: dict[str, type[Base]] = {
+    'gps': GPSData,
+    'tio': TomorrowIO,
+    'gps_rollup': GPSRollup,
+}
+
+max_page_size = 1000
+
+
+class PageRequestError(ValueError):
+    pass
+
+
+def sortable_columns(model: type[Base]) -> list[str]:
+    """Only indexed, non-null columns can be sorted on, so every page is an index range scan"""
+    return [column.key for column in model.__table__.columns
+            if (column.primary_key or column.index) and not column.nullable]
+
+
+def stored_value(column):
+    """
+    The column as SQLite stored it. Datetimes are text, and CURRENT_TIMESTAMP writes them without the
+    microseconds SQLAlchemy adds to bound datetimes, so cursors compare the stored text (the same order
+    the index is in) instead of a datetime that would never equal it.
+    """
+    if isinstance(column.type, DateTime):
+        return type_coerce(column, String)
+    return column
+
+
+def encode_cursor(sort_value, row_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return sort_value, int(row_id)
+    except (ValueError, TypeError) as e:
+        raise PageRequestError(f'Invalid cursor "{cursor}"') from e
+
+
+def fetch_page(session: Session, model: type[Base],
+               columns: Optional[list[str]] = None,
+               sort: str = 'id',
+               descending: bool = True,
+               after: Optional[str] = None,
+               limit: int = 100) -> dict:
+    """
+    Returns one page of a table using keyset pagination: rows are ordered by (sort, id) and a page
+    starts right after the cursor of the previous page's last row, so page 1000 costs the same as page 1
+    (unlike OFFSET). columns limits which columns are read, defaulting to all of them.
+    """
+    table = model.__table__
+    if sort not in sortable_columns(model):
+        raise PageRequestError(f'Can not sort {table.name} by "{sort}", expected one of {sortable_columns(model)}')
+    if not 0 < limit <= max_page_size:
+        raise PageRequestError(f'limit must be between 1 and {max_page_size}')
+
+    columns = columns if columns else table.columns.keys()
+    unknown = [column for column in columns if column not in table.columns]
+    if unknown:
+        raise PageRequestError(f'Unknown {table.name} columns {unknown}')
+
+    sort_column, id_column = table.columns[sort], table.columns['id']
+    statement = select(*(table.columns[column] for column in columns), stored_value(sort_column), id_column)
+
+    if after:
+        sort_value, row_id = decode_cursor(after)
+        if sort == 'id':
+            statement = statement.where(id_column < row_id if descending else id_column > row_id)
+        else:
+            key = tuple_(stored_value(sort_column), id_column)
+            statement = statement.where(key < (sort_value, row_id) if descending else key > (sort_value, row_id))
+
+    if descending:
+        statement = statement.order_by(sort_column.desc(), id_column.desc())
+    else:
+        statement = statement.order_by(sort_column, id_column)
+
+    # One extra row tells us if there's another page without counting the table
+    rows = session.execute(statement.limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][-2], rows[-1][-1])
+
+    return {
+        'columns': columns,
+        'rows': [list(row[:len(columns)]) for row in rows],
+        'sort': sort,
+        'order': 'desc' if descending else 'asc',
+        'next': next_cursor,
+    }
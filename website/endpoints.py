@@ -1,14 +1,16 @@
-from flask import Blueprint, render_template, flash, request, redirect, url_for, Response
+from flask import Blueprint, render_template, flash, request, redirect, url_for, Response, stream_with_context
 import json
 import math
 from datetime import timedelta
-from geopy.geocoders import Nominatim
 from models import User, GPSData, Vehicle, TomorrowIO, Heartbeat, Pitstop, Follow, Role
 from werkzeug.security import generate_password_hash, check_password_hash
 from website.database import db
 from website.notifications import send_gas_email
+from website.ingest import read_upload, parse_rows, bulk_insert, origin_mappings
+from website.tracks import TrackRequestError, get_track, mark_stale
+from geocoding import get_location_namer
+from export import ExportRequestError, encode_export, export_filename, export_formats, export_statement
 from datetime import datetime, timezone
-from geopy.exc import GeocoderTimedOut
 from flask_login import login_user, logout_user, login_required, logout_user, current_user
 from flask import abort
 from sqlalchemy import desc, and_
@@ -107,7 +109,7 @@ def receive_heartbeat():
     if request.method == 'GET':
         return ('', 204)
     # Get the data from the heartbeat
-    data = request.get_json()
+    data = read_upload(request)
 
     # Attempt to find a user with email provided, if none found issue malformed 400
     user = db.session.query(User).filter_by(email=data['email']).first()
@@ -123,87 +125,61 @@ def receive_heartbeat():
     vehicle.last_heartbeat = datetime.now(timezone.utc)
     vehicle.next_expected_heartbeat = datetime.fromisoformat(data['next_heartbeat'])
 
-    # Process the gps points first, since other points may refer to these
-    gps_mappings = {}
+    # Tables the van didn't include in this upload are treated as empty
+    empty = {'headers': [], 'data': []}
+    uploaded = data['database']
     response = {'received': {'gps': [], 'tio': [], 'heartbeat': []}}
-    for gps_data in data['database']['gps']['data']:
-        # Create a dictionary so that we can mutate it for the new database
-        gps_dict = dict(zip(data['database']['gps']['headers'], gps_data))
-
-        # Remove the old key but save it, so we can track changes
-        old_id = gps_dict.pop('id')
-
-        # Assign a user id, parse the datetime, and check for any None values
-        gps_dict['owner_id'] = user.id
-        gps_dict['utc_time'] = datetime.strptime(gps_dict['utc_time'], '%Y-%m-%d %H:%M:%S')
-        for key in gps_dict.keys():
-            if gps_dict[key] == 'None':
-                gps_dict[key] = None
-
-        # Create the database object and insert/update the db
-        gps = GPSData(**gps_dict)
-        db.session.add(gps)
-        db.session.flush()
-
-        # Map the new id to the old id and update the received response
-        gps_mappings[old_id] = gps.id
-        response['received']['gps'].append(old_id)
-    # Load tio updates
-    for tio_data in data['database']['tio']['data']:
-        # Create dict to make mutating easier
-        tio_dict = dict(zip(data['database']['tio']['headers'], tio_data))
-
-        # Remove the id and add it to the received response
-        response['received']['tio'].append(tio_dict.pop('id'))
-
-        # Update the owner id and the new gps id as well as parsing the time
+
+    # Process the gps points first, since other points may refer to these
+    # The van's local id is kept as origin_id, which makes re-uploads a no-op
+    gps_rows = parse_rows(uploaded.get('gps', empty), datetime_fields=('utc_time',))
+    for gps_dict in gps_rows:
+        gps_dict['origin_id'] = int(gps_dict.pop('id'))
+        gps_dict['vehicle_id'] = vehicle.id
+        response['received']['gps'].append(gps_dict['origin_id'])
+    bulk_insert(GPSData, gps_rows)
+    # The days these points fall on get their simplified track rebuilt the next time it's viewed
+    mark_stale(vehicle.id, {gps_dict['utc_time'].date() for gps_dict in gps_rows if gps_dict.get('utc_time')})
+
+    # Load tio updates, pointing them at the website's ids for their gps points
+    tio_rows = parse_rows(uploaded.get('tio', empty), datetime_fields=('utc_time',))
+    gps_mappings = origin_mappings(GPSData, vehicle.id, [int(tio_dict['gps_id']) for tio_dict in tio_rows])
+    tio_inserts = []
+    for tio_dict in tio_rows:
+        # If the gps point hasn't arrived yet leave this unacknowledged, so the van resends it
+        if int(tio_dict['gps_id']) not in gps_mappings:
+            continue
+        tio_dict['origin_id'] = int(tio_dict.pop('id'))
         tio_dict['owner_id'] = user.id
-        tio_dict['gps_id'] = gps_mappings[tio_dict['gps_id']]
-        tio_dict['utc_time'] = datetime.strptime(tio_dict['utc_time'], '%Y-%m-%d %H:%M:%S')
-        for key in tio_dict.keys():
-            if tio_dict[key] == 'None':
-                tio_dict[key] = None
-            if tio_dict[key] == 'True':
-                tio_dict[key] = True
-            if tio_dict[key] == 'False':
-                tio_dict[key] = False
-
-        # Create object and add to db
-        tio = TomorrowIO(**tio_dict)
-        db.session.add(tio)
-
-    for heartbeat_data in data['database']['heartbeat']['data']:
-        heartbeat_dict = dict(zip(data['database']['heartbeat']['headers'], heartbeat_data))
-        response['received']['heartbeat'].append(heartbeat_dict.pop('id'))
+        tio_dict['vehicle_id'] = vehicle.id
+        tio_dict['gps_id'] = gps_mappings[int(tio_dict['gps_id'])]
+        response['received']['tio'].append(tio_dict['origin_id'])
+        tio_inserts.append(tio_dict)
+    bulk_insert(TomorrowIO, tio_inserts)
+
+    # And finally the van's connection history
+    heartbeat_rows = parse_rows(uploaded.get('heartbeat', empty), datetime_fields=('time_utc', 'next_time'))
+    for heartbeat_dict in heartbeat_rows:
+        heartbeat_dict['origin_id'] = int(heartbeat_dict.pop('id'))
         heartbeat_dict['vehicle_id'] = vehicle.id
-        heartbeat_dict['time_utc'] = datetime.fromisoformat(heartbeat_dict['time_utc'])
-        heartbeat_dict['next_time'] = datetime.fromisoformat(heartbeat_dict['next_time'])
-        
-        heartbeat_dict['server'] = True if heartbeat_dict['server'] == 'True' else False
-        heartbeat_dict['internet'] = True if heartbeat_dict['internet'] =='True' else False
-        heartbeat_dict['on_schedule'] = True if heartbeat_dict['on_schedule'] == 'True' else False
-        
-        heartbeat = Heartbeat(**heartbeat_dict)
-        db.session.add(heartbeat)
-        
+        response['received']['heartbeat'].append(heartbeat_dict['origin_id'])
+    bulk_insert(Heartbeat, heartbeat_rows)
 
     db.session.commit()
-    return response
 
+    # Look up the name of where the van is now before anyone opens its page,
+    # only the newest point since Nominatim allows one lookup a second
+    if gps_rows:
+        newest = max(gps_rows, key=lambda gps_dict: gps_dict.get('utc_time') or datetime.min)
+        get_location_namer().prefetch([(float(newest['latitude']), float(newest['longitude']))])
 
-def get_location_string(latitude, longitude):
-    # Create the geolocator object (See geo.py)
-    geolocator = Nominatim(user_agent=__name__)
+    return response
 
-    # Default name will return just latitude and longitude
-    name = f'{latitude}, {longitude}'
-    try:
-        # Attempt to get a nicer name from the geolocator
-        name = geolocator.reverse((latitude, longitude))
-    except GeocoderTimedOut as e:
-        pass
 
-    return name
+def get_location_string(latitude, longitude):
+    # Cached name of the location (see geocoding.py), if we haven't looked it up yet
+    # this returns the latitude and longitude and fetches the name in the background
+    return get_location_namer().name(latitude, longitude, wait=False)
 
 def can_access(user: User, vehicle: Vehicle):
     if vehicle.owner == user:
@@ -282,10 +258,9 @@ def vehicle_page(vehicle_name: str):
             'now': datetime.utcnow()
         }
 
-    if permissions['view_location'] and vehicle.gps_data:
-
-        # Get the last gps data this user has logged
-        gps = vehicle.gps_data[-1]
+    # Get the last gps data this vehicle has logged (uses the (vehicle_id, utc_time) index)
+    gps = db.session.query(GPSData).filter(GPSData.vehicle_id == vehicle.id).order_by(desc(GPSData.utc_time)).first()
+    if permissions['view_location'] and gps:
 
         context['location'] = gps.as_dict()
 
@@ -293,9 +268,10 @@ def vehicle_page(vehicle_name: str):
         context['location']['location'] = get_location_string(gps.latitude, gps.longitude)
 
 
-    if permissions['view_weather'] and vehicle.owner.tio_data:
+    weather = (db.session.query(TomorrowIO).filter(TomorrowIO.owner_id == vehicle.owner_id)
+               .order_by(desc(TomorrowIO.utc_time)).first())
+    if permissions['view_weather'] and weather:
         # Add the weather data to the context
-        weather = vehicle.owner.tio_data[-1]
         context['weather'] = weather.as_dict()
 
         # Try to add the nice name of location
@@ -342,7 +318,8 @@ def vehicle_pitstop_page(vehicle_name: str):
 def vehicle_heartbeat_page(vehicle_name: str):
     vehicle = db.session.query(Vehicle).filter_by(name=vehicle_name).first()
 
-    heartbeats = db.session.query(Heartbeat).order_by(desc('time_utc')).all()
+    heartbeats = (db.session.query(Heartbeat).filter(Heartbeat.vehicle_id == vehicle.id)
+                  .order_by(desc('time_utc')).all())
     connection_health = []
         
     hours_back = 12
@@ -461,15 +438,63 @@ def vehicle_location_page(vehicle_name: str):
     if not vehicle:
        abort(404) 
     
-    path = [[gps.latitude, gps.longitude] for gps in vehicle.gps_data]
+    # Only the newest point is rendered, the track itself is fetched simplified for the map's view from track.json
+    last_gps = db.session.query(GPSData).filter_by(vehicle_id=vehicle.id).order_by(desc(GPSData.utc_time)).first()
     return render_template(
         'vehicle/location.html',
-        locations=path,
+        last_location=[last_gps.latitude, last_gps.longitude] if last_gps else None,
         user=current_user,
         vehicle=vehicle,
     )
 
 
+@endpoints.route('/vehicle/<vehicle_name>/track.json')
+@login_required
+def vehicle_track(vehicle_name: str):
+    vehicle = db.session.query(Vehicle).filter_by(name=vehicle_name).first()
+    if not vehicle:
+        abort(404)
+    if not can_access(current_user, vehicle):
+        abort(403)
+
+    # ?zoom=...&bbox=west,south,east,north&start=...&end=... pick the detail level, viewport and time range
+    try:
+        track = get_track(vehicle.id,
+                          zoom=request.args.get('zoom', 12, type=float),
+                          bbox=request.args.get('bbox'),
+                          start=request.args.get('start'),
+                          end=request.args.get('end'))
+    except TrackRequestError as e:
+        return Response(str(e), status=400)
+    return track
+
+
+@endpoints.route('/vehicle/<vehicle_name>/export/<table_name>.<fmt>')
+@login_required
+def vehicle_export(vehicle_name: str, table_name: str, fmt: str):
+    vehicle = db.session.query(Vehicle).filter_by(name=vehicle_name).first()
+    if not vehicle:
+        abort(404)
+    if not can_access(current_user, vehicle):
+        abort(403)
+
+    # ?start=...&end=... (iso format, utc) limit the export to a time range
+    start, end = request.args.get('start'), request.args.get('end')
+    try:
+        columns, statement = export_statement(table_name, fmt, start=start, end=end, vehicle_id=vehicle.id)
+    except ExportRequestError as e:
+        return Response(str(e), status=400)
+
+    # Rows come off a server side cursor a chunk at a time, so months of data never sit in memory at once
+    def chunks():
+        yield from db.session.execute(statement).partitions()
+
+    return Response(
+        stream_with_context(encode_export(fmt, columns, chunks())),
+        mimetype=export_formats[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{export_filename(table_name, fmt, start, end)}"'})
+
+
 @endpoints.route('/settings.html', methods=['GET', 'POST'])
 @login_required
 def settings_page():
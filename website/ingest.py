@@ -0,0 +1,100 @@
+import gzip
+import zlib
+from datetime import datetime
+
+import orjson
+from flask import Request, abort
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from models import Base
+from website.database import db
+
+# Old vans send every value as text, these convert them back
+text_values = {'None': None, 'True': True, 'False': False}
+
+# Vans that support it upload column-oriented, natively typed json under this type
+columnar_content_type = 'application/vnd.vls.columnar+json'
+
+# Content-Encodings we know how to unpack
+decoders = {
+    'identity': lambda body: body,
+    'gzip': gzip.decompress,
+    'deflate': zlib.decompress,
+}
+
+# Keeps the IN (...) lists of origin lookups under every backend's parameter limit
+lookup_batch_size = 500
+
+
+def read_upload(request: Request) -> dict:
+    """
+    Decodes a heartbeat upload using its Content-Encoding and Content-Type,
+    old vans send plain json and newer ones send gzipped columnar json.
+    """
+    encoding = request.headers.get('Content-Encoding', 'identity').strip().lower()
+    if encoding not in decoders:
+        abort(415)
+
+    if request.mimetype not in (columnar_content_type, 'application/json'):
+        abort(415)
+
+    return orjson.loads(decoders[encoding](request.get_data()))
+
+
+def parse_rows(table_data: dict, datetime_fields: tuple[str, ...] = ()) -> list[dict]:
+    """
+    Turns an uploaded table into a list of column dicts. Tables come either as
+    {'headers': [...], 'data': [rows]} with every value stringified (old vans)
+    or {'headers': [...], 'columns': [columns]} with native json values.
+    """
+    rows = []
+    headers = table_data['headers']
+    columnar = 'columns' in table_data
+    for values in zip(*table_data['columns']) if columnar else table_data['data']:
+        row = dict(zip(headers, values))
+        if not columnar:
+            for key, value in row.items():
+                if value in text_values:
+                    row[key] = text_values[value]
+        for field in datetime_fields:
+            if isinstance(row.get(field), str):
+                row[field] = datetime.fromisoformat(row[field])
+        rows.append(row)
+    return rows
+
+
+def insert_ignore(model: type[Base]):
+    """Returns an INSERT for model that silently skips rows hitting a unique constraint"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return sqlite.insert(model).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        return postgresql.insert(model).on_conflict_do_nothing()
+    if dialect in ('mysql', 'mariadb'):
+        return mysql.insert(model).prefix_with('IGNORE')
+    return insert(model)
+
+
+def bulk_insert(model: type[Base], rows: list[dict]):
+    """
+    Inserts all rows with a single executemany instead of an add+flush per row.
+    Rows whose (vehicle_id, origin_id) already exist are skipped, so a retried
+    upload doesn't create duplicates.
+    """
+    if rows:
+        db.session.execute(insert_ignore(model), rows)
+
+
+def origin_mappings(model: type[Base], vehicle_id: int, origin_ids: list[int]) -> dict[int, int]:
+    """Maps the vehicle's local ids to the ids they were stored under on the website"""
+    mappings = {}
+    origin_ids = list(set(origin_ids))
+    for i in range(0, len(origin_ids), lookup_batch_size):
+        batch = origin_ids[i:i + lookup_batch_size]
+        mappings.update(db.session.execute(
+            select(model.origin_id, model.id).where(
+                model.vehicle_id == vehicle_id,
+                model.origin_id.in_(batch))
+        ).tuples().all())
+    return mappings
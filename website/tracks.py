@@ -0,0 +1,343 @@
+import datetime
+import logging
+import math
+import threading
+import timeit
+from typing import Iterable, Optional
+
+from flask import Flask, current_app
+from sqlalchemy import select, tuple_, update
+
+from export import ExportRequestError, parse_time
+from models import GPSData, TrackBuild, TrackChunk
+from website.database import db
+from website.ingest import insert_ignore
+
+logger = logging.getLogger(__name__)
+
+# Map zoom level -> simplification tolerance in meters, about one screen pixel at that zoom on the equator.
+# A track is kept at each of these levels, each level's chunks are simplified from the level below it.
+track_levels = {zoom: 156543.03 / 2 ** zoom for zoom in (16, 12, 8, 4)}
+
+# Rows read from the database at a time when building a whole track
+build_chunk_rows = 5000
+
+# A build that hasn't made progress in this long is assumed dead and restarted
+build_timeout = datetime.timedelta(minutes=5)
+
+
+class TrackRequestError(ValueError):
+    pass
+
+
+def track_level(zoom: float) -> int:
+    """
+    The least detailed level at or above the map's zoom, so the simplification error stays under a pixel
+    without sending finer detail than that. Past the most detailed level, that's the best there is.
+    """
+    levels = [level for level in track_levels if level >= zoom]
+    return min(levels) if levels else max(track_levels)
+
+
+def simplify(points: list[tuple[float, float]], tolerance: float) -> list[tuple[float, float]]:
+    """
+    Douglas-Peucker simplification of a list of (latitude, longitude), dropping every point that is
+    within tolerance meters of the line between the points kept around it. Distances are measured
+    on a flat projection around the first point, which is plenty accurate over a day of driving.
+    """
+    if len(points) < 3:
+        return list(points)
+
+    scale = math.cos(math.radians(points[0][0]))
+    projected = [(longitude * 111320 * scale, latitude * 110540) for latitude, longitude in points]
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = projected[first], projected[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+
+        farthest, distance = None, tolerance
+        for i in range(first + 1, last):
+            x, y = projected[i]
+            if length == 0:
+                d = math.hypot(x - x1, y - y1)
+            else:
+                # Distance to the segment, not the infinite line, so doubling back isn't lost
+                t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length))
+                d = math.hypot(x - x1 - t * dx, y - y1 - t * dy)
+            if d > distance:
+                farthest, distance = i, d
+
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def encode_polyline(points: Iterable[tuple[float, float]], precision: int = 5) -> str:
+    """Google's encoded polyline format, about 4 bytes per point instead of ~40 as json"""
+    factor = 10 ** precision
+    encoded = []
+    previous_latitude = previous_longitude = 0
+    for latitude, longitude in points:
+        latitude, longitude = round(latitude * factor), round(longitude * factor)
+        for value in (latitude - previous_latitude, longitude - previous_longitude):
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                encoded.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            encoded.append(chr(value + 63))
+        previous_latitude, previous_longitude = latitude, longitude
+    return ''.join(encoded)
+
+
+def has_track(vehicle_id: int) -> bool:
+    return db.session.get(TrackBuild, vehicle_id) is not None
+
+
+def mark_stale(vehicle_id: int, days: Iterable[datetime.date]):
+    """
+    Marks the chunks of days that just got new points as needing a rebuild, call it with the upload.
+    A vehicle without a track yet is left alone, its whole track is built the first time it's asked for,
+    and a build still in progress reaches the new points on its own.
+    """
+    days = set(days)
+    if not days or not has_track(vehicle_id):
+        return
+    db.session.execute(insert_ignore(TrackChunk), [
+        {'vehicle_id': vehicle_id, 'level': level, 'day': day, 'stale': True}
+        for day in days for level in track_levels])
+    db.session.execute(update(TrackChunk).where(
+        TrackChunk.vehicle_id == vehicle_id,
+        TrackChunk.day.in_(days),
+    ).values(stale=True))
+
+
+def save_chunks(vehicle_id: int, day: datetime.date, points: list[tuple[float, float, datetime.datetime]],
+                before: Optional[tuple] = None):
+    """
+    Simplifies one day of points into every level and stores them. before is the last point of the
+    previous day, the line starts there so days join up, but it doesn't count toward the day's bounds.
+    """
+    latitudes = [latitude for latitude, _, _ in points]
+    longitudes = [longitude for _, longitude, _ in points]
+    locations = [(latitude, longitude) for latitude, longitude, _ in ([before] if before and points else []) + points]
+    bounds = {
+        'stale': False,
+        'start_utc': points[0][2] if points else None,
+        'end_utc': points[-1][2] if points else None,
+        'min_latitude': min(latitudes, default=None),
+        'max_latitude': max(latitudes, default=None),
+        'min_longitude': min(longitudes, default=None),
+        'max_longitude': max(longitudes, default=None),
+        'source_points': len(points),
+    }
+
+    rows = []
+    for level, tolerance in track_levels.items():
+        # Coarser levels start from the finer level's result instead of every raw point
+        locations = simplify(locations, tolerance)
+        rows.append({'level': level, 'points': len(locations), 'polyline': encode_polyline(locations)})
+
+    db.session.execute(insert_ignore(TrackChunk), [
+        {'vehicle_id': vehicle_id, 'level': row['level'], 'day': day} for row in rows])
+    for row in rows:
+        db.session.execute(update(TrackChunk).where(
+            TrackChunk.vehicle_id == vehicle_id,
+            TrackChunk.level == row['level'],
+            TrackChunk.day == day,
+        ).values(**bounds, points=row['points'], polyline=row['polyline']))
+
+
+def day_start(day: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time())
+
+
+def previous_point(vehicle_id: int, before: datetime.datetime) -> Optional[tuple]:
+    return db.session.execute(
+        select(GPSData.latitude, GPSData.longitude, GPSData.utc_time)
+        .where(GPSData.vehicle_id == vehicle_id, GPSData.utc_time < before)
+        .order_by(GPSData.utc_time.desc())
+        .limit(1)
+    ).tuples().first()
+
+
+def build_day(vehicle_id: int, day: datetime.date):
+    """Rebuilds one day of a vehicle's track from its points"""
+    start = day_start(day)
+    points = db.session.execute(
+        select(GPSData.latitude, GPSData.longitude, GPSData.utc_time)
+        .where(GPSData.vehicle_id == vehicle_id,
+               GPSData.utc_time >= start,
+               GPSData.utc_time < start + datetime.timedelta(days=1))
+        .order_by(GPSData.utc_time)
+    ).tuples().all()
+
+    save_chunks(vehicle_id, day, points, previous_point(vehicle_id, start))
+
+
+def build_track(vehicle_id: int):
+    """
+    Builds every day of a vehicle's track in one pass over its points in time order, picking up where
+    an earlier build stopped. Points are read build_chunk_rows at a time (keyset on time, id) so no cursor
+    is left open while the chunks are written, and each page is committed so the map can show the days
+    that are done while the rest builds.
+    """
+    start = timeit.default_timer()
+    build = db.session.get(TrackBuild, vehicle_id)
+    statement = (
+        select(GPSData.latitude, GPSData.longitude, GPSData.utc_time, GPSData.id)
+        .where(GPSData.vehicle_id == vehicle_id, GPSData.utc_time.is_not(None))
+        .order_by(GPSData.utc_time, GPSData.id)
+        .limit(build_chunk_rows)
+    )
+    if build.built_until:
+        statement = statement.where(GPSData.utc_time >= build.built_until)
+    before = previous_point(vehicle_id, build.built_until) if build.built_until else None
+
+    day, points, days = None, [], 0
+    page = db.session.execute(statement).tuples().all()
+    while page:
+        for latitude, longitude, utc_time, _ in page:
+            if utc_time.date() != day:
+                if points:
+                    save_chunks(vehicle_id, day, points, before)
+                    days += 1
+                    before = points[-1]
+                day, points = utc_time.date(), []
+            points.append((latitude, longitude, utc_time))
+
+        # Everything before the day still being read is saved
+        db.session.execute(update(TrackBuild).where(TrackBuild.vehicle_id == vehicle_id).values(
+            built_until=day_start(day), updated_utc=datetime.datetime.utcnow()))
+        db.session.commit()
+
+        last = page[-1]
+        page = db.session.execute(statement.where(
+            tuple_(GPSData.utc_time, GPSData.id) > (last[2], last[3]))).tuples().all()
+
+    if points:
+        save_chunks(vehicle_id, day, points, before)
+        days += 1
+    db.session.execute(update(TrackBuild).where(TrackBuild.vehicle_id == vehicle_id).values(
+        updated_utc=datetime.datetime.utcnow(), finished_utc=datetime.datetime.utcnow()))
+    db.session.commit()
+
+    logger.info(f'Built {days} days of track for vehicle {vehicle_id} in {timeit.default_timer() - start}')
+
+
+def claim_build(vehicle_id: int) -> bool:
+    """
+    Claims the job of building a vehicle's track, True if this request got it. Only one build runs at a time
+    (across web workers too), unless it stops making progress for build_timeout and someone takes it over.
+    """
+    now = datetime.datetime.utcnow()
+    claimed = db.session.execute(insert_ignore(TrackBuild).values(vehicle_id=vehicle_id, updated_utc=now)).rowcount
+    if not claimed:
+        claimed = db.session.execute(update(TrackBuild).where(
+            TrackBuild.vehicle_id == vehicle_id,
+            TrackBuild.finished_utc.is_(None),
+            TrackBuild.updated_utc < now - build_timeout,
+        ).values(updated_utc=now)).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+def run_build(app: Flask, vehicle_id: int):
+    with app.app_context():
+        try:
+            build_track(vehicle_id)
+        except Exception:
+            logger.exception(f'Failed to build the track of vehicle {vehicle_id}')
+            db.session.rollback()
+
+
+def refresh_track(vehicle_id: int, start_day: Optional[datetime.date] = None,
+                  end_day: Optional[datetime.date] = None) -> bool:
+    """
+    Starts building the track in the background if it's never been built (or its build died), otherwise
+    rebuilds only the stale days in the range. Returns True while the whole track is still being built.
+    """
+    build = db.session.get(TrackBuild, vehicle_id)
+    if build is None or build.finished_utc is None:
+        if claim_build(vehicle_id):
+            threading.Thread(target=run_build, args=(current_app._get_current_object(), vehicle_id),
+                             name=f'track-build-{vehicle_id}', daemon=True).start()
+        return True
+
+    statement = select(TrackChunk.day).distinct().where(TrackChunk.vehicle_id == vehicle_id, TrackChunk.stale)
+    if start_day:
+        statement = statement.where(TrackChunk.day >= start_day)
+    if end_day:
+        statement = statement.where(TrackChunk.day <= end_day)
+    stale_days = db.session.scalars(statement).all()
+    for day in stale_days:
+        build_day(vehicle_id, day)
+    if stale_days:
+        db.session.commit()
+    return False
+
+
+def parse_bbox(value: Optional[str]) -> Optional[tuple[float, float, float, float]]:
+    """west,south,east,north like Leaflet's toBBoxString()"""
+    if not value:
+        return None
+    try:
+        west, south, east, north = (float(bound) for bound in value.split(','))
+    except ValueError as e:
+        raise TrackRequestError(f'Invalid bbox "{value}", expected west,south,east,north') from e
+    return west, south, east, north
+
+
+def get_track(vehicle_id: int, zoom: float = 12,
+              bbox: Optional[str] = None,
+              start: Optional[str] = None,
+              end: Optional[str] = None) -> dict:
+    """
+    The vehicle's track at the level for zoom, as one encoded polyline per day that has points
+    in the bounding box and overlaps start <= time < end (whole days, the polylines aren't cut).
+    """
+    level = track_level(zoom)
+    bounds = parse_bbox(bbox)
+    try:
+        start_time, end_time = parse_time(start), parse_time(end)
+    except ExportRequestError as e:
+        raise TrackRequestError(str(e)) from e
+    building = refresh_track(vehicle_id,
+                             start_time.date() if start_time else None,
+                             end_time.date() if end_time else None)
+
+    statement = select(TrackChunk).where(
+        TrackChunk.vehicle_id == vehicle_id,
+        TrackChunk.level == level,
+        TrackChunk.points > 0,
+    ).order_by(TrackChunk.day)
+    if bounds:
+        west, south, east, north = bounds
+        statement = statement.where(TrackChunk.max_latitude >= south, TrackChunk.min_latitude <= north)
+        # A view wrapped past the antimeridian would need two ranges, just skip the longitude check there
+        if -180 <= west <= east <= 180:
+            statement = statement.where(TrackChunk.max_longitude >= west, TrackChunk.min_longitude <= east)
+    if start_time:
+        statement = statement.where(TrackChunk.end_utc >= start_time)
+    if end_time:
+        statement = statement.where(TrackChunk.start_utc < end_time)
+
+    return {
+        'level': level,
+        # While the track is first being built only the days done so far come back, ask again later for the rest
+        'building': building,
+        'chunks': [{
+            'day': chunk.day.isoformat(),
+            'start_utc': chunk.start_utc.isoformat(),
+            'end_utc': chunk.end_utc.isoformat(),
+            'points': chunk.points,
+            'polyline': chunk.polyline,
+        } for chunk in db.session.scalars(statement)],
+    }